@@ -0,0 +1,111 @@
+"""Measures one conversation turn of RollingChatMemory against the previous memory handling on long chat histories.
+
+The previous handling called get_last_messages (the removed llamaindex_helper monkey patch) and rebuilt a
+ChatMemoryBuffer with the result at the start of every turn, the buffer counts the tokens of the whole history on
+every get. Every turn puts a user message, an assistant tool call, the tool result and the answer.
+
+Run from the project root: python -m benchmarks.chat_memory
+"""
+import time
+
+import tiktoken
+from llama_index.core.llms import ChatMessage, MessageRole
+from llama_index.core.memory import ChatMemoryBuffer
+
+from helpers.chat_memory import RollingChatMemory
+
+SIZES = [1_000, 10_000]
+TOKEN_LIMIT = 96_000 # ChatMemoryBuffer default for a 128k context window
+tokenizer = tiktoken.encoding_for_model("gpt-4o-mini").encode
+
+
+def turn_messages(i: int) -> list[ChatMessage]:
+    return [
+        ChatMessage(role=MessageRole.USER, content=f"What is the weather in city number {i}?"),
+        ChatMessage(role=MessageRole.ASSISTANT, content="",
+                    additional_kwargs={"tool_calls": [{"id": f"call_{i}", "name": "get_weather"}]}),
+        ChatMessage(role=MessageRole.TOOL, content=f"Sunny, {i % 40} degrees.",
+                    additional_kwargs={"tool_call_id": f"call_{i}", "name": "get_weather"}),
+        ChatMessage(role=MessageRole.ASSISTANT, content=f"It is sunny and {i % 40} degrees in city number {i}."),
+    ]
+
+
+def history(size: int) -> list[ChatMessage]:
+    messages = [ChatMessage(role=MessageRole.SYSTEM, content="You are a helpful voice assistant.")]
+    i = 0
+    while len(messages) < size:
+        messages.extend(turn_messages(i))
+        i += 1
+    return messages
+
+
+def get_last_messages(chat_history: list[ChatMessage], n: int) -> list[ChatMessage]:
+    """The removed monkey patch, kept here as the baseline."""
+    if n >= len(chat_history):
+        return chat_history
+    if n >= len([chat_message for chat_message in chat_history if chat_message.role == MessageRole.USER]):
+        return chat_history
+    if n == 0:
+        return [msg for msg in chat_history if msg.role == MessageRole.SYSTEM]
+    user_message_count = 0
+    cutoff_index = -1
+    for i in range(len(chat_history) - 1, -1, -1):
+        if chat_history[i].role == MessageRole.USER:
+            user_message_count += 1
+        if user_message_count >= n:
+            cutoff_index = i
+            break
+    if cutoff_index == -1:
+        return chat_history
+    system_messages = [msg for msg in chat_history if msg.role == MessageRole.SYSTEM]
+    return [msg for msg in system_messages if chat_history.index(msg) < cutoff_index] + chat_history[cutoff_index:]
+
+
+def previous_turn(memory: ChatMemoryBuffer, n: int, i: int) -> tuple[ChatMemoryBuffer, list[ChatMessage]]:
+    memory = ChatMemoryBuffer.from_defaults(chat_history=get_last_messages(memory.get_all(), n),
+                                            token_limit=TOKEN_LIMIT, tokenizer_fn=tokenizer)
+    user, call, result, answer = turn_messages(i)
+    memory.put(user)
+    memory.get()
+    for message in (call, result):
+        memory.put(message)
+    memory.get()
+    memory.put(answer)
+    return memory, memory.get_all()
+
+
+def rolling_turn(memory: RollingChatMemory, n: int, i: int) -> list[ChatMessage]:
+    memory.trim(n)
+    user, call, result, answer = turn_messages(i)
+    memory.put(user)
+    memory.get()
+    for message in (call, result):
+        memory.put(message)
+    memory.get()
+    memory.put(answer)
+    return memory.get()
+
+
+def measure(function, repeat: int = 5) -> float:
+    start = time.perf_counter()
+    for _ in range(repeat):
+        function()
+    return (time.perf_counter() - start) / repeat * 1000
+
+
+def main():
+    print(f"{'messages':>10} {'keep user turns':>16} {'previous':>12} {'rolling':>12} {'same history':>13}")
+    for size in SIZES:
+        messages = history(size)
+        for n in (3, size):
+            previous = ChatMemoryBuffer.from_defaults(chat_history=list(messages), token_limit=TOKEN_LIMIT, tokenizer_fn=tokenizer)
+            rolling = RollingChatMemory(messages, token_limit=TOKEN_LIMIT, tokenizer=tokenizer)
+            same = previous_turn(previous, n, size)[1] == rolling_turn(rolling, n, size)
+            previous_ms = measure(lambda: previous_turn(ChatMemoryBuffer.from_defaults(
+                chat_history=list(messages), token_limit=TOKEN_LIMIT, tokenizer_fn=tokenizer), n, size))
+            rolling_ms = measure(lambda: rolling_turn(rolling, n, size))
+            print(f"{size:>10,} {n:>16,} {previous_ms:>10.2f}ms {rolling_ms:>10.3f}ms {str(same):>13}")
+
+
+if __name__ == "__main__":
+    main()
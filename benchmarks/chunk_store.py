@@ -0,0 +1,99 @@
+"""Embeds the chunks of the same pages again, as a follow up question about a page already read does, with and
+without the chunk embedding store.
+
+The chunks are paragraphs of generated articles and the embedding model is a fake that costs CALL_OVERHEAD per call
+and TEXT_COST per text, like a local model on the cpu:
+    - first read: every chunk is embedded and stored.
+    - follow up: the same pages, only the store lookup is paid.
+    - restart: a new store on the same directory answers from the memory mapped file.
+    - overlap: half of the pages were read before.
+    - eviction: max_chunks below the chunks read, the least recently used rows are reused.
+
+Run from the project root: python -m benchmarks.chunk_store
+"""
+import random
+import tempfile
+import time
+
+import numpy as np
+
+from helpers.chunk_store import ChunkEmbeddingStore
+from helpers.tool_retriever import normalize
+
+CALL_OVERHEAD = 0.05
+TEXT_COST = 0.002
+DIMENSIONS = 384
+PAGES = 8
+PARAGRAPHS = 60
+WORDS = "the voice assistant answers questions about weather news research code and email quickly".split()
+
+
+class FakeEmbedding:
+    model_name = "fake-minilm"
+
+    def __init__(self):
+        self.calls = 0
+        self.texts = 0
+
+    def get_text_embedding_batch(self, texts: list[str]) -> list[list[float]]:
+        self.calls += 1
+        self.texts += len(texts)
+        time.sleep(CALL_OVERHEAD + TEXT_COST * len(texts))
+        return [np.random.default_rng(abs(hash(text))).standard_normal(DIMENSIONS).tolist() for text in texts]
+
+
+def page(seed: int) -> list[str]:
+    random.seed(seed)
+    return [f"Page {seed}, paragraph {i}: {' '.join(random.choices(WORDS, k=random.randint(40, 120)))}."
+            for i in range(PARAGRAPHS)]
+
+
+def measure(name: str, run, embed_model: FakeEmbedding, store: ChunkEmbeddingStore | None):
+    embed_model.calls = embed_model.texts = 0
+    if store:
+        store.hits = store.misses = 0
+    start = time.perf_counter()
+    vectors = run()
+    elapsed = time.perf_counter() - start
+    hit_rate = f"{store.stats()['hit_rate']:.0%}" if store else "-"
+    on_disk = f"{store.stats()['bytes_on_disk'] / 1024 / 1024:.1f}MB" if store else "-"
+    print(f"{name:<30} {elapsed * 1000:>9.1f}ms {embed_model.calls:>6} {embed_model.texts:>6} {hit_rate:>9} "
+          f"{on_disk:>9}")
+    return vectors
+
+
+def main():
+    pages = [page(i) for i in range(PAGES)]
+    texts = [text for chunks in pages for text in chunks]
+    half = [text for chunks in pages[PAGES // 2:] + [page(i) for i in range(PAGES, PAGES + PAGES // 2)]
+            for text in chunks]
+    embed_model = FakeEmbedding()
+    print(f"{len(texts)} chunks of {DIMENSIONS} dimensions")
+    print(f"{'scenario':<30} {'time':>11} {'calls':>6} {'texts':>6} {'hit rate':>9} {'on disk':>9}")
+    direct = lambda batch: normalize(np.asarray(embed_model.get_text_embedding_batch(batch), dtype=np.float32))
+    expected = measure("first read, no store", lambda: direct(texts), embed_model, None)
+    measure("follow up, no store", lambda: direct(texts), embed_model, None)
+
+    with tempfile.TemporaryDirectory() as directory:
+        store = ChunkEmbeddingStore(directory)
+        measure("first read, store", lambda: store.embeddings(texts, embed_model), embed_model, store)
+        stored = measure("follow up, store", lambda: store.embeddings(texts, embed_model), embed_model, store)
+        assert np.allclose(stored, expected)
+        store.close()
+        store = ChunkEmbeddingStore(directory)
+        measure("restart, store", lambda: store.embeddings(texts, embed_model), embed_model, store)
+        measure("half of the pages read", lambda: store.embeddings(half, embed_model), embed_model, store)
+        store.close()
+
+    with tempfile.TemporaryDirectory() as directory:
+        store = ChunkEmbeddingStore(directory, max_chunks=len(texts) // 2)
+        measure(f"eviction, max {len(texts) // 2} chunks",
+                lambda: [store.embeddings(chunks, embed_model) for chunks in pages], embed_model, store)
+        recent = texts[len(texts) // 2:]
+        measure("  most recent half again", lambda: store.embeddings(recent, embed_model), embed_model, store)
+        print(f"\nstats: {store.stats()}")
+        store.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,69 @@
+"""Measures how long resuming a conversation and searching the past conversations take as the log grows.
+
+The log is filled with sessions of 4 message turns (user, tool call, tool result, answer) up to every size, then a
+new ConversationStore is opened on it and the last MAX_MESSAGE_HISTORY user turns are loaded, like at startup.
+
+Run from the project root: python -m benchmarks.conversation_store
+"""
+import os
+import tempfile
+import time
+
+from llama_index.core.llms import ChatMessage, MessageRole
+
+from helpers.conversation_store import ConversationStore
+
+SIZES = [10_000, 100_000, 1_000_000]
+TURNS_PER_SESSION = 50
+N_MESSAGE_HISTORY = 3 * 3 # MAX_MESSAGE_HISTORY with thinking mode
+
+
+def turn_messages(i: int) -> list[ChatMessage]:
+    return [
+        ChatMessage(role=MessageRole.USER, content=f"What is the weather in city number {i}?"),
+        ChatMessage(role=MessageRole.ASSISTANT, content="",
+                    additional_kwargs={"tool_calls": [{"id": f"call_{i}", "name": "get_weather"}]}),
+        ChatMessage(role=MessageRole.TOOL, content=f"Sunny, {i % 40} degrees.",
+                    additional_kwargs={"tool_call_id": f"call_{i}", "name": "get_weather"}),
+        ChatMessage(role=MessageRole.ASSISTANT, content=f"It is sunny and {i % 40} degrees in city number {i}."),
+    ]
+
+
+def fill(store: ConversationStore, start: int, end: int):
+    for i in range(start // 4, end // 4):
+        if i % TURNS_PER_SESSION == 0:
+            store.new_session()
+        for message in turn_messages(i):
+            store.append(message)
+    store.flush()
+
+
+def main():
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "conversations.db")
+        store = ConversationStore(path, batch_size=10_000)
+        filled = 0
+        print(f"{'messages':>10} {'append/msg':>11} {'open':>9} {'resume':>9} {'search':>9} {'loaded':>7}")
+        for size in SIZES:
+            start = time.perf_counter()
+            fill(store, filled, size)
+            append_us = (time.perf_counter() - start) / (size - filled) * 1e6
+            filled = size
+
+            start = time.perf_counter()
+            resumed = ConversationStore(path)
+            open_ms = (time.perf_counter() - start) * 1000
+            start = time.perf_counter()
+            messages = resumed.load_tail(N_MESSAGE_HISTORY)
+            resume_ms = (time.perf_counter() - start) * 1000
+            start = time.perf_counter()
+            resumed.search("weather city number 1234")
+            search_ms = (time.perf_counter() - start) * 1000
+            resumed.close()
+            print(f"{size:>10,} {append_us:>9.1f}us {open_ms:>7.2f}ms {resume_ms:>7.2f}ms {search_ms:>7.2f}ms "
+                  f"{len(messages):>7}")
+        store.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,67 @@
+"""Compares the time until the first audio is sent to the TTS engine with and without `stream_response`.
+
+A fake llm streams a canned answer token by token, the TTS engine is replaced by a sink that records when it is fed.
+
+Run from the project root: python -m benchmarks.first_audio_latency
+"""
+import asyncio
+import time
+
+from helpers.utils import clean_text, extract_final_answer, stream_sentences
+
+CANNED_RESPONSE = (
+    "<think>The user wants the weather, I called get_weather and it returned 21 degrees and clear skies.</think>\n"
+    "It is currently twenty one degrees Celsius with clear skies in Altona North. "
+    "The wind is light, coming from the south west at about ten kilometers per hour. "
+    "Later today it should stay dry, so it is a good afternoon for a walk. "
+    "You can see the full forecast at https://www.meteosource.com/forecast."
+)
+
+
+class FakeStreamingLLM:
+    """Streams the canned response word by word after a fixed time to first token."""
+    def __init__(self, first_token_delay: float = 0.3, token_delay: float = 0.02):
+        self.first_token_delay = first_token_delay
+        self.token_delay = token_delay
+
+    async def stream(self):
+        await asyncio.sleep(self.first_token_delay)
+        for token in CANNED_RESPONSE.split(" "):
+            await asyncio.sleep(self.token_delay)
+            yield token + " "
+
+
+class FakeAudioSink:
+    """Stands in for TextToAudioStream, records when the first text is fed."""
+    def __init__(self, start: float):
+        self.start = start
+        self.first_feed = None
+
+    def feed(self, text: str):
+        if self.first_feed is None:
+            self.first_feed = time.perf_counter() - self.start
+
+
+async def blocking_mode(llm: FakeStreamingLLM) -> float:
+    sink = FakeAudioSink(time.perf_counter())
+    response = "".join([token async for token in llm.stream()])
+    sink.feed(clean_text(extract_final_answer(response)))
+    return sink.first_feed
+
+
+async def streaming_mode(llm: FakeStreamingLLM) -> float:
+    sink = FakeAudioSink(time.perf_counter())
+    async for sentence in stream_sentences(llm.stream()):
+        sink.feed(sentence)
+    return sink.first_feed
+
+
+async def main(runs: int = 5):
+    llm = FakeStreamingLLM()
+    for name, mode in (("blocking", blocking_mode), ("streaming", streaming_mode)):
+        timings = [await mode(llm) for _ in range(runs)]
+        print(f"{name:>10}: first audio after {sum(timings) / runs * 1000:7.1f} ms (mean of {runs} runs)")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,254 @@
+"""Requests, bytes and time of the email tools against a local fake of the Gmail api, per message and batched.
+
+The fake keeps MESSAGES messages with a body and an attachment, answers every request after LATENCY seconds and
+implements messages.list/get/modify/batchModify, labels and the batch endpoint. It can answer a share of the items of
+a batch with 429 like gmail does when a batch is too large.
+    - per message: the requests simplegmail sends for the tools, messages.list and then a full messages.get per
+      message; a label change is a full get (get_message_by_id) and a modify per message.
+    - batched: GmailClient, messages.list and metadata gets in batch requests, one batchModify per label change.
+The request counts are asserted, so this doubles as a check of the client. The access token is checked first with the
+credential classes simplegmail can hold (oauth2client and google-auth), expired so they are refreshed at the fake's
+token endpoint, and the fake rejects requests without the current token.
+
+Run from the project root: python -m benchmarks.gmail_batch
+"""
+import base64
+import datetime
+import json
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+import requests
+from google.oauth2.credentials import Credentials
+from oauth2client.client import OAuth2Credentials
+
+from helpers.gmail_client import GmailClient, credentials_token
+from helpers.http_client import HttpClient
+
+MESSAGES = 200
+LATENCY = 0.03
+LISTED = 50
+MARKED = 20
+BATCH_SIZE = 20
+HEADERS = ("From", "To", "Subject", "Date")
+
+
+def make_message(i: int) -> dict:
+    headers = [{"name": "From", "value": f"sender{i}@example.com"}, {"name": "To", "value": "me@example.com"},
+               {"name": "Subject", "value": f"Report {i}"}, {"name": "Date", "value": "Sun, 18 Oct 2026 09:00:00 +0000"},
+               {"name": "Received", "value": "from mail.example.com by mx.google.com " * 4}]
+    body = base64.urlsafe_b64encode(f"Hello, this is message {i}. ".encode() * 400).decode()
+    return {"id": f"m{i:04}", "threadId": f"t{i:04}", "labelIds": ["INBOX", "UNREAD"] if i % 2 else ["INBOX"],
+            "snippet": f"Hello, this is message {i}.", "sizeEstimate": 20_000,
+            "payload": {"mimeType": "multipart/mixed", "headers": headers, "parts": [
+                {"mimeType": "text/plain", "body": {"size": len(body), "data": body}},
+                {"mimeType": "application/pdf", "filename": f"report{i}.pdf",
+                 "body": {"size": 120_000, "attachmentId": f"a{i:04}" * 20}}]}}
+
+
+class FakeGmail:
+    def __init__(self):
+        self.messages = {message["id"]: message for message in map(make_message, range(MESSAGES))}
+        self.labels = [{"id": label, "name": label, "type": "system"}
+                       for label in ("INBOX", "UNREAD", "STARRED", "IMPORTANT", "SENT", "SPAM", "TRASH")]
+        self.labels.append({"id": "Label_1", "name": "Receipts", "type": "user"})
+        self.requests = 0
+        self.bytes_sent = 0
+        self.token = "token" # the access token the api accepts
+        self.token_requests = 0
+        self.throttle_every = 0 # every nth item of a batch is answered with 429 once
+        self._throttled: set[str] = set()
+        self._lock = threading.Lock()
+
+    def handle(self, method: str, path: str, query: dict, body: bytes) -> tuple[int, dict]:
+        """(status, json) of one api request, path is below /gmail/v1/users/me/."""
+        if method == "GET" and path == "messages":
+            labels = set(query.get("labelIds", []))
+            ids = [i for i, message in self.messages.items() if labels <= set(message["labelIds"])]
+            return 200, {"messages": [{"id": i, "threadId": self.messages[i]["threadId"]}
+                                      for i in ids[:int(query.get("maxResults", ["100"])[0])]]}
+        if method == "GET" and path.startswith("messages/"):
+            message = self.messages.get(path.split("/")[1])
+            if message is None:
+                return 404, {"error": {"code": 404, "message": "Not Found"}}
+            if query.get("format", ["full"])[0] == "metadata":
+                wanted = {header.lower() for header in query.get("metadataHeaders", [])}
+                headers = [h for h in message["payload"]["headers"] if h["name"].lower() in wanted]
+                return 200, {**{k: v for k, v in message.items() if k != "payload"},
+                             "payload": {"mimeType": message["payload"]["mimeType"], "headers": headers}}
+            return 200, message
+        if method == "POST" and path == "messages/batchModify":
+            request = json.loads(body)
+            for i in request["ids"]:
+                self._modify(i, request)
+            return 204, {}
+        if method == "POST" and path.endswith("/modify"):
+            return 200, self._modify(path.split("/")[1], json.loads(body))
+        if method == "GET" and path == "labels":
+            return 200, {"labels": self.labels}
+        if method == "GET" and path.startswith("labels/"):
+            label = path.split("/")[1]
+            return 200, {"id": label, "messagesTotal": sum(label in m["labelIds"] for m in self.messages.values())}
+        return 404, {"error": {"code": 404, "message": f"No route {method} {path}"}}
+
+    def _modify(self, message_id: str, request: dict) -> dict:
+        message = self.messages[message_id]
+        labels = [label for label in message["labelIds"] if label not in request.get("removeLabelIds", [])]
+        message["labelIds"] = labels + [label for label in request.get("addLabelIds", []) if label not in labels]
+        return {"id": message_id, "labelIds": message["labelIds"]}
+
+    def batch(self, content_type: str, body: bytes) -> tuple[str, bytes]:
+        boundary = re.search(r"boundary=([^;]+)", content_type).group(1)
+        parts = []
+        for i, part in enumerate(body.split(f"--{boundary}".encode())[1:-1]):
+            request_line = re.search(rb"\r\n\r\n(\w+) (\S+)", part)
+            method, url = request_line.group(1).decode(), urlsplit(request_line.group(2).decode())
+            path = url.path.split("/users/me/", 1)[1]
+            with self._lock:
+                throttled = self.throttle_every and i % self.throttle_every == 0 and path not in self._throttled
+                if throttled:
+                    self._throttled.add(path)
+            status, data = (429, {"error": {"code": 429, "message": "Too many concurrent requests for user"}}) \
+                if throttled else self.handle(method, path, parse_qs(url.query), b"")
+            parts.append(f"--batch_response\r\nContent-Type: application/http\r\nContent-ID: <response-item{i}>\r\n\r\n"
+                         f"HTTP/1.1 {status} OK\r\nContent-Type: application/json; charset=UTF-8\r\n\r\n"
+                         f"{json.dumps(data)}\r\n")
+        return "multipart/mixed; boundary=batch_response", ("".join(parts) + "--batch_response--\r\n").encode()
+
+
+class FakeGmailHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    disable_nagle_algorithm = True
+    api: FakeGmail
+
+    def do_GET(self):
+        self.route("GET")
+
+    def do_POST(self):
+        self.route("POST")
+
+    def route(self, method: str):
+        time.sleep(LATENCY)
+        body = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        url = urlsplit(self.path)
+        if url.path == "/token": # the OAuth refresh of the credentials
+            self.api.token_requests += 1
+            self.send_json(200, {"access_token": self.api.token, "token_type": "Bearer", "expires_in": 3600})
+            return
+        if self.headers.get("Authorization") != f"Bearer {self.api.token}":
+            self.send_json(401, {"error": {"code": 401, "message": "Invalid Credentials"}})
+            return
+        with self.api._lock:
+            self.api.requests += 1
+        if url.path == "/batch/gmail/v1":
+            content_type, content = self.api.batch(self.headers["Content-Type"], body)
+            status = 200
+        else:
+            status, data = self.api.handle(method, url.path.split("/users/me/", 1)[1], parse_qs(url.query), body)
+            content_type, content = "application/json; charset=UTF-8", b"" if status == 204 else json.dumps(data).encode()
+        with self.api._lock:
+            self.api.bytes_sent += len(content)
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(content)))
+        self.end_headers()
+        self.wfile.write(content)
+
+    def send_json(self, status: int, data: dict):
+        content = json.dumps(data).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json; charset=UTF-8")
+        self.send_header("Content-Length", str(len(content)))
+        self.end_headers()
+        self.wfile.write(content)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def per_message_listing(base: str, session: requests.Session) -> list[str]:
+    listed = session.get(f"{base}/gmail/v1/users/me/messages",
+                         params={"labelIds": ["INBOX", "UNREAD"], "maxResults": LISTED}).json()["messages"]
+    return [session.get(f"{base}/gmail/v1/users/me/messages/{m['id']}", params={"format": "full"}).json()["id"]
+            for m in listed]
+
+
+def per_message_mark_as_read(base: str, session: requests.Session, ids: list[str]):
+    for message_id in ids:
+        session.get(f"{base}/gmail/v1/users/me/messages/{message_id}", params={"format": "full"})
+        session.post(f"{base}/gmail/v1/users/me/messages/{message_id}/modify", json={"removeLabelIds": ["UNREAD"]})
+
+
+def check_credentials(api: FakeGmail, base: str):
+    """credentials_token refreshes expired oauth2client and google-auth credentials and the client sends the token."""
+    api.token = "fresh"
+    expired = datetime.datetime.utcnow() - datetime.timedelta(hours=1)
+    oauth2client_creds = OAuth2Credentials("stale", "client", "secret", "refresh", expired, f"{base}/token", "jarvis")
+    google_auth_creds = Credentials("stale", refresh_token="refresh", token_uri=f"{base}/token", client_id="client",
+                                    client_secret="secret", expiry=expired)
+    for creds in (oauth2client_creds, google_auth_creds):
+        requested = api.token_requests
+        assert credentials_token(creds) == "fresh", type(creds)
+        assert credentials_token(creds) == "fresh" and api.token_requests == requested + 1, "refreshed only once"
+        client = GmailClient(HttpClient(), lambda: credentials_token(creds), base)
+        assert client.message_count("INBOX") == MESSAGES
+    api.token = "token"
+    print(f"credentials: oauth2client and google-auth tokens refreshed and accepted\n")
+
+
+def measure(api: FakeGmail, name: str, run, expected_requests: int):
+    api.requests = api.bytes_sent = 0
+    start = time.perf_counter()
+    run()
+    elapsed = time.perf_counter() - start
+    print(f"{name:<40} {api.requests:>9} {api.bytes_sent / 1024:>9,.0f}KB {elapsed * 1000:>9.0f}ms")
+    assert api.requests == expected_requests, f"{name}: {api.requests} requests, expected {expected_requests}"
+
+
+def main():
+    api = FakeGmailHandler.api = FakeGmail()
+    server = ThreadingHTTPServer(("127.0.0.1", 0), FakeGmailHandler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    base = f"http://127.0.0.1:{server.server_address[1]}"
+    client = GmailClient(HttpClient(), lambda: "token", base, batch_size=BATCH_SIZE, workers=4, metadata_headers=HEADERS)
+    session = requests.Session()
+    session.headers["Authorization"] = "Bearer token"
+    batches = -(-LISTED // BATCH_SIZE)
+    check_credentials(api, base)
+
+    print(f"{'scenario':<40} {'requests':>9} {'bytes':>11} {'time':>11}")
+    unread = client.list_ids(label_ids=["INBOX", "UNREAD"], max_results=LISTED)
+    measure(api, f"per message, list {LISTED} unread", lambda: per_message_listing(base, session), 1 + LISTED)
+    client.label_names() # fetched once per client
+    summaries = []
+    measure(api, f"batched, list {LISTED} unread",
+            lambda: summaries.extend(client.summaries(client.list_ids(label_ids=["INBOX", "UNREAD"],
+                                                                      max_results=LISTED))), 1 + batches)
+    assert [summary["id"] for summary in summaries] == unread
+    assert summaries[0]["subject"] and summaries[0]["sender"] and summaries[0]["has_attachments"]
+
+    measure(api, f"per message, mark {MARKED} as read",
+            lambda: per_message_mark_as_read(base, session, unread[:MARKED]), 2 * MARKED)
+    for message_id in unread[:MARKED]:
+        api.messages[message_id]["labelIds"].append("UNREAD")
+    measure(api, f"batched, mark {MARKED} as read",
+            lambda: client.modify(unread[:MARKED], remove=["UNREAD"]), 1)
+    assert all("UNREAD" not in api.messages[message_id]["labelIds"] for message_id in unread[:MARKED])
+    measure(api, "batched, count INBOX", lambda: client.message_count(client.label_id("INBOX")), 1)
+
+    api.throttle_every = 5 # 4 of every batch of 20 come back as 429 the first time
+    summaries.clear()
+    client.backoff = 0.05
+    measure(api, f"batched, list {LISTED}, 20% throttled",
+            lambda: summaries.extend(client.summaries(client.list_ids(max_results=LISTED))), 1 + 2 * batches)
+    assert len(summaries) == LISTED
+    print(f"\nclient requests: {client.requests}")
+    server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,138 @@
+"""Peak memory and time of turning a large page into chunks, parsed whole with BeautifulSoup and streamed.
+
+The pages are generated news article fixtures of 5 to 50 MB (inline scripts, navigation and footers around the
+paragraphs) served locally at BANDWIDTH bytes per second, fast enough that the times are mostly the cost of parsing
+and chunking. Every scenario runs in a new process, its peak is the largest rss sampled every few milliseconds minus
+the rss after the imports:
+    - soup, whole page: requests.get, BeautifulSoup(page.content).getText() and two_step_chunking, like
+      fetch_link_content did originally.
+    - soup, byte cap: only WebFetchConfig.MAX_BYTES are downloaded and parsed with BeautifulSoup.
+    - stream: page_paragraphs parses the paragraphs while they download and stops at WebFetchConfig.MAX_CHARACTERS.
+
+Needs scripts_data/general_data.json like the assistant (scripts.google_search is imported).
+Run from the project root: python -m benchmarks.html_stream
+"""
+import json
+import random
+import subprocess
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import psutil
+
+SIZES_MB = (5, 20, 50)
+BANDWIDTH = 100 * 1024 * 1024
+SCENARIOS = ("soup, whole page", "soup, byte cap", "stream")
+WORDS = "the voice assistant answers questions about weather news research code and email quickly".split()
+
+
+def fixture(size: int) -> bytes:
+    """An article of about size bytes, a third of it markup and scripts the text extraction has to skip."""
+    random.seed(size)
+    blocks = []
+    for i in range(200):
+        paragraphs = "".join(f"<p>{' '.join(random.choices(WORDS, k=random.randint(40, 120)))}.</p>\n"
+                             for _ in range(4))
+        blocks.append(f"<div class=\"story\"><nav><a href=\"/{i}\">Section {i}</a> <a href=\"/more\">More</a></nav>"
+                      f"<script>window.ads.push({json.dumps({'slot': i, 'words': WORDS})});</script>"
+                      f"<h2>Part {i}</h2>\n{paragraphs}<aside>Related stories</aside></div>\n".encode())
+    head = b"<html><head><title>Large article</title><style>body{margin:0}</style></head><body>\n"
+    body, length = [], len(head)
+    while length < size:
+        block = blocks[len(body) % len(blocks)]
+        body.append(block)
+        length += len(block)
+    return head + b"".join(body) + b"<footer>Copyright</footer></body></html>"
+
+
+class FixtureHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    disable_nagle_algorithm = True
+    fixtures: dict[str, bytes] = {}
+
+    def do_GET(self):
+        body = self.fixtures[self.path]
+        self.send_response(200)
+        self.send_header("Content-Type", "text/html; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        for start in range(0, len(body), 256 * 1024):
+            self.wfile.write(body[start:start + 256 * 1024])
+            time.sleep(256 * 1024 / BANDWIDTH)
+
+    def handle(self):
+        try:
+            super().handle()
+        except (BrokenPipeError, ConnectionResetError): # the client stopped reading
+            pass
+
+    def log_message(self, format, *args):
+        pass
+
+
+def run_scenario(scenario: str, url: str):
+    """Runs in the child process, prints the result as the last line."""
+    import requests
+    from bs4 import BeautifulSoup
+
+    from config import WebFetchConfig
+    from scripts.google_search import HTML_PARSER, page_paragraphs, two_step_chunking, web_reader
+
+    process = psutil.Process()
+    baseline = peak = process.memory_info().rss
+    running = True
+
+    def sample():
+        nonlocal peak
+        while running:
+            peak = max(peak, process.memory_info().rss)
+            time.sleep(0.002)
+
+    sampler = threading.Thread(target=sample, daemon=True)
+    sampler.start()
+    start = time.perf_counter()
+    if scenario == "soup, whole page":
+        page = requests.get(url)
+        nodes = two_step_chunking([BeautifulSoup(page.content, "html.parser").getText()])
+    elif scenario == "soup, byte cap":
+        with requests.get(url, stream=True) as page:
+            content = bytearray()
+            for chunk in page.iter_content(64 * 1024):
+                content += chunk
+                if len(content) >= WebFetchConfig.MAX_BYTES:
+                    break
+        nodes = two_step_chunking([BeautifulSoup(bytes(content[:WebFetchConfig.MAX_BYTES]), HTML_PARSER).getText()])
+    else:
+        nodes = two_step_chunking(page_paragraphs(web_reader, url))
+    elapsed = time.perf_counter() - start
+    running = False
+    sampler.join()
+    print(json.dumps({"seconds": elapsed, "peak": peak - baseline, "chunks": len(nodes),
+                      "characters": sum(len(node.text) for node in nodes)}))
+
+
+def main():
+    FixtureHandler.fixtures = {f"/{size}mb": fixture(size * 1024 * 1024) for size in SIZES_MB}
+    server = ThreadingHTTPServer(("127.0.0.1", 0), FixtureHandler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    base = f"http://127.0.0.1:{server.server_address[1]}"
+
+    print(f"{'page':>6} {'scenario':<18} {'time':>8} {'peak rss':>10} {'chunks':>7} {'text':>11}")
+    for size in SIZES_MB:
+        for scenario in SCENARIOS:
+            child = subprocess.run([sys.executable, "-m", "benchmarks.html_stream", scenario, f"{base}/{size}mb"],
+                                   capture_output=True, text=True, check=True)
+            result = json.loads(child.stdout.strip().splitlines()[-1])
+            print(f"{size:>4}MB {scenario:<18} {result['seconds']:>7.2f}s {result['peak'] / 1024 / 1024:>8.1f}MB "
+                  f"{result['chunks']:>7} {result['characters']:>11,}")
+    server.shutdown()
+
+
+if __name__ == "__main__":
+    if len(sys.argv) == 3:
+        run_scenario(*sys.argv[1:])
+    else:
+        main()
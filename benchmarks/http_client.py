@@ -0,0 +1,124 @@
+"""Compares bare requests calls with the shared HttpClient against a local stand-in for a weather api.
+
+The server speaks HTTP/1.1 with keep-alive and waits HANDSHAKE seconds on every new connection, the cost of the TCP
+and TLS handshakes to a remote api (about 2 round trips of 25 ms), plus RESPONSE seconds per request. Three
+scenarios:
+    - get_weather then get_weekly_forecast: two sequential requests of one turn.
+    - a day of tool calls: SEQUENTIAL requests one after the other.
+    - a burst of CONCURRENT requests, limited to HttpConfig.MAX_PER_HOST at a time by the client.
+
+Run from the project root: python -m benchmarks.http_client
+"""
+import asyncio
+import json
+import statistics
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import requests
+
+from config import HttpConfig
+from helpers.http_client import HttpClient
+
+HANDSHAKE = 0.05
+RESPONSE = 0.005
+SEQUENTIAL = 20
+CONCURRENT = 16
+
+
+class WeatherHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    disable_nagle_algorithm = True # headers and body are written separately, delayed acks would add 40 ms
+    connections = 0
+    lock = threading.Lock()
+
+    def setup(self):
+        with self.lock:
+            WeatherHandler.connections += 1
+        time.sleep(HANDSHAKE)
+        super().setup()
+
+    def do_GET(self):
+        time.sleep(RESPONSE)
+        body = json.dumps({"current": {"summary": "Sunny", "temperature": 21}}).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def new_client() -> HttpClient:
+    return HttpClient(retries=HttpConfig.RETRIES, backoff=HttpConfig.BACKOFF, max_per_host=HttpConfig.MAX_PER_HOST,
+                      pool_hosts=HttpConfig.POOL_HOSTS)
+
+
+def measure(name: str, run) -> None:
+    WeatherHandler.connections = 0
+    latencies = run()
+    print(f"{name:<34} {statistics.mean(latencies) * 1000:>8.1f}ms {max(latencies) * 1000:>8.1f}ms "
+          f"{WeatherHandler.connections:>12}")
+
+
+def timed(call) -> float:
+    start = time.perf_counter()
+    call().json()
+    return time.perf_counter() - start
+
+
+def main():
+    server = ThreadingHTTPServer(("127.0.0.1", 0), WeatherHandler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    url = f"http://127.0.0.1:{server.server_address[1]}/api/v1/free/point"
+    params = {"place_id": "london", "sections": "current"}
+
+    print(f"{'scenario':<34} {'mean':>10} {'max':>10} {'connections':>12}")
+    for scenario, count in (("weather + forecast", 2), ("sequential", SEQUENTIAL)):
+        measure(f"{scenario}: requests.get",
+                lambda: [timed(lambda: requests.get(url, params, timeout=10)) for _ in range(count)])
+        client = new_client()
+        measure(f"{scenario}: HttpClient.get",
+                lambda: [timed(lambda: client.get(url, params)) for _ in range(count)])
+        client.close()
+
+        async def run_async():
+            client = new_client()
+            client._async_client() # creating the httpx client loads the certificates, once per loop
+            latencies = []
+            for _ in range(count):
+                start = time.perf_counter()
+                (await client.aget(url, params=params)).json()
+                latencies.append(time.perf_counter() - start)
+            return latencies
+        measure(f"{scenario}: HttpClient.aget", lambda: asyncio.run(run_async()))
+
+    with ThreadPoolExecutor(CONCURRENT) as pool:
+        measure("concurrent: requests.get", lambda: list(pool.map(
+            lambda _: timed(lambda: requests.get(url, params, timeout=10)), range(CONCURRENT))))
+        client = new_client()
+        measure("concurrent: HttpClient.get", lambda: list(pool.map(
+            lambda _: timed(lambda: client.get(url, params)), range(CONCURRENT))))
+        client.close()
+
+    async def run_concurrent():
+        client = new_client()
+        client._async_client()
+
+        async def one():
+            start = time.perf_counter()
+            (await client.aget(url, params=params)).json()
+            return time.perf_counter() - start
+        return await asyncio.gather(*(one() for _ in range(CONCURRENT)))
+    measure("concurrent: HttpClient.aget", lambda: asyncio.run(run_concurrent()))
+    print(f"at most {HttpConfig.MAX_PER_HOST} concurrent requests per host with HttpClient")
+    server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
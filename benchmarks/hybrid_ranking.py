@@ -0,0 +1,123 @@
+"""Embedding cost and recall of ranking page chunks with dense embeddings only and with the BM25 prefilter.
+
+The corpus is CHUNKS generated chunks about TOPICS topics: most words of a chunk are common filler words, a share
+comes from the vocabulary of its topic and a few from a second topic. The embedding model is a fake where every word
+vector is the vector of its topic plus noise, so words of the same topic are synonyms to it but not to BM25. Queries
+are four words of the topic of a random chunk:
+    - keywords: the words appear in the chunk.
+    - paraphrase: none of the words appear in the chunk.
+recall@k is the share of the dense only top k that the hybrid ranking returns too, on topic@2 the share of the top 2
+about the topic of the query and found@10 how often the chunk the query was made from is in the top 10. The embedding
+time is estimated with CALL_OVERHEAD per call and TEXT_COST per text, the cpu time (BM25 index, scores and fusion)
+is measured.
+
+Run from the project root: python -m benchmarks.hybrid_ranking
+"""
+import random
+import time
+
+import numpy as np
+
+from helpers.hybrid_ranker import BM25Index, hybrid_rank
+from helpers.tool_retriever import normalize, top_k_indices
+
+CHUNKS = (2_000, 10_000)
+TOPICS = 50
+TOPIC_WORDS = 40
+FILLER_WORDS = 400
+DIMENSIONS = 256
+QUERIES = 30
+CALL_OVERHEAD = 0.05
+TEXT_COST = 0.002
+SETTINGS = [(0, 0.0), (32, 0.3), (64, 0.3), (256, 0.3), (64, 0.0), (64, 0.6)]
+
+
+class Corpus:
+    def __init__(self, size: int, seed: int = 0):
+        random.seed(seed)
+        rng = np.random.default_rng(seed)
+        topic_vectors = rng.standard_normal((TOPICS, DIMENSIONS))
+        self.topic_words = [[f"t{topic}w{i}" for i in range(TOPIC_WORDS)] for topic in range(TOPICS)]
+        filler = [f"f{i}" for i in range(FILLER_WORDS)]
+        self.word_vectors = {word: topic_vectors[topic] + rng.standard_normal(DIMENSIONS)
+                             for topic, words in enumerate(self.topic_words) for word in words}
+        self.word_vectors.update({word: 0.5 * rng.standard_normal(DIMENSIONS) for word in filler})
+        self.topics, self.texts = [], []
+        for i in range(size):
+            topic, other = random.sample(range(TOPICS), 2)
+            length = random.randint(60, 120)
+            words = (random.choices(self.topic_words[topic], k=length // 8)
+                     + random.choices(self.topic_words[other], k=length // 20)
+                     + random.choices(filler, k=length - length // 8 - length // 20))
+            random.shuffle(words)
+            self.topics.append(topic)
+            self.texts.append(" ".join(words))
+        self.embeddings = normalize(np.stack([self.embed(text) for text in self.texts]).astype(np.float32))
+        self.rows = {text: i for i, text in enumerate(self.texts)}
+
+    def embed(self, text: str) -> np.ndarray:
+        return np.sum([self.word_vectors[word] for word in text.split()], axis=0)
+
+    def queries(self, kind: str) -> list[tuple[str, int, int]]:
+        random.seed(kind)
+        queries = []
+        for _ in range(QUERIES):
+            chunk = random.randrange(len(self.texts))
+            topic, words = self.topics[chunk], set(self.texts[chunk].split())
+            choices = [word for word in self.topic_words[topic] if (word in words) == (kind == "keywords")]
+            queries.append((" ".join(random.sample(choices, min(4, len(choices)))), topic, chunk))
+        return queries
+
+
+def evaluate(corpus: Corpus, queries: list[tuple[str, int, int]], candidates: int, lexical_weight: float) -> dict:
+    embedded, calls, rank_seconds = 0, 0, 0.0
+    recall_2, recall_10, on_topic, found = [], [], [], []
+
+    def embed_texts(texts: list[str]) -> np.ndarray:
+        nonlocal embedded, calls
+        embedded += len(texts)
+        calls += 1
+        return corpus.embeddings[[corpus.rows[text] for text in texts]]
+
+    for query, topic, chunk in queries:
+        query_embedding = corpus.embed(query)
+        dense = top_k_indices(corpus.embeddings @ normalize(query_embedding.astype(np.float32)), 10)
+        start = time.perf_counter()
+        ranked = [i for i, _ in hybrid_rank(corpus.texts, query, embed_texts, lambda _: query_embedding, 10,
+                                            candidates, lexical_weight)]
+        rank_seconds += time.perf_counter() - start
+        recall_2.append(len(set(ranked[:2]) & set(dense[:2])) / 2)
+        recall_10.append(len(set(ranked) & set(dense)) / 10)
+        on_topic.append(sum(corpus.topics[i] == topic for i in ranked[:2]) / 2)
+        found.append(chunk in ranked)
+    return {
+        "embedded": embedded / len(queries),
+        "embed_seconds": (calls * CALL_OVERHEAD + embedded * TEXT_COST) / len(queries),
+        "rank_ms": rank_seconds / len(queries) * 1000,
+        "recall_2": np.mean(recall_2),
+        "recall_10": np.mean(recall_10),
+        "on_topic": np.mean(on_topic),
+        "found": np.mean(found),
+    }
+
+
+def main():
+    for size in CHUNKS:
+        corpus = Corpus(size)
+        start = time.perf_counter()
+        BM25Index(corpus.texts)
+        print(f"\n{size:,} chunks, BM25 index built in {(time.perf_counter() - start) * 1000:.0f}ms")
+        for kind in ("keywords", "paraphrase"):
+            queries = corpus.queries(kind)
+            print(f"{kind + ' queries':<22} {'embedded':>9} {'embed time':>11} {'cpu':>9} {'recall@2':>9} "
+                  f"{'recall@10':>10} {'on topic@2':>11} {'found@10':>9}")
+            for candidates, lexical_weight in SETTINGS:
+                name = f"BM25 {candidates}, weight {lexical_weight}" if candidates else "dense only"
+                result = evaluate(corpus, queries, candidates, lexical_weight)
+                print(f"{name:<22} {result['embedded']:>9,.0f} {result['embed_seconds']:>10.2f}s "
+                      f"{result['rank_ms']:>7.1f}ms {result['recall_2']:>9.0%} {result['recall_10']:>10.0%} "
+                      f"{result['on_topic']:>11.0%} {result['found']:>9.0%}")
+
+
+if __name__ == "__main__":
+    main()
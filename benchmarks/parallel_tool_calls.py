@@ -0,0 +1,54 @@
+"""Shows the wall time of one llm turn that calls several slow tools, run one after another and with ToolExecutor.
+
+The fake tools sleep to stand in for network latency (weather, unread gmail, google search), one of them is async.
+
+Run from the project root: python -m benchmarks.parallel_tool_calls
+"""
+import asyncio
+import time
+
+from llama_index.core.tools import FunctionTool
+
+from tool_registry import ToolExecutor, TOOL_REGISTRY
+
+LATENCIES = {"get_weather": 0.4, "get_unread_emails": 0.7, "google_search": 0.5}
+
+
+def sleeping_tool(name: str, latency: float) -> FunctionTool:
+    def tool() -> str:
+        time.sleep(latency)
+        return f"{name} finished"
+    return FunctionTool.from_defaults(fn=tool, name=name, description=f"Sleeps {latency} seconds.")
+
+
+def async_sleeping_tool(name: str, latency: float) -> FunctionTool:
+    async def tool() -> str:
+        await asyncio.sleep(latency)
+        return f"{name} finished"
+    TOOL_REGISTRY.async_tools.add(name)
+    return FunctionTool.from_defaults(async_fn=tool, name=name, description=f"Sleeps {latency} seconds.")
+
+
+async def main():
+    tools = [sleeping_tool(name, latency) for name, latency in LATENCIES.items()]
+    tools.append(async_sleeping_tool("conduct_research", 0.6))
+    calls = [(tool, {}) for tool in tools]
+
+    executor = ToolExecutor()
+    start = time.perf_counter()
+    sequential = [await executor.call(tool, kwargs) for tool, kwargs in calls] # how handle_tool_calls used to run them
+    sequential_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    concurrent = await executor.call_all(calls)
+    concurrent_time = time.perf_counter() - start
+
+    assert [output.content for output in sequential] == [output.content for output in concurrent]
+    latencies = [*LATENCIES.values(), 0.6]
+    print(f"sum of latencies: {sum(latencies):.2f}s, max latency: {max(latencies):.2f}s")
+    print(f"sequential:       {sequential_time:.2f}s")
+    print(f"ToolExecutor:     {concurrent_time:.2f}s")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
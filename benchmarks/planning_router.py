@@ -0,0 +1,100 @@
+"""Compares thinking mode with the planning router against always planning and never planning on a mixed query set.
+
+The llm is simulated so the benchmark runs offline: a call takes a fixed overhead plus time per prompt and
+completion token, the prompt sizes come from the real prompts (4 characters per token). The embedding model is the
+hashed bag of words of benchmarks.response_cache, so the router decisions are cruder than with the real model.
+Complex queries answered without a plan are counted as misrouted, that is where the answers may get worse.
+
+Run from the project root: python -m benchmarks.planning_router
+"""
+import asyncio
+import time
+
+from config import PlanningRouterConfig
+from helpers.planning_router import PlanningRouter, PLAN, DIRECT
+from prompts import system_planning, planning_prompt, execute_plan_prompt, direct_prompt
+from benchmarks.response_cache import HashedBagOfWords
+from logger import app_logger
+
+app_logger.setLevel("WARNING") # the router logs every decision
+
+CALL_OVERHEAD = 0.35 # seconds per llm call
+PROMPT_TOKEN_TIME = 0.00005
+COMPLETION_TOKEN_TIME = 0.015
+HISTORY_TOKENS = 400
+TOOL_DESCRIPTION_TOKENS = 600
+PLAN_COMPLETION_TOKENS = 180
+ANSWER_COMPLETION_TOKENS = 40
+
+# queries that are not in the router examples, with the label they should get
+QUERIES = [
+    ("what's the weather in london", DIRECT),
+    ("what is the time", DIRECT),
+    ("stop talking", DIRECT),
+    ("thanks", DIRECT),
+    ("open youtube for me", DIRECT),
+    ("how many unread emails are there", DIRECT),
+    ("who is ada lovelace", DIRECT),
+    ("what is my cpu usage", DIRECT),
+    ("tell me the latest news", DIRECT),
+    ("what is the capital of japan", DIRECT),
+    ("research electric cars and summarize the pros and cons", PLAN),
+    ("check my emails from anna and reply that I will call her tomorrow", PLAN),
+    ("compare the weather in rome and madrid this week and pick the warmer city", PLAN),
+    ("find the news about the stock market and email me a summary", PLAN),
+    ("write a python script that lists the largest files in my downloads folder", PLAN),
+    ("download the latest story of this profile and move it to my desktop folder", PLAN),
+]
+
+
+def tokens(text: str) -> int:
+    return len(text) // 4
+
+
+def call(prompt_tokens: int, completion_tokens: int) -> tuple[float, int]:
+    return CALL_OVERHEAD + prompt_tokens * PROMPT_TOKEN_TIME + completion_tokens * COMPLETION_TOKEN_TIME, \
+        prompt_tokens + completion_tokens
+
+
+def turn(query: str, plan: bool) -> tuple[float, int]:
+    """Simulated latency and tokens of one turn, tool calls are left out as they are the same in every mode."""
+    if plan:
+        plan_prompt = HISTORY_TOKENS + tokens(system_planning) + TOOL_DESCRIPTION_TOKENS + tokens(planning_prompt + query)
+        plan_time, plan_tokens = call(plan_prompt, PLAN_COMPLETION_TOKENS)
+        answer_prompt = plan_prompt + PLAN_COMPLETION_TOKENS + tokens(execute_plan_prompt) + TOOL_DESCRIPTION_TOKENS
+        answer_time, answer_tokens = call(answer_prompt, ANSWER_COMPLETION_TOKENS)
+        return plan_time + answer_time, plan_tokens + answer_tokens
+    answer_prompt = HISTORY_TOKENS + tokens(direct_prompt + query) + TOOL_DESCRIPTION_TOKENS
+    return call(answer_prompt, ANSWER_COMPLETION_TOKENS)
+
+
+async def run(mode: str, router: PlanningRouter | None) -> tuple[float, int, int, float]:
+    latency, used_tokens, misrouted, routing = 0.0, 0, 0, 0.0
+    for query, label in QUERIES:
+        if mode == "router":
+            start = time.perf_counter()
+            decision = await router.route(query)
+            routing += time.perf_counter() - start
+        else:
+            decision = PLAN if mode == "always plan" else DIRECT
+        misrouted += label == PLAN and decision == DIRECT
+        turn_latency, turn_tokens = turn(query, plan=decision == PLAN)
+        latency += turn_latency
+        used_tokens += turn_tokens
+    return latency / len(QUERIES) + routing / len(QUERIES), used_tokens, misrouted, routing / len(QUERIES)
+
+
+async def main():
+    print(f"{'mode':>22} {'latency/turn':>13} {'tokens':>8} {'misrouted':>10} {'routing/turn':>13}")
+    for mode in ("always plan", "never plan"):
+        latency, used_tokens, misrouted, _ = await run(mode, None)
+        print(f"{mode:>22} {latency:>12.2f}s {used_tokens:>8,} {misrouted:>10} {'':>13}")
+    for threshold in (PlanningRouterConfig.THRESHOLD, 0.5, 0.3):
+        router = PlanningRouter(HashedBagOfWords(), threshold=threshold, k=PlanningRouterConfig.K)
+        latency, used_tokens, misrouted, routing = await run("router", router)
+        print(f"{f'router (threshold {threshold})':>22} {latency:>12.2f}s {used_tokens:>8,} {misrouted:>10} "
+              f"{routing * 1000:>11.2f}ms")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,122 @@
+"""Replays a recorded day of spoken queries through the response cache and counts the llm calls it avoids.
+
+The llm is faked: a query costs one llm call plus one more per round of tool calls, like the FunctionCallingAgent
+loop. The embedding model is a hashed bag of words so the benchmark runs offline, the time of every query is taken
+from the log so the tool ttls of ResponseCacheConfig apply like they would during the day. It first asserts that
+follow-ups are not reused in another conversation and that an expired best match falls back to the next one.
+
+Run from the project root: python -m benchmarks.response_cache
+"""
+import asyncio
+import hashlib
+import random
+import re
+
+import numpy as np
+
+from config import ResponseCacheConfig
+from helpers.response_cache import SemanticResponseCache, context_key
+
+DIMENSIONS = 256
+LLM_CALLS_PER_TOOL_ROUND = 1
+
+# spoken variants of a query, the tools the agent calls to answer it
+QUERIES = [
+    (["what's the weather", "what is the weather", "what's the weather like"], ["get_weather"]),
+    (["how many unread emails do I have", "how many unread emails"], ["get_unread_emails"]),
+    (["what's the weather this week", "weekly forecast"], ["get_weekly_forecast"]),
+    (["who is alan turing", "who was alan turing"], ["wikipedia_summary"]),
+    (["what's the latest news", "what is the latest news"], ["get_news_summary"]),
+    (["tell me a joke", "tell me a joke please"], []),
+    (["send an email to john saying I'm late"], ["send_email"]),
+    (["open youtube"], ["open_youtube"]),
+    (["what is my battery level"], ["get_battery_info"]),
+]
+
+
+class HashedBagOfWords:
+    """Offline stand in for the embedding model."""
+    def get_query_embedding(self, query: str) -> list[float]:
+        embedding = np.zeros(DIMENSIONS, dtype=np.float32)
+        for word in re.findall(r"[a-z]+", query.lower().replace("'s", " is")):
+            embedding[int(hashlib.md5(word.encode()).hexdigest(), 16) % DIMENSIONS] += 1.0
+        return embedding.tolist()
+
+    async def aget_query_embedding(self, query: str) -> list[float]:
+        return self.get_query_embedding(query)
+
+    def get_text_embedding_batch(self, texts: list[str]) -> list[list[float]]:
+        return [self.get_query_embedding(text) for text in texts]
+
+
+def query_log(n: int = 400, seed: int = 0) -> list[tuple[float, str, list[str]]]:
+    """n queries spread over 16 hours, popular queries are asked more often."""
+    random.seed(seed)
+    weights = [30, 15, 8, 6, 10, 6, 2, 5, 3]
+    times = sorted(random.uniform(0, 16 * 3600) for _ in range(n))
+    log = []
+    for at in times:
+        variants, tools = random.choices(QUERIES, weights=weights)[0]
+        log.append((at, random.choice(variants), tools))
+    return log
+
+
+def llm_calls(tools: list[str]) -> int:
+    return 1 + (LLM_CALLS_PER_TOOL_ROUND if tools else 0)
+
+
+async def replay(log, cache: SemanticResponseCache | None) -> int:
+    calls = 0
+    for at, query, tools in log:
+        if cache is not None:
+            cache.clock = lambda: at
+            embedding = await cache.embed(query)
+            if cache.lookup(query, embedding) is not None:
+                continue
+        calls += llm_calls(tools)
+        if cache is not None:
+            cache.put(query, embedding, f"answer to {query}", tools)
+    return calls
+
+
+async def check_follow_ups_and_expiry():
+    cache = SemanticResponseCache(HashedBagOfWords(), threshold=0.7, no_tool_ttl=100, save_delay=0)
+    cache.clock = lambda: 0
+    weather, joke = context_key([("user", "what's the weather")]), context_key([("user", "tell me a joke")])
+    yes = await cache.embed("yes")
+    cache.put("yes", yes, "It is sunny.", [], context=weather)
+    assert cache.lookup("yes", yes, weather) == "It is sunny."
+    assert cache.lookup("yes", yes, joke) is None, "a follow-up was reused in another conversation"
+    # the same question in any conversation, the expired exact match is skipped for the next fresh one
+    tomorrow = "what will the weather be like in paris tomorrow"
+    cache.put(tomorrow + " morning", await cache.embed(tomorrow + " morning"), "Cloudy.", [], context=weather)
+    cache.clock = lambda: 50
+    cache.put(tomorrow, await cache.embed(tomorrow), "Rain.", [], context=joke)
+    cache.clock = lambda: 120
+    assert cache.lookup(tomorrow + " morning", await cache.embed(tomorrow + " morning"), joke) == "Rain."
+    assert cache.expired == 1
+
+
+async def main():
+    await check_follow_ups_and_expiry()
+    log = query_log()
+    baseline = await replay(log, None)
+    print(f"{'threshold':>9} {'llm calls':>10} {'avoided':>8} {'hit rate':>9} {'expired':>8} {'not cached':>11}")
+    print(f"{'no cache':>9} {baseline:>10} {0:>8} {'':>9} {'':>8} {'':>11}")
+    for threshold in (1.0, ResponseCacheConfig.SIMILARITY_THRESHOLD, 0.85):
+        cache = SemanticResponseCache(
+            HashedBagOfWords(),
+            threshold=threshold,
+            max_size=ResponseCacheConfig.MAX_SIZE,
+            no_tool_ttl=ResponseCacheConfig.NO_TOOL_TTL,
+            default_tool_ttl=ResponseCacheConfig.DEFAULT_TOOL_TTL,
+            tool_ttls=ResponseCacheConfig.TOOL_TTLS,
+        )
+        calls = await replay(log, cache)
+        stats = cache.stats()
+        print(f"{threshold:>9.2f} {calls:>10} {baseline - calls:>8} {stats['hit_rate']:>8.0%} "
+              f"{stats['expired']:>8} {stats['skipped']:>11}")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
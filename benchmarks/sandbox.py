@@ -0,0 +1,94 @@
+"""Measures the latency of execute_code and how much a cpu heavy snippet delays the audio threads.
+
+Latency: a process spawned per call (how execute_code ran its code before the worker pool), the first call of a pool
+started right before it, and the later calls of a warm pool.
+Starvation: a ticker thread wakes up every 10 ms, like the audio callbacks of the recorder and the player, while a
+snippet doing big integer math (it holds the GIL) runs either in a thread of this process (how execute_code ran it
+originally) or in the sandbox. The lag of the ticker is how late the audio threads would run.
+
+Run from the project root: python -m benchmarks.sandbox
+"""
+import statistics
+import threading
+import time
+
+from config import SandboxConfig
+from helpers.sandbox import WorkerPool, _execute
+
+TICK = 0.01
+CALLS = 20
+QUICK_SNIPPET = "print(math.sqrt(2) * 10)"
+HEAVY_SNIPPET = "x = 3 ** 3_000_000\nresult = (x * x) % 1_000_007"
+
+
+def new_pool(size: int) -> WorkerPool:
+    return WorkerPool(size=size, modules=SandboxConfig.MODULES, memory_limit_mb=SandboxConfig.MEMORY_LIMIT_MB,
+                      cpu_limit=SandboxConfig.CPU_LIMIT, max_output=SandboxConfig.MAX_OUTPUT)
+
+
+def timed(pool: WorkerPool, code: str = QUICK_SNIPPET) -> float:
+    start = time.perf_counter()
+    pool.run(code, timeout=30)
+    return time.perf_counter() - start
+
+
+def latency():
+    spawned = []
+    for _ in range(3):
+        pool = new_pool(1)
+        spawned.append(timed(pool))
+        pool.shutdown()
+
+    pool = new_pool(SandboxConfig.WORKERS)
+    first = timed(pool)
+    warm = [timed(pool) for _ in range(CALLS)]
+    pool.shutdown()
+
+    print(f"{'setup':<28} {'latency':>10}")
+    print(f"{'process per call':<28} {statistics.median(spawned) * 1000:>8.1f}ms")
+    print(f"{'first call of a new pool':<28} {first * 1000:>8.1f}ms")
+    print(f"{'warm pool (median)':<28} {statistics.median(warm) * 1000:>8.1f}ms")
+    print(f"{'warm pool (max)':<28} {max(warm) * 1000:>8.1f}ms")
+
+
+def ticker_lag(run) -> tuple[float, float, float]:
+    """Runs run() while a thread ticks every TICK seconds, returns the duration, mean and max lag of the ticks."""
+    lags = []
+    done = threading.Event()
+
+    def tick():
+        while not done.is_set():
+            expected = time.perf_counter() + TICK
+            time.sleep(TICK)
+            lags.append(max(0.0, time.perf_counter() - expected))
+
+    thread = threading.Thread(target=tick)
+    thread.start()
+    start = time.perf_counter()
+    try:
+        run()
+    finally:
+        duration = time.perf_counter() - start
+        done.set()
+        thread.join()
+    return duration, statistics.mean(lags), max(lags)
+
+
+def starvation():
+    def in_thread():
+        thread = threading.Thread(target=_execute, args=(HEAVY_SNIPPET, {}, SandboxConfig.MAX_OUTPUT))
+        thread.start()
+        thread.join()
+
+    pool = new_pool(1)
+    pool.run("pass", timeout=30) # wait until the worker is warm
+    print(f"\n{'heavy snippet runs in':<22} {'duration':>9} {'mean tick lag':>14} {'max tick lag':>13}")
+    for name, run in (("a thread (GIL shared)", in_thread), ("the sandbox", lambda: pool.run(HEAVY_SNIPPET, 30))):
+        duration, mean, worst = ticker_lag(run)
+        print(f"{name:<22} {duration:>8.2f}s {mean * 1000:>12.1f}ms {worst * 1000:>11.1f}ms")
+    pool.shutdown()
+
+
+if __name__ == "__main__":
+    latency()
+    starvation()
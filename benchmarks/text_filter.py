@@ -0,0 +1,81 @@
+"""Measures StreamingTextFilter against the chained extract_final_answer/clean_text passes on large synthetic responses.
+
+Two cases are measured for every size:
+    - whole text: both are given the complete response once.
+    - streamed: the response arrives in small chunks. Without the filter the chained passes have to be run again
+      over everything received so far to know what can be spoken, the filter only looks at each chunk once.
+
+Run from the project root: python -m benchmarks.text_filter
+"""
+import random
+import time
+
+from helpers.utils import StreamingTextFilter, clean_text, extract_final_answer
+
+PIECES = [
+    "The **weather** today is `sunny` with ~light~ wind. ",
+    "Read more at https://www.meteosource.com/forecast/today or www.example.com/a_b-c. ",
+    "<think>The user asked for the forecast, I should call get_weather first.</think>",
+    "> quoted text with _emphasis_ and <b>tags</b>.\n",
+    "Plain sentence without anything special in it.\n\n",
+]
+CHUNK_SIZE = 8 # roughly the size of an llm token
+
+
+def synthetic_response(size: int) -> str:
+    random.seed(size)
+    parts, length = [], 0
+    while length < size:
+        part = random.choice(PIECES)
+        parts.append(part)
+        length += len(part)
+    return "".join(parts)
+
+
+def chained(text: str) -> str:
+    return clean_text(extract_final_answer(text))
+
+
+def filtered(text: str) -> str:
+    text_filter = StreamingTextFilter()
+    return text_filter.feed(text) + text_filter.flush()
+
+
+def chained_streamed(text: str) -> str:
+    spoken = ""
+    for end in range(CHUNK_SIZE, len(text) + CHUNK_SIZE, CHUNK_SIZE):
+        spoken = chained(text[:end])
+    return spoken
+
+
+def filtered_streamed(text: str) -> str:
+    text_filter = StreamingTextFilter()
+    spoken = [text_filter.feed(text[start:start + CHUNK_SIZE]) for start in range(0, len(text), CHUNK_SIZE)]
+    return "".join(spoken) + text_filter.flush()
+
+
+def timed(function, text: str) -> tuple[float, str]:
+    start = time.perf_counter()
+    result = function(text)
+    return time.perf_counter() - start, result
+
+
+def main():
+    print(f"{'size':>10} {'chained':>10} {'filter':>10} {'chained streamed':>17} {'filter streamed':>16}")
+    for size in (10_000, 100_000, 1_000_000, 10_000_000):
+        text = synthetic_response(size)
+        chained_time, expected = timed(chained, text)
+        filter_time, result = timed(filtered, text)
+        assert result == expected
+        streamed_filter_time, result = timed(filtered_streamed, text)
+        assert result == expected
+        if size <= 10_000: # the chained passes are quadratic when streamed, larger sizes take minutes
+            streamed_chained = f"{timed(chained_streamed, text)[0] * 1000:15.1f}ms"
+        else:
+            streamed_chained = f"{'skipped':>17}"
+        print(f"{size:>10} {chained_time * 1000:8.1f}ms {filter_time * 1000:8.1f}ms {streamed_chained} "
+              f"{streamed_filter_time * 1000:14.1f}ms")
+
+
+if __name__ == "__main__":
+    main()
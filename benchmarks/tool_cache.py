@@ -0,0 +1,181 @@
+"""Checks the tool result cache on the weather tools of scripts/weather.py against a local fake of the meteosource api.
+
+The tools are the registered ones (register_tool(cache=...) and cache_result on TOOL_CACHE), pointed at the fake
+through WeatherConfig.API_URL, with the shared http client of the tools and TOOL_CACHE in a temporary file. The fake
+answers find_places and point, with an ETag on point, and counts the requests per endpoint:
+    - a turn asking for the weather and then the forecast, repeated TURNS times: one request per endpoint.
+    - get_place_id with the city and country in another case or spacing shares the result, get_weather with the
+      place id in another case does not (place_id is not declared case insensitive).
+    - a restart (the memory of the cache cleared): the results come from the file, no request.
+    - the cache cleared: the forecast and the weather are conditional requests answered with 304.
+    - the next day: the forecast labels move without a request.
+The request counts are asserted, run it after changing the tools or the cache.
+
+Needs ToolCacheConfig.ENABLED, the tools are wrapped when scripts.weather is imported.
+Run from the project root: python -m benchmarks.tool_cache
+"""
+import datetime
+import hashlib
+import json
+import os
+import tempfile
+import threading
+import time
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from types import SimpleNamespace
+from unittest import mock
+from urllib.parse import parse_qs, urlsplit
+
+from config import ToolCacheConfig, WeatherConfig
+from helpers.http_client import HttpClient
+from scripts import weather
+from scripts.data_manager import DataManager as dm
+from tool_registry import TOOL_CACHE
+
+TURNS = 5
+GENERAL_DATA = {
+    "meteosource": {"api_key": "key"},
+    "user_data": {"personal_information": {"location": {"city": "London", "country": "United Kingdom"}}},
+}
+
+
+class MeteosourceHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    disable_nagle_algorithm = True
+    requests = Counter() # by find_places, current and daily
+    not_modified = Counter()
+
+    def do_GET(self):
+        url = urlsplit(self.path)
+        query = parse_qs(url.query)
+        if url.path.endswith("find_places"):
+            MeteosourceHandler.requests["find_places"] += 1
+            self.reply([{"place_id": "paris-fr", "country": "France"},
+                        {"place_id": query["text"][0].strip().lower(), "country": "United Kingdom"}])
+            return
+        section = query["sections"][0]
+        MeteosourceHandler.requests[section] += 1
+        today = datetime.date.today()
+        if section == "current":
+            data = {"current": {"summary": "Sunny", "temperature": 21, "place_id": query["place_id"][0]}}
+        else:
+            data = {"daily": {"data": [{"day": (today + datetime.timedelta(days=i)).isoformat(), "summary": f"Day {i}",
+                                        "morning": None, "all_day": {"temperature": 20, "precipitation": {}}}
+                                       for i in range(7)]}}
+        self.reply(data, section=section)
+
+    def reply(self, data, section: str | None = None):
+        body = json.dumps(data).encode()
+        tag = f'"{hashlib.md5(body).hexdigest()}"'
+        if section and self.headers.get("If-None-Match") == tag:
+            MeteosourceHandler.not_modified[section] += 1
+            self.send_response(304)
+            self.send_header("ETag", tag)
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+            return
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        if section:
+            self.send_header("ETag", tag)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def check(name: str, run, requests: dict, not_modified: dict | None = None):
+    """Runs the scenario and asserts the requests (and 304s) the fake received."""
+    MeteosourceHandler.requests.clear()
+    MeteosourceHandler.not_modified.clear()
+    start = time.perf_counter()
+    result = run()
+    elapsed = time.perf_counter() - start
+    assert MeteosourceHandler.requests == Counter(requests), f"{name}: {dict(MeteosourceHandler.requests)}"
+    assert MeteosourceHandler.not_modified == Counter(not_modified or {}), \
+        f"{name}: 304 {dict(MeteosourceHandler.not_modified)}"
+    print(f"{name:<42} {sum(MeteosourceHandler.requests.values()):>9} "
+          f"{sum(MeteosourceHandler.not_modified.values()):>5} {elapsed * 1000:>9.1f}ms")
+    return result
+
+
+def turns(count: int = TURNS) -> list:
+    forecasts = []
+    for _ in range(count):
+        current = weather.get_weather()
+        assert isinstance(current, dict), current
+        forecasts.append(weather.get_weekly_forecast())
+    return forecasts
+
+
+def labels(forecast) -> list[str]:
+    assert isinstance(forecast, list), forecast
+    return [day["day"] for day in forecast]
+
+
+def tomorrow_datetime():
+    """scripts.weather.datetime on the next day."""
+    class Tomorrow(datetime.datetime):
+        @classmethod
+        def today(cls):
+            return datetime.datetime.today() + datetime.timedelta(days=1)
+    return SimpleNamespace(datetime=Tomorrow, timedelta=datetime.timedelta)
+
+
+def main():
+    assert ToolCacheConfig.ENABLED, "the tool cache is disabled in config.py"
+    server = ThreadingHTTPServer(("127.0.0.1", 0), MeteosourceHandler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    WeatherConfig.API_URL = f"http://127.0.0.1:{server.server_address[1]}/api/v1/free"
+    dm.data_cache["general_data.json"] = json.loads(json.dumps(GENERAL_DATA))
+    dm._http = HttpClient(revalidate_size=128)
+
+    with tempfile.TemporaryDirectory() as directory:
+        TOOL_CACHE.path = os.path.join(directory, "tool_cache.db")
+        TOOL_CACHE._connection = None
+        TOOL_CACHE.clear()
+        print(f"{'scenario':<42} {'requests':>9} {'304':>5} {'time':>11}")
+
+        forecasts = check(f"{TURNS} turns", turns, {"find_places": 1, "current": 1, "daily": 1})
+        assert dm.user["location"]["Place_id"] == "london"
+        assert all(labels(forecast) == labels(forecasts[0]) for forecast in forecasts)
+        assert labels(forecasts[0]) == ["Today", "Tomorrow"] + [f"In {days} days" for days in range(2, 7)]
+        assert "morning" not in forecasts[0][0] and "precipitation" not in forecasts[0][0]["all_day"]
+
+        check("get_place_id, case and spacing", lambda: [
+            weather.get_place_id("Manchester", "United Kingdom"),
+            weather.get_place_id("  manchester ", "united KINGDOM"),
+            weather.get_place_id("MANCHESTER", "United  Kingdom"),
+        ], {"find_places": 1})
+        check("get_weather, place id case", lambda: [
+            weather.get_weather("manchester"), weather.get_weather("Manchester"), weather.get_weather("manchester"),
+        ], {"current": 2})
+
+        TOOL_CACHE.memory.clear()
+        check("restart (results on disk)", lambda: turns(1), {})
+        assert TOOL_CACHE.stats()["tools"]["get_weather"]["disk_hits"] >= 1
+
+        TOOL_CACHE.clear()
+        check("cache cleared (conditional requests)", lambda: turns(1),
+              {"current": 1, "daily": 1}, {"current": 1, "daily": 1})
+
+        with mock.patch.object(weather, "datetime", tomorrow_datetime()):
+            forecast = check("the next day", lambda: weather.get_weekly_forecast(), {})
+        assert labels(forecast) == ["Today", "Tomorrow"] + [f"In {days} days" for days in range(2, 6)], "yesterday is dropped"
+        assert forecast[0]["summary"] == forecasts[0][1]["summary"]
+        assert labels(check("today again", lambda: weather.get_weekly_forecast(), {})) == labels(forecasts[0])
+
+        print(f"\ncache stats: {json.dumps(TOOL_CACHE.stats()['tools'])}")
+        print(f"http stats:  {json.dumps(dm.http.stats())}")
+        TOOL_CACHE.path = None
+        TOOL_CACHE._connection.close()
+        TOOL_CACHE._connection = None
+    server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
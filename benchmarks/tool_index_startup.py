@@ -0,0 +1,54 @@
+"""Startup time of the tool index for a cold cache, a warm cache and a cache where one script changed.
+
+The scripts directory is copied to a temporary directory and embedded with a fake embedding model that takes a
+fixed time per text, roughly what a local sentence-transformers model takes on a CPU.
+
+Run from the project root: python -m benchmarks.tool_index_startup
+"""
+import os
+import shutil
+import tempfile
+import time
+
+from llama_index.core.embeddings import MockEmbedding
+
+from helpers.tool_retriever import load_tool_retriever
+
+SECONDS_PER_TEXT = 0.05
+
+
+class SlowMockEmbedding(MockEmbedding):
+    embedded_texts: int = 0
+
+    def _get_text_embeddings(self, texts: list[str]) -> list[list[float]]:
+        time.sleep(SECONDS_PER_TEXT * len(texts))
+        self.embedded_texts += len(texts)
+        return super()._get_text_embeddings(texts)
+
+
+def timed_startup(name: str, directory_path: str, persist_dir: str):
+    embed_model = SlowMockEmbedding(embed_dim=1024, model_name="slow-mock")
+    start = time.perf_counter()
+    retriever, changed = load_tool_retriever(directory_path, persist_dir, embed_model, similarity_top_k=5)
+    elapsed = time.perf_counter() - start
+    print(f"{name:>17}: {elapsed * 1000:8.1f}ms, {embed_model.embedded_texts:>3} texts embedded, "
+          f"{len(retriever.nodes)} nodes, changed: {changed}")
+
+
+def main():
+    with tempfile.TemporaryDirectory() as directory:
+        directory_path = os.path.join(directory, "scripts")
+        persist_dir = os.path.join(directory, "tool_index")
+        shutil.copytree("scripts", directory_path)
+
+        timed_startup("cold", directory_path, persist_dir)
+        timed_startup("warm", directory_path, persist_dir)
+
+        with open(os.path.join(directory_path, "weather.py"), "a", encoding="utf-8") as f:
+            f.write('\n\ndef get_humidity(place_id: str = "") -> str:\n    """Gets the current humidity."""\n')
+        timed_startup("one file changed", directory_path, persist_dir)
+        timed_startup("warm", directory_path, persist_dir)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,90 @@
+"""Shows how a long async tool affects the other tools of the same turn and the workflow loop.
+
+research is an async tool that, like conduct_research, does blocking work inside its coroutine. Two setups run the
+same turn (research together with quick async and blocking tools):
+    - single tools loop: every async tool runs on one shared loop thread, how register_tool used to run them.
+    - loop pool: quick async tools are awaited on the workflow loop, research is isolated on TOOL_LOOP_POOL.
+The lag of the workflow loop (it also forwards the streamed llm text) is measured with a ticker.
+
+Run from the project root: python -m benchmarks.tool_loops
+"""
+import asyncio
+import threading
+import time
+
+from llama_index.core.tools import FunctionTool
+
+from tool_registry import ToolExecutor, TOOL_REGISTRY, TOOL_LOOP_POOL
+
+RESEARCH_BLOCKING = 1.5 # seconds of blocking work inside the research coroutine
+QUICK_LATENCY = 0.2
+
+
+async def research() -> str:
+    await asyncio.sleep(0.1)
+    time.sleep(RESEARCH_BLOCKING)
+    return "report"
+
+
+async def quick() -> str:
+    await asyncio.sleep(QUICK_LATENCY)
+    return "quick"
+
+
+def blocking() -> str:
+    time.sleep(QUICK_LATENCY)
+    return "blocking"
+
+
+def single_loop_tools() -> list[FunctionTool]:
+    loop = asyncio.new_event_loop()
+    threading.Thread(target=loop.run_forever, daemon=True).start()
+
+    def on_shared_loop(func):
+        async def wrapper():
+            return await asyncio.wrap_future(asyncio.run_coroutine_threadsafe(func(), loop))
+        return wrapper
+    return [FunctionTool.from_defaults(async_fn=on_shared_loop(research), name="research"),
+            FunctionTool.from_defaults(async_fn=on_shared_loop(quick), name="quick_1"),
+            FunctionTool.from_defaults(async_fn=on_shared_loop(quick), name="quick_2"),
+            FunctionTool.from_defaults(fn=blocking, name="blocking")]
+
+
+def loop_pool_tools() -> list[FunctionTool]:
+    async def isolated_research():
+        return await TOOL_LOOP_POOL.arun(research())
+    return [FunctionTool.from_defaults(async_fn=isolated_research, name="research"),
+            FunctionTool.from_defaults(async_fn=quick, name="quick_1"),
+            FunctionTool.from_defaults(async_fn=quick, name="quick_2"),
+            FunctionTool.from_defaults(fn=blocking, name="blocking")]
+
+
+async def ticker(lags: list[float], stop: asyncio.Event, interval: float = 0.01):
+    while not stop.is_set():
+        start = time.perf_counter()
+        await asyncio.sleep(interval)
+        lags.append(time.perf_counter() - start - interval)
+
+
+async def run(tools: list[FunctionTool]) -> tuple[float, dict]:
+    TOOL_REGISTRY.async_tools.update({"research", "quick_1", "quick_2"})
+    executor = ToolExecutor()
+    lags, stop = [], asyncio.Event()
+    ticking = asyncio.create_task(ticker(lags, stop))
+    await executor.call_all([(tool, {}) for tool in tools])
+    stop.set()
+    await ticking
+    return max(lags), executor.stats()
+
+
+async def main():
+    for name, tools in (("single tools loop", single_loop_tools()), ("loop pool", loop_pool_tools())):
+        max_lag, stats = await run(tools)
+        print(f"{name}: workflow loop max lag {max_lag * 1000:.0f} ms, max queue depth {stats['max_queue_depth']}")
+        for tool, tool_stats in stats["tools"].items():
+            print(f"    {tool:>10}: waited {tool_stats['mean_wait'] * 1000:5.0f} ms, "
+                  f"finished after {(tool_stats['mean_wait'] + tool_stats['mean_run']) * 1000:5.0f} ms")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
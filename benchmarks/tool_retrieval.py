@@ -0,0 +1,65 @@
+"""Query time of the tool retriever as the number of docstrings grows from 50 to 50,000.
+
+Compares the SimpleVectorStore that VectorStoreIndex used (a python loop over every node) with MatrixRetriever
+(one matrix-vector product and argpartition). Random unit vectors stand in for the docstring embeddings so no
+embedding model is needed.
+
+Run from the project root: python -m benchmarks.tool_retrieval [dimension]
+"""
+import sys
+import tempfile
+import time
+
+import numpy as np
+from llama_index.core.schema import TextNode
+from llama_index.core.vector_stores import SimpleVectorStore, VectorStoreQuery
+
+from helpers.tool_retriever import MatrixRetriever, normalize
+
+TOP_K = 5
+QUERIES = 20
+
+
+def synthetic_corpus(size: int, dimension: int) -> tuple[list[TextNode], np.ndarray]:
+    rng = np.random.default_rng(size)
+    embeddings = normalize(rng.standard_normal((size, dimension), dtype=np.float32))
+    nodes = [TextNode(id_=str(i), text=f"docstring {i}", metadata={"file_name": f"tool_{i % 50}.py"}) for i in range(size)]
+    return nodes, embeddings
+
+
+def time_queries(function, queries: np.ndarray) -> float:
+    start = time.perf_counter()
+    for query in queries:
+        function(query)
+    return (time.perf_counter() - start) / len(queries)
+
+
+def main(dimension: int = 1024):
+    queries = normalize(np.random.default_rng(0).standard_normal((QUERIES, dimension), dtype=np.float32))
+    print(f"{'docstrings':>10} {'SimpleVectorStore':>18} {'MatrixRetriever':>16} {'mmap load':>10}")
+    for size in (50, 500, 5_000, 50_000):
+        nodes, embeddings = synthetic_corpus(size, dimension)
+
+        store = SimpleVectorStore()
+        store.add([TextNode(id_=node.node_id, text=node.text, embedding=embedding.tolist())
+                   for node, embedding in zip(nodes, embeddings)])
+        simple_time = time_queries(
+            lambda query: store.query(VectorStoreQuery(query_embedding=query.tolist(), similarity_top_k=TOP_K)), queries
+        )
+
+        with tempfile.TemporaryDirectory() as persist_dir:
+            MatrixRetriever(None, nodes, embeddings, similarity_top_k=TOP_K).persist(persist_dir)
+            start = time.perf_counter()
+            retriever = MatrixRetriever.load(persist_dir, embed_model=None, similarity_top_k=TOP_K)
+            load_time = time.perf_counter() - start
+            matrix_time = time_queries(retriever.retrieve_by_embedding, queries)
+
+            expected = store.query(VectorStoreQuery(query_embedding=queries[0].tolist(), similarity_top_k=TOP_K)).ids
+            assert [node.node.node_id for node in retriever.retrieve_by_embedding(queries[0])] == expected
+            del retriever # release the memory map before the directory is removed
+
+        print(f"{size:>10} {simple_time * 1000:16.2f}ms {matrix_time * 1000:14.3f}ms {load_time * 1000:8.1f}ms")
+
+
+if __name__ == "__main__":
+    main(*map(int, sys.argv[1:]))
@@ -0,0 +1,137 @@
+"""Reads search results the old way (one page per fetch_link_content call) and with the batch fetch.
+
+The pages are article fixtures generated here and served locally with LATENCY seconds before every response and
+BANDWIDTH bytes per second, plus a page far above WebFetchConfig.MAX_BYTES. The embedding model is a fake that costs CALL_OVERHEAD per call and
+TEXT_COST per text, like a round trip to an embedding api (or a forward pass of a local model), and the batch size
+of the local model:
+    - old: for every url, requests.get, html.parser, two_step_chunking and a new VectorStoreIndex, which embeds the
+      chunks in batches of embed_batch_size.
+    - batch: load_chunks fetches and chunks the pages concurrently, rank_chunks embeds the chunks of all the pages
+      in one batch.
+
+Needs scripts_data/general_data.json like the assistant (scripts.google_search is imported).
+Run from the project root: python -m benchmarks.web_fetch
+"""
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import requests
+from bs4 import BeautifulSoup
+from llama_index.core import Settings, VectorStoreIndex
+from llama_index.core.embeddings import BaseEmbedding
+
+from config import HuggingFaceEmbeddingConfig, WebFetchConfig
+from scripts.data_manager import DataManager as dm
+from scripts.google_search import HTML_PARSER, load_chunks, rank_chunks, two_step_chunking, web_reader
+
+LATENCY = 0.15
+BANDWIDTH = 4 * 1024 * 1024
+CALL_OVERHEAD = 0.05
+TEXT_COST = 0.001
+PAGES = 3
+WORDS = "the voice assistant answers questions about weather news research code and email quickly".split()
+
+
+class FakeEmbedding(BaseEmbedding):
+    calls: int = 0
+    texts: int = 0
+
+    def _embed(self, texts: list[str]) -> list[list[float]]:
+        self.calls += 1
+        self.texts += len(texts)
+        time.sleep(CALL_OVERHEAD + TEXT_COST * len(texts))
+        return [[float(text.count(word)) + 0.01 for word in WORDS] for text in texts]
+
+    def _get_query_embedding(self, query: str) -> list[float]:
+        return self._embed([query])[0]
+
+    async def _aget_query_embedding(self, query: str) -> list[float]:
+        return self._get_query_embedding(query)
+
+    def _get_text_embedding(self, text: str) -> list[float]:
+        return self._embed([text])[0]
+
+    def _get_text_embeddings(self, texts: list[str]) -> list[list[float]]:
+        return self._embed(texts)
+
+
+def article(seed: int, paragraphs: int) -> bytes:
+    random.seed(seed)
+    body = "\n\n\n".join(
+        f"<p>{' '.join(random.choices(WORDS, k=random.randint(40, 120)))}.</p>" for _ in range(paragraphs))
+    return f"<html><head><title>Article {seed}</title></head><body><nav>menu</nav>{body}</body></html>".encode()
+
+
+FIXTURES = {f"/article{i}": article(i, 150) for i in range(PAGES)}
+FIXTURES["/huge"] = article(99, 6_000)
+
+
+class FixtureHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    disable_nagle_algorithm = True
+    bytes_sent = 0
+
+    def do_GET(self):
+        time.sleep(LATENCY)
+        body = FIXTURES[self.path]
+        self.send_response(200)
+        self.send_header("Content-Type", "text/html; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        for start in range(0, len(body), 64 * 1024):
+            self.wfile.write(body[start:start + 64 * 1024])
+            FixtureHandler.bytes_sent += min(64 * 1024, len(body) - start)
+            time.sleep(64 * 1024 / BANDWIDTH)
+
+    def handle(self):
+        try:
+            super().handle()
+        except (BrokenPipeError, ConnectionResetError): # the client stopped reading at its byte cap
+            pass
+
+    def log_message(self, format, *args):
+        pass
+
+
+def old_fetch(url: str, query: str) -> list[str]:
+    page = requests.get(url)
+    text = BeautifulSoup(page.content, "html.parser").getText()
+    nodes = two_step_chunking([text])
+    return [result.node.text for result in VectorStoreIndex(nodes=nodes).as_retriever().retrieve(query)]
+
+
+def measure(name: str, run, embed_model: FakeEmbedding):
+    embed_model.calls = embed_model.texts = 0
+    FixtureHandler.bytes_sent = 0
+    start = time.perf_counter()
+    results = run()
+    elapsed = time.perf_counter() - start
+    print(f"{name:<26} {elapsed:>7.2f}s {embed_model.calls:>12} {embed_model.texts:>7} "
+          f"{FixtureHandler.bytes_sent / 1024:>10,.0f}KB {len(results):>8}")
+
+
+def main():
+    server = ThreadingHTTPServer(("127.0.0.1", 0), FixtureHandler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    base = f"http://127.0.0.1:{server.server_address[1]}"
+    articles = [f"{base}/article{i}" for i in range(PAGES)]
+    query = "weather news"
+    embed_model = FakeEmbedding(embed_batch_size=HuggingFaceEmbeddingConfig.EMBED_BATCH_SIZE)
+    Settings.embed_model = embed_model
+    dm.embed_model = embed_model
+
+    print(f"parser: {HTML_PARSER}, byte cap: {WebFetchConfig.MAX_BYTES / 1024:,.0f}KB, "
+          f"huge page: {len(FIXTURES['/huge']) / 1024:,.0f}KB")
+    print(f"{'scenario':<26} {'time':>8} {'embed calls':>12} {'texts':>7} {'downloaded':>12} {'results':>8}")
+    measure(f"old, {PAGES} pages", lambda: [text for url in articles for text in old_fetch(url, query)], embed_model)
+    measure(f"batch, {PAGES} pages", lambda: rank_chunks(load_chunks(web_reader, articles), query), embed_model)
+    measure("old, huge page", lambda: old_fetch(f"{base}/huge", query), embed_model)
+    measure("batch, huge page", lambda: rank_chunks(load_chunks(web_reader, [f"{base}/huge"]), query), embed_model)
+    server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
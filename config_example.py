@@ -17,8 +17,10 @@ EmbeddingModel: str = "huggingface" # Available models: "openai", "huggingface"
 LLM_provider = "openai" # Available models: "openai", "gemini"
 
 MAX_MESSAGE_HISTORY: int = 3
+MEMORY_TOKEN_LIMIT: int | None = None # token budget of the chat history, None uses 75% of the llm context window
 timeout: int = 120
 thinking_mode: bool = True
+stream_response: bool = False # speak the answer sentence by sentence while the llm is still generating it (once the response ended without tool calls when tools are offered)
 class ElevenLabConfig:
     ID: str = "XB0fDUnXU5powFXDhCwa"
     NAME: str = "Charlotte"
@@ -63,6 +65,72 @@ class OpenaiEmbeddingConfig:
 class HuggingFaceEmbeddingConfig:
     """Embedding model configuration"""
     MODEL: str = "Snowflake/snowflake-arctic-embed-l-v2.0" # change to any model of your choice, must be `sentence-transformers` compatible
+    EMBED_BATCH_SIZE: int = 64 # texts embedded per forward pass, the chunks of the fetched pages are embedded in one batch
+
+
+class ToolExecutionConfig:
+    """Limits for running the tools called by the llm"""
+    MAX_CONCURRENCY: int = 4  # tools of one llm response that may run at the same time
+    MAX_WORKERS: int = 8  # threads used to run blocking tools
+    ISOLATED_LOOPS: int = 2  # event loop threads for async tools registered with isolated=True
+    HTTP_TIMEOUT: float = 10  # seconds for a single http request of a tool, capped by the deadline of the tool call
+    DEFAULT_TIMEOUT: float = 60  # seconds before a tool call is abandoned
+    TIMEOUTS: dict[str, float] = {  # per tool overrides of DEFAULT_TIMEOUT
+        "conduct_research": 600,
+        "fetch_link_content": 30,
+    }
+
+class HttpConfig:
+    """Shared http client of the tools (DataManager.http), the timeout is ToolExecutionConfig.HTTP_TIMEOUT"""
+    RETRIES: int = 2  # retries of failed connections and of 429/5xx responses to idempotent requests, within the timeout
+    BACKOFF: float = 0.3  # seconds before the first retry, doubled after each one
+    MAX_PER_HOST: int = 4  # requests running against one host at the same time (and connections kept alive to it)
+    POOL_HOSTS: int = 16  # hosts the connections are kept alive to
+    REVALIDATE_SIZE: int = 128  # GET responses with an ETag or Last-Modified kept to revalidate them with a conditional request, 0 disables it
+
+class WebFetchConfig:
+    """Pages downloaded by fetch_link_content"""
+    MAX_BYTES: int = 2 * 1024 * 1024  # of a single page, the rest is not downloaded
+    MAX_CHARACTERS: int = 100_000  # of text read from a page, the download stops once it is reached
+    WORKERS: int = 4  # pages downloaded and chunked at the same time
+    TOP_K: int = 2  # most relevant chunks returned from all the pages
+    CANDIDATES: int = 64  # chunks with the best BM25 score that are embedded and reranked, 0 embeds every chunk
+    LEXICAL_WEIGHT: float = 0.3  # share of the BM25 score in the rerank, the rest is the embedding similarity
+    PAGE_TTL: float = 600  # seconds the chunks of a page are kept, reading it again with another query skips the download
+    PAGE_CACHE_SIZE: int = 32  # pages whose chunks are kept in memory
+
+class ChunkStoreConfig:
+    """Embeddings of the chunks of fetched pages, reused when the same text is read again"""
+    ENABLED: bool = True
+    DIRECTORY: str = "chunk_embeddings"  # memory mapped vectors and their index, in CACHE_DIRECTORY
+    MAX_CHUNKS: int = 50_000  # the least recently used chunks are replaced above it
+
+class ToolCacheConfig:
+    """Results of the read only tools registered with cache=ttl, the ttls are set on the tools"""
+    ENABLED: bool = True
+    MAX_SIZE: int = 256  # results kept in memory
+    PERSIST: bool = True  # also keep the results in a SQLite file in CACHE_DIRECTORY, so they survive restarts
+    FILE: str = "tool_cache.db"
+
+class SandboxConfig:
+    """Warm worker processes that run the code of execute_code"""
+    WORKERS: int = 2  # processes started by the first execute_code call, a call waits for a free one
+    MODULES: dict[str, str] = {"math": "math", "statistics": "statistics", "numpy": "np"}  # imported by every worker and available without an import, missing modules are skipped
+    MEMORY_LIMIT_MB: int = 1024  # resident memory of a worker running code, it is killed and replaced above it, 0 disables it
+    CPU_LIMIT: float = 10  # seconds of cpu time per call
+    MAX_OUTPUT: int = 10_000  # characters of stdout and of each variable returned to the llm
+
+class GmailConfig:
+    """Gmail api access of the email listing and labeling tools"""
+    API_URL: str = "https://gmail.googleapis.com"  # point it to a local fake of the api to test the tools
+    BATCH_SIZE: int = 50  # messages fetched per batch request, gmail throttles batches above 50
+    WORKERS: int = 4  # batch requests sent at the same time
+    METADATA_HEADERS: tuple[str, ...] = ("From", "To", "Subject", "Date")  # headers fetched for the email summaries
+
+
+class WeatherConfig:
+    """Meteosource api of the weather tools"""
+    API_URL: str = "https://www.meteosource.com/api/v1/free"  # point it to a local fake of the api to test the tools
 
 
 class HOTKEYS:
@@ -92,10 +160,74 @@ class FEATURES:
     PASTEBIN: bool = True
     GPT_RESEARCHER: bool = True
 
+class ToolLoadingConfig:
+    """How the feature modules in scripts/ are loaded"""
+    LAZY: bool = True  # import a module only when one of its tools is first called, tools are described by a cached manifest
+    WARMUP: list[str] = ["weather", "wikipedia", "llm_workflow", "python"]  # lazy modules imported in the background at startup
+    MAX_WORKERS: int = 4  # threads used to import modules
+
+class BootConfig:
+    """Startup of the assistant"""
+    PARALLEL: bool = True  # initialize the TTS engine, the STT model and the LLM with its embedding model at the same time
+    TIMELINE_FILE: str = "boot_timeline.json"  # chrome trace of the startup phases, written to CACHE_DIRECTORY
+
+class ConversationStoreConfig:
+    """Conversations saved on disk so they survive a restart"""
+    ENABLED: bool = True
+    FILE: str = "conversations.db"  # SQLite database in CACHE_DIRECTORY
+    RESUME: bool = True  # continue the last conversation after a restart
+    BATCH_SIZE: int = 64  # messages written per transaction
+    FLUSH_INTERVAL: float = 1.0  # seconds a message can wait before it is written
+
+class LatencyConfig:
+    """Per turn latency breakdown of the voice pipeline"""
+    MAX_TURNS: int = 100  # number of recent turns to keep
+    DUMP_FILE: str = "latency.json"  # written to CACHE_DIRECTORY on exit and by the get_latency_report tool
+
 CACHE_DIRECTORY = "./cache"  # Directory for index persistence
 
 Top_K_Retriever = -1 # Number of top documents to retrieve when querying for tools. use -1 to retrieve all tools.
 
+class RetrievalCacheConfig:
+    """Cache of the tools retrieved for a query, avoids embedding the same message again"""
+    MAX_SIZE: int = 256  # number of queries to remember
+    TTL: float = 3600  # seconds before a cached retrieval expires
+
+class PlanningRouterConfig:
+    """Skips the planning llm call of thinking_mode for simple requests (opt-in). The direct turns keep the planning
+    system prompt, the start of every prompt stays the same for the prompt cache, and are only told to answer directly"""
+    ENABLED: bool = False
+    THRESHOLD: float = 0.7  # similarity to the direct examples needed to skip planning, lower skips more
+    K: int = 3  # nearest examples compared per label
+    LOG_FILE: str = "planning_router.jsonl"  # decisions appended in CACHE_DIRECTORY
+
+class PromptCacheConfig:
+    """Keeps the start of the prompts identical between llm calls so the provider can cache it"""
+    HISTORY_SLACK: int = 2  # user turns the history may grow over MAX_MESSAGE_HISTORY before the oldest are dropped
+
+class ResponseCacheConfig:
+    """Answers reused for spoken queries that mean the same as a recent one (opt-in)"""
+    ENABLED: bool = False
+    FILE: str = "response_cache.json"  # persisted in CACHE_DIRECTORY
+    SIMILARITY_THRESHOLD: float = 0.95  # cosine similarity of the query embeddings to reuse an answer
+    MAX_SIZE: int = 256  # number of answers to remember
+    NO_TOOL_TTL: float = 3600  # seconds an answer without tool calls stays fresh
+    SHORT_QUERY_WORDS: int = 4  # shorter queries ("yes", "why?") are only reused within the same conversation
+    SAVE_DELAY: float = 5.0  # seconds after a change the cache file is written, on a background thread
+    DEFAULT_TOOL_TTL: float = 0  # tools that are not listed below, 0 means answers using them are not cached
+    TOOL_TTLS: dict[str, float] = {  # the answer expires with the most volatile tool it used
+        "get_weather": 600,
+        "get_weekly_forecast": 1800,
+        "get_user_location": 3600,
+        "get_unread_emails": 60,
+        "get_email_count": 60,
+        "get_important_emails": 60,
+        "get_starred_emails": 60,
+        "search_emails": 60,
+        "wikipedia_summary": 86400,
+        "wikipedia_search": 86400,
+    }
+
 
 
 
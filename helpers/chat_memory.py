@@ -0,0 +1,93 @@
+from collections import deque
+from typing import Callable, Iterable, TYPE_CHECKING
+
+from llama_index.core.llms import ChatMessage, MessageRole
+
+if TYPE_CHECKING:
+    from helpers.conversation_store import ConversationStore
+
+
+class RollingChatMemory:
+    """Chat history that keeps the last N user turns, optionally within a token budget.
+
+    Messages are kept in a deque together with the positions of the user messages (the turn boundaries), so
+    dropping old turns only pops from the left of the deques. The history is only ever cut right before a user
+    message, which keeps the assistant tool calls and their tool results together.
+    System messages that are cut off are kept in front of the history.
+    New messages, except system messages, are also appended to the store if one is given. Prompts built from a
+    template are saved with the text of the user instead (saved_content), or not at all (save=False).
+    """
+    def __init__(self, chat_history: Iterable[ChatMessage] | None = None, token_limit: int | None = None,
+                 tokenizer: Callable[[str], list] | None = None, store: "ConversationStore | None" = None):
+        self.token_limit = token_limit # None means no token budget
+        self.tokenizer = tokenizer
+        self.store = store
+        self.system_messages: list[ChatMessage] = [] # system messages that were trimmed from the history
+        self.messages: deque[ChatMessage] = deque()
+        self.token_counts: deque[int] = deque() # token count of every message in messages
+        self.user_positions: deque[int] = deque() # absolute positions of the user messages
+        self.offset = 0 # absolute position of messages[0]
+        self.token_count = 0 # tokens in messages and system_messages
+        for message in chat_history or []: # already stored
+            self._append(message)
+
+    def count_tokens(self, message: ChatMessage) -> int:
+        if self.tokenizer is None:
+            return 0
+        text = message.content or ""
+        tool_calls = message.additional_kwargs.get("tool_calls")
+        if tool_calls:
+            text += str(tool_calls)
+        return len(self.tokenizer(text))
+
+    def put(self, message: ChatMessage, saved_content: str | None = None, save: bool = True):
+        self._append(message)
+        if self.store is not None and save and message.role != MessageRole.SYSTEM:
+            if saved_content is not None:
+                message = ChatMessage(role=message.role, content=saved_content,
+                                      additional_kwargs=message.additional_kwargs)
+            self.store.append(message)
+
+    def _append(self, message: ChatMessage):
+        if message.role == MessageRole.USER:
+            self.user_positions.append(self.offset + len(self.messages))
+        tokens = self.count_tokens(message)
+        self.messages.append(message)
+        self.token_counts.append(tokens)
+        self.token_count += tokens
+
+    def get(self) -> list[ChatMessage]:
+        """Returns the chat history, the oldest turns are dropped first if it is over the token budget."""
+        if self.token_limit is not None:
+            while self.token_count > self.token_limit and len(self.user_positions) > 1:
+                self._drop_until(self.user_positions[1])
+        return self.system_messages + list(self.messages)
+
+    def trim(self, n: int, slack: int = 0):
+        """Keeps the last n user messages and everything after them, and all the system messages.
+        Nothing is dropped until there are more than n + slack user messages."""
+        if len(self.user_positions) <= n + slack:
+            return
+        self._drop_until(self.user_positions[-n] if n else self.offset + len(self.messages))
+
+    def _drop_until(self, position: int):
+        """Drops the messages before the absolute position."""
+        while self.offset < position:
+            message = self.messages.popleft()
+            tokens = self.token_counts.popleft()
+            self.offset += 1
+            if message.role == MessageRole.SYSTEM:
+                self.system_messages.append(message)
+            else:
+                self.token_count -= tokens
+        while self.user_positions and self.user_positions[0] < position:
+            self.user_positions.popleft()
+
+    def reset(self, chat_history: Iterable[ChatMessage] | None = None):
+        """Clears the history, the store starts a new session."""
+        self.__init__(chat_history, token_limit=self.token_limit, tokenizer=self.tokenizer, store=self.store)
+        if self.store is not None:
+            self.store.new_session()
+
+    def __len__(self):
+        return len(self.system_messages) + len(self.messages)
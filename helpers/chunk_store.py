@@ -0,0 +1,146 @@
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+
+import numpy as np
+
+from helpers.tool_retriever import normalize
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT NOT NULL);
+CREATE TABLE IF NOT EXISTS chunks (hash TEXT PRIMARY KEY, row INTEGER NOT NULL, last_used REAL NOT NULL);
+CREATE INDEX IF NOT EXISTS chunks_last_used ON chunks (last_used);
+"""
+
+
+def chunk_hash(model_name: str, text: str) -> str:
+    return hashlib.sha256(f"{model_name}\0{text}".encode("utf-8", "surrogatepass")).hexdigest()
+
+
+class ChunkEmbeddingStore:
+    """Content addressed store of chunk embeddings, so a page that is read again is not embedded again.
+
+    A chunk is keyed by the sha256 of the embedding model name and its text. The normalized vectors are rows of a
+    memory mapped .npy file that grows by doubling up to max_chunks rows, a SQLite index maps every hash to its row
+    and the time it was last used. Above max_chunks the least recently used rows are reused. Changing the
+    embedding model clears the store, the vectors of different models have different sizes.
+    """
+    VECTORS_FILE = "vectors.npy"
+    INDEX_FILE = "index.db"
+    INITIAL_ROWS = 1024
+
+    def __init__(self, directory: str, max_chunks: int = 50_000):
+        self.directory = directory
+        self.max_chunks = max_chunks
+        self.hits = 0
+        self.misses = 0
+        self.vectors: np.memmap | None = None
+        self._lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+        self._vectors_path = os.path.join(directory, self.VECTORS_FILE)
+        self._index_path = os.path.join(directory, self.INDEX_FILE)
+        self._connection = sqlite3.connect(self._index_path, check_same_thread=False, isolation_level=None)
+        self._connection.execute("PRAGMA journal_mode=WAL")
+        self._connection.executescript(SCHEMA)
+        self.model_name = self._meta("model")
+        if self.model_name and os.path.exists(self._vectors_path):
+            self.vectors = np.load(self._vectors_path, mmap_mode="r+")
+        self.rows = self._connection.execute("SELECT COALESCE(MAX(row) + 1, 0) FROM chunks").fetchone()[0]
+
+    def _meta(self, key: str) -> str | None:
+        row = self._connection.execute("SELECT value FROM meta WHERE key = ?", (key,)).fetchone()
+        return row[0] if row else None
+
+    def _reset(self, model_name: str, dimensions: int):
+        """Starts an empty store for the model."""
+        self._connection.execute("DELETE FROM chunks")
+        self._connection.execute("INSERT OR REPLACE INTO meta (key, value) VALUES ('model', ?)", (model_name,))
+        self.model_name = model_name
+        self.rows = 0
+        self._allocate(min(self.INITIAL_ROWS, self.max_chunks), dimensions)
+
+    def _allocate(self, capacity: int, dimensions: int):
+        """Creates the vectors file with room for capacity rows, copying the rows that are in use."""
+        vectors = np.lib.format.open_memmap(self._vectors_path + ".tmp", mode="w+", dtype=np.float32,
+                                            shape=(capacity, dimensions))
+        if self.vectors is not None and self.vectors.shape[1] == dimensions and self.rows:
+            vectors[:self.rows] = self.vectors[:self.rows]
+        vectors.flush()
+        del vectors
+        self.vectors = None # the old map has to be closed before the file is replaced on windows
+        os.replace(self._vectors_path + ".tmp", self._vectors_path)
+        self.vectors = np.load(self._vectors_path, mmap_mode="r+")
+
+    def _free_rows(self, count: int) -> list[int]:
+        """Rows for count new chunks, grows the file or evicts the least recently used chunks."""
+        capacity = len(self.vectors)
+        if self.rows + count > capacity and capacity < self.max_chunks:
+            self._allocate(min(self.max_chunks, max(capacity * 2, self.rows + count)), self.vectors.shape[1])
+            capacity = len(self.vectors)
+        new = list(range(self.rows, min(capacity, self.rows + count)))
+        self.rows += len(new)
+        if len(new) < count:
+            evicted = self._connection.execute("SELECT hash, row FROM chunks ORDER BY last_used LIMIT ?",
+                                               (count - len(new),)).fetchall()
+            self._connection.executemany("DELETE FROM chunks WHERE hash = ?", [(h,) for h, _ in evicted])
+            new += [row for _, row in evicted]
+        return new
+
+    def embeddings(self, texts: list[str], embed_model) -> np.ndarray:
+        """Returns the normalized embeddings of the texts, only the texts that are not stored yet are embedded (in
+        one batch)."""
+        model_name = getattr(embed_model, "model_name", type(embed_model).__name__)
+        hashes = [chunk_hash(model_name, text) for text in texts]
+        vectors: dict[str, np.ndarray] = {}
+        with self._lock:
+            if model_name == self.model_name and self.vectors is not None:
+                unique = list(set(hashes))
+                for start in range(0, len(unique), 500): # stay below the sqlite variable limit
+                    batch = unique[start:start + 500]
+                    rows = self._connection.execute(
+                        f"SELECT hash, row FROM chunks WHERE hash IN ({','.join('?' * len(batch))})", batch).fetchall()
+                    vectors.update((h, np.array(self.vectors[row])) for h, row in rows)
+                self._connection.executemany("UPDATE chunks SET last_used = ? WHERE hash = ?",
+                                             [(time.time(), h) for h in vectors])
+            hits = sum(h in vectors for h in hashes)
+            self.hits += hits
+            self.misses += len(hashes) - hits
+        missing = list(dict.fromkeys(h for h in hashes if h not in vectors))
+        if missing: # embedded outside the lock, other calls can read the store meanwhile
+            texts_by_hash = dict(zip(hashes, texts))
+            new_vectors = normalize(np.asarray(
+                embed_model.get_text_embedding_batch([texts_by_hash[h] for h in missing]), dtype=np.float32))
+            vectors.update(zip(missing, new_vectors))
+            with self._lock:
+                if model_name != self.model_name or self.vectors is None or self.vectors.shape[1] != new_vectors.shape[1]:
+                    self._reset(model_name, new_vectors.shape[1])
+                new = [(h, vectors[h]) for h in missing if not self._connection.execute(
+                    "SELECT 1 FROM chunks WHERE hash = ?", (h,)).fetchone()] # not stored by a concurrent call
+                rows = self._free_rows(len(new)) # fewer than new above max_chunks, the rest is not stored
+                if rows:
+                    self.vectors[rows] = np.stack([vector for _, vector in new[:len(rows)]])
+                    self.vectors.flush()
+                now = time.time()
+                self._connection.executemany("INSERT INTO chunks (hash, row, last_used) VALUES (?, ?, ?)",
+                                             [(h, row, now) for (h, _), row in zip(new, rows)])
+        if not hashes:
+            return np.zeros((0, 0), dtype=np.float32)
+        return np.stack([vectors[h] for h in hashes])
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        files = (self._vectors_path, self._index_path, self._index_path + "-wal")
+        return {
+            "chunks": self._connection.execute("SELECT COUNT(*) FROM chunks").fetchone()[0],
+            "max_chunks": self.max_chunks,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "bytes_on_disk": sum(os.path.getsize(path) for path in files if os.path.exists(path)),
+        }
+
+    def close(self):
+        self.vectors = None
+        self._connection.close()
@@ -0,0 +1,156 @@
+import queue
+import sqlite3
+import threading
+import time
+
+from llama_index.core.llms import ChatMessage
+
+from logger import app_logger as logging
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS sessions (id INTEGER PRIMARY KEY, started REAL NOT NULL);
+CREATE TABLE IF NOT EXISTS messages (
+    id INTEGER PRIMARY KEY,
+    session INTEGER NOT NULL,
+    created REAL NOT NULL,
+    role TEXT NOT NULL,
+    content TEXT NOT NULL,
+    message TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS user_messages ON messages (session, id) WHERE role = 'user';
+"""
+FTS_SCHEMA = """
+CREATE VIRTUAL TABLE IF NOT EXISTS messages_fts USING fts5(content, content='messages', content_rowid='id');
+CREATE TRIGGER IF NOT EXISTS messages_fts_insert AFTER INSERT ON messages BEGIN
+    INSERT INTO messages_fts (rowid, content) VALUES (new.id, new.content);
+END;
+"""
+
+
+class ConversationStore:
+    """Append only conversation log in a SQLite database (WAL mode).
+
+    Messages are queued by append and written in batches by a background thread, so the event loop never waits
+    for the disk. Every conversation reset starts a new session, resuming only loads the last user turns of the
+    latest session. The message text is indexed with FTS5 (when sqlite is built with it) for search.
+    """
+    def __init__(self, path: str, batch_size: int = 64, flush_interval: float = 1.0, resume: bool = True):
+        self.path = path
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval # seconds a message can wait in the queue
+        self._connection = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._connection.execute("PRAGMA journal_mode=WAL")
+        self._connection.execute("PRAGMA synchronous=NORMAL")
+        self._connection.executescript(SCHEMA)
+        try:
+            self._connection.executescript(FTS_SCHEMA)
+            self.full_text_search = True
+        except sqlite3.OperationalError:
+            logging.warning("SQLite is built without FTS5, searching the conversations falls back to LIKE.")
+            self.full_text_search = False
+        self._lock = threading.Lock() # the connection is shared by the writer thread and the callers
+        self.session = self._latest_session() if resume else None
+        if self.session is None:
+            self.new_session()
+        self._queue: queue.Queue = queue.Queue()
+        self._writer = threading.Thread(target=self._write_loop, name="conversation_store", daemon=True)
+        self._writer.start()
+
+    def _latest_session(self) -> int | None:
+        with self._lock:
+            return self._connection.execute("SELECT MAX(id) FROM sessions").fetchone()[0]
+
+    def new_session(self) -> int:
+        """Starts a new conversation, the next resume won't load the messages before it."""
+        with self._lock:
+            self.session = self._connection.execute("INSERT INTO sessions (started) VALUES (?)", (time.time(),)).lastrowid
+        return self.session
+
+    def append(self, message: ChatMessage):
+        """Queues the message to be written to the current session."""
+        self._queue.put((self.session, time.time(), message))
+
+    def _write_loop(self):
+        while True:
+            batch = [self._queue.get()]
+            deadline = time.monotonic() + self.flush_interval
+            while len(batch) < self.batch_size and batch[-1] is not None:
+                try:
+                    batch.append(self._queue.get(timeout=max(0.0, deadline - time.monotonic())))
+                except queue.Empty:
+                    break
+            closing = batch[-1] is None
+            messages = batch[:-1 if closing else None]
+            try:
+                rows = [
+                    (session, created, message.role.value, message.content or "", message.model_dump_json())
+                    for session, created, message in messages
+                ]
+                with self._lock:
+                    self._connection.execute("BEGIN") # one transaction per batch
+                    try:
+                        self._connection.executemany(
+                            "INSERT INTO messages (session, created, role, content, message) VALUES (?, ?, ?, ?, ?)", rows)
+                        self._connection.execute("COMMIT")
+                    except sqlite3.Error:
+                        self._connection.execute("ROLLBACK")
+                        raise
+            except Exception as e: # a message that can't be serialized or a database error, the writer keeps running
+                logging.error(f"Failed to save {len(messages)} messages: {e}")
+            finally:
+                for _ in batch:
+                    self._queue.task_done()
+            if closing:
+                return
+
+    def flush(self):
+        """Waits until the queued messages are written."""
+        self._queue.join()
+
+    def load_tail(self, n: int) -> list[ChatMessage]:
+        """Returns the messages of the current session from its last n user messages, reads only those rows."""
+        self.flush()
+        with self._lock:
+            row = self._connection.execute(
+                "SELECT id FROM messages WHERE session = ? AND role = 'user' ORDER BY id DESC LIMIT 1 OFFSET ?",
+                (self.session, max(n, 1) - 1)).fetchone()
+            if row is None: # fewer than n user messages, load the whole session
+                row = self._connection.execute(
+                    "SELECT id FROM messages WHERE session = ? AND role = 'user' ORDER BY id LIMIT 1",
+                    (self.session,)).fetchone()
+            if row is None or n == 0:
+                return []
+            rows = self._connection.execute(
+                "SELECT message FROM messages WHERE id >= ? AND session = ? ORDER BY id", (row[0], self.session)).fetchall()
+        return [ChatMessage.model_validate_json(message) for message, in rows]
+
+    def search(self, query: str, limit: int = 10) -> list[dict]:
+        """Returns the user and assistant messages of all sessions matching the query, best matches first.
+        Every word of the query is quoted as an FTS phrase, so operators and punctuation are matched as text."""
+        if not query.strip():
+            return []
+        self.flush()
+        with self._lock:
+            if self.full_text_search:
+                terms = " ".join('"' + term.replace('"', '""') + '"' for term in query.split())
+                rows = self._connection.execute(
+                    "SELECT messages.session, messages.created, messages.role, messages.content FROM messages_fts "
+                    "JOIN messages ON messages.id = messages_fts.rowid "
+                    "WHERE messages_fts MATCH ? AND messages.role IN ('user', 'assistant') "
+                    "ORDER BY bm25(messages_fts) LIMIT ?", (terms, limit)).fetchall()
+            else:
+                rows = self._connection.execute(
+                    "SELECT session, created, role, content FROM messages "
+                    "WHERE content LIKE ? AND role IN ('user', 'assistant') ORDER BY id DESC LIMIT ?",
+                    (f"%{query}%", limit)).fetchall()
+        return [{"session": session, "created": created, "role": role, "content": content}
+                for session, created, role, content in rows]
+
+    def close(self):
+        """Writes the queued messages and closes the database."""
+        if self._writer.is_alive():
+            self._queue.put(None)
+            self._writer.join()
+        with self._lock:
+            self._connection.close()
+
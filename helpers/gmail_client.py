@@ -0,0 +1,217 @@
+"""Gmail api access for listings and label changes, with batch requests instead of one request per message."""
+import contextvars
+import json
+import re
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from email.utils import parsedate_to_datetime
+from typing import Callable, Iterable
+
+from helpers.http_client import HttpClient
+from logger import app_logger as logging
+
+RETRY_STATUSES = frozenset({429, 500, 502, 503, 504})
+MAX_MODIFY_IDS = 1000 # limit of batchModify
+MAX_LIST_RESULTS = 500 # limit of messages.list
+BLANK_LINE = re.compile(rb"\r?\n\r?\n")
+
+
+def parse_batch_response(content_type: str, body: bytes) -> dict[int, tuple[int, dict]]:
+    """Splits a multipart/mixed batch response into (status, json body) by the index of the request."""
+    boundary = re.search(r'boundary="?([^";]+)"?', content_type or "")
+    if not boundary:
+        raise ValueError(f"Not a batch response: {content_type}")
+    results = {}
+    for part in body.split(b"--" + boundary.group(1).encode())[1:]:
+        if part.startswith(b"--"): # the closing boundary
+            break
+        # the headers of the part, then the http response: status line, headers and the json body
+        sections = BLANK_LINE.split(part.lstrip(b"\r\n"), maxsplit=2)
+        if len(sections) < 2:
+            continue
+        index = re.search(rb"Content-ID:\s*<response-item(\d+)>", sections[0], re.IGNORECASE)
+        status = re.match(rb"HTTP/[\d.]+ (\d+)", sections[1])
+        if not index or not status:
+            continue
+        payload = sections[2].strip() if len(sections) > 2 else b""
+        results[int(index.group(1))] = (int(status.group(1)), json.loads(payload) if payload else {})
+    return results
+
+
+def credentials_token(creds) -> str:
+    """The access token of OAuth credentials, refreshed first if it expired. Works with the oauth2client credentials
+    of the pinned simplegmail fork (access_token) and with google-auth credentials (token)."""
+    if hasattr(creds, "access_token_expired"): # oauth2client
+        if creds.access_token_expired:
+            from httplib2 import Http
+            creds.refresh(Http())
+        return creds.access_token
+    if not creds.valid:
+        from google.auth.transport.requests import Request
+        creds.refresh(Request())
+    return creds.token
+
+
+def message_summary(message: dict, label_names: dict[str, str]) -> dict:
+    """The fields of a metadata message the email tools return, like snip does for a full simplegmail Message."""
+    payload = message.get("payload", {})
+    headers = {header["name"].lower(): header["value"] for header in payload.get("headers", [])}
+    date = headers.get("date", "")
+    try:
+        date = str(parsedate_to_datetime(date).astimezone())
+    except (TypeError, ValueError):
+        pass
+    return {
+        "id": message["id"],
+        "thread_id": message.get("threadId", ""),
+        "recipient": headers.get("to", ""),
+        "sender": headers.get("from", ""),
+        "subject": headers.get("subject", ""),
+        "date": date,
+        "snippet": message.get("snippet", ""),
+        "labels": [label_names.get(label_id, label_id) for label_id in message.get("labelIds", [])],
+        # metadata fetches do not include the parts, a multipart/mixed message has attachments
+        "has_attachments": payload.get("mimeType") == "multipart/mixed",
+    }
+
+
+class GmailClient:
+    """Reads and labels messages through the Gmail REST api with the shared http client.
+
+    Listings fetch the ids with messages.list and then only the metadata (headers, labels, snippet) of the messages,
+    batch_size messages per batch request and up to workers batch requests at the same time, every worker parses
+    the response of its batch. Messages of a batch answered with 429/5xx are sent again in the next batch.
+    Label changes of any number of messages are one batchModify request per MAX_MODIFY_IDS messages.
+
+    token returns a valid OAuth access token, api_url can point to a local fake of the api.
+    """
+    def __init__(self, http: HttpClient, token: Callable[[], str], api_url: str = "https://gmail.googleapis.com",
+                 user_id: str = "me", batch_size: int = 50, workers: int = 4,
+                 metadata_headers: Iterable[str] = ("From", "To", "Subject", "Date"), retries: int = 2,
+                 backoff: float = 0.5):
+        self.http = http
+        self.token = token
+        self.api_url = api_url.rstrip("/")
+        self.user_id = user_id
+        self.batch_size = batch_size
+        self.metadata_headers = tuple(metadata_headers)
+        self.retries = retries
+        self.backoff = backoff
+        self.requests = 0
+        self._pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="gmail")
+        self._label_names: dict[str, str] | None = None
+        self._lock = threading.Lock()
+
+    def _count(self):
+        with self._lock:
+            self.requests += 1
+
+    def _call(self, method: str, path: str, **kwargs) -> dict:
+        """Sends one api request for the user, returns its json body."""
+        self._count()
+        response = self.http.request(method, f"{self.api_url}/gmail/v1/users/{self.user_id}/{path}",
+                                     headers={"Authorization": f"Bearer {self.token()}"}, **kwargs)
+        response.raise_for_status()
+        return response.json() if response.content else {}
+
+    def list_ids(self, query: str | None = None, label_ids: Iterable[str] = (), max_results: int = 10,
+                 include_spam_trash: bool = False) -> list[str]:
+        """The ids of the newest max_results messages matching the query and having all the labels."""
+        ids, page_token = [], None
+        while len(ids) < max_results:
+            params = {"maxResults": min(max_results - len(ids), MAX_LIST_RESULTS), "labelIds": list(label_ids),
+                      "includeSpamTrash": str(include_spam_trash).lower()}
+            if query:
+                params["q"] = query
+            if page_token:
+                params["pageToken"] = page_token
+            page = self._call("GET", "messages", params=params)
+            ids += [message["id"] for message in page.get("messages", [])]
+            page_token = page.get("nextPageToken")
+            if not page_token:
+                break
+        return ids[:max_results]
+
+    def draft_message_ids(self, max_results: int = 10) -> list[str]:
+        """The message ids of the newest max_results drafts."""
+        drafts = self._call("GET", "drafts", params={"maxResults": min(max_results, MAX_LIST_RESULTS)})
+        return [draft["message"]["id"] for draft in drafts.get("drafts", [])][:max_results]
+
+    def _batch(self, paths: list[str]) -> dict[int, tuple[int, dict]]:
+        """Sends the GET requests of paths (relative to the user) as one batch request."""
+        boundary = f"batch_{uuid.uuid4().hex}"
+        parts = [f"--{boundary}\r\nContent-Type: application/http\r\nContent-ID: <item{i}>\r\n\r\n"
+                 f"GET /gmail/v1/users/{self.user_id}/{path}\r\n\r\n" for i, path in enumerate(paths)]
+        self._count()
+        response = self.http.post(f"{self.api_url}/batch/gmail/v1", data="".join(parts) + f"--{boundary}--\r\n",
+                                  headers={"Authorization": f"Bearer {self.token()}",
+                                           "Content-Type": f"multipart/mixed; boundary={boundary}"})
+        response.raise_for_status()
+        return parse_batch_response(response.headers.get("Content-Type"), response.content)
+
+    def _metadata_batch(self, ids: list[str]) -> dict[str, dict]:
+        """The metadata of the messages by id, retrying the ones that were throttled."""
+        headers = "".join(f"&metadataHeaders={header}" for header in self.metadata_headers)
+        messages, pending = {}, list(ids)
+        for attempt in range(self.retries + 1):
+            results = self._batch([f"messages/{message_id}?format=metadata{headers}" for message_id in pending])
+            retry = []
+            for i, message_id in enumerate(pending):
+                status, body = results.get(i, (500, {}))
+                if status == 200:
+                    messages[message_id] = body
+                elif status in RETRY_STATUSES:
+                    retry.append(message_id)
+                else: # deleted meanwhile, skipped like the tools skip missing messages
+                    logging.warning(f"Could not get the email {message_id}: {status} {body.get('error', '')}")
+            if not retry:
+                break
+            if attempt == self.retries:
+                logging.warning(f"Gave up on {len(retry)} throttled emails")
+                break
+            pending = retry
+            time.sleep(self.backoff * 2 ** attempt)
+        return messages
+
+    def get_metadata(self, ids: list[str]) -> list[dict]:
+        """The metadata messages of the ids in the same order, fetched in concurrent batches."""
+        batches = [ids[start:start + self.batch_size] for start in range(0, len(ids), self.batch_size)]
+        futures = [self._pool.submit(contextvars.copy_context().run, self._metadata_batch, batch)
+                   for batch in batches]
+        messages = {}
+        for future in futures:
+            messages.update(future.result())
+        return [messages[message_id] for message_id in ids if message_id in messages]
+
+    def label_names(self, refresh: bool = False) -> dict[str, str]:
+        """Label id -> name, fetched once unless refresh is set."""
+        if self._label_names is None or refresh:
+            labels = self._call("GET", "labels").get("labels", [])
+            self._label_names = {label["id"]: label["name"] for label in labels}
+        return self._label_names
+
+    def label_id(self, name: str) -> str:
+        """The id of a label by its name or id, system labels have their name as id."""
+        names = self.label_names()
+        if name in names:
+            return name
+        return next((label_id for label_id, label_name in names.items() if label_name.lower() == name.lower()), name)
+
+    def summaries(self, ids: list[str]) -> list[dict]:
+        """message_summary of every message, in the order of the ids."""
+        if not ids:
+            return []
+        label_names = self.label_names()
+        return [message_summary(message, label_names) for message in self.get_metadata(ids)]
+
+    def modify(self, ids: list[str], add: Iterable[str] = (), remove: Iterable[str] = ()):
+        """Adds and removes labels of all the messages, one request per MAX_MODIFY_IDS messages."""
+        for start in range(0, len(ids), MAX_MODIFY_IDS):
+            self._call("POST", "messages/batchModify", json={
+                "ids": ids[start:start + MAX_MODIFY_IDS], "addLabelIds": list(add), "removeLabelIds": list(remove)})
+
+    def message_count(self, label_id: str) -> int:
+        """The number of messages with the label, from the label itself instead of listing its messages."""
+        return self._call("GET", f"labels/{label_id}").get("messagesTotal", 0)
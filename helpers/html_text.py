@@ -0,0 +1,116 @@
+"""Streaming html to text extraction, reads a page chunk by chunk instead of parsing the whole document."""
+import codecs
+import re
+from html.parser import HTMLParser
+from typing import Iterable, Iterator
+
+# their content is never text a user asked for
+SKIPPED_TAGS = frozenset({
+    "script", "style", "noscript", "template", "svg", "canvas", "iframe", "nav", "footer", "aside", "form", "button",
+    "select", "head",
+})
+# the text of one of them is a paragraph
+BLOCK_TAGS = frozenset({
+    "p", "div", "section", "article", "main", "header", "blockquote", "pre", "li", "ul", "ol", "dl", "dt", "dd",
+    "table", "tr", "td", "th", "caption", "figure", "figcaption", "h1", "h2", "h3", "h4", "h5", "h6", "br", "hr",
+    "title", "address", "details", "summary",
+})
+VOID_TAGS = frozenset({"area", "base", "br", "col", "embed", "hr", "img", "input", "link", "meta", "source", "track", "wbr"})
+CHARSET = re.compile(rb"""<meta[^>]+charset=["']?([\w-]+)""", re.IGNORECASE)
+
+
+class ParagraphExtractor(HTMLParser):
+    """Collects the text of the page as paragraphs, one per block element, skipping the SKIPPED_TAGS.
+
+    The title is kept although it is in the head. Whitespace in a paragraph is collapsed like a browser does.
+    """
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.paragraphs: list[str] = []
+        self._parts: list[str] = []
+        self._skipping = 0
+        self._title = False
+
+    def handle_starttag(self, tag, attrs):
+        if tag == "title":
+            self._title = True
+        elif tag == "body": # ends the head even when </head> is missing
+            self._skipping = 0
+        elif tag in SKIPPED_TAGS and tag not in VOID_TAGS:
+            self._skipping += 1
+        if tag in BLOCK_TAGS:
+            self._end_paragraph()
+
+    def handle_endtag(self, tag):
+        if tag == "title":
+            self._title = False
+        elif tag in SKIPPED_TAGS and self._skipping:
+            self._skipping -= 1
+        if tag in BLOCK_TAGS:
+            self._end_paragraph()
+
+    def handle_data(self, data):
+        if not self._skipping or self._title:
+            self._parts.append(data)
+
+    def _end_paragraph(self):
+        if self._parts:
+            paragraph = " ".join("".join(self._parts).split())
+            self._parts = []
+            if paragraph:
+                self.paragraphs.append(paragraph)
+
+    def close(self):
+        super().close()
+        self._end_paragraph()
+
+
+def page_encoding(content_type: str | None, start: bytes) -> str:
+    """The charset of the content type header, else of a meta tag in the start of the page, else utf-8."""
+    match = re.search(r"charset=[\"']?([\w-]+)", content_type or "", re.IGNORECASE) or CHARSET.search(start)
+    encoding = match.group(1) if match else "utf-8"
+    if isinstance(encoding, bytes):
+        encoding = encoding.decode("ascii")
+    try:
+        codecs.lookup(encoding)
+    except LookupError:
+        return "utf-8"
+    return encoding
+
+
+def stream_paragraphs(chunks: Iterable[bytes], content_type: str | None = None,
+                      max_characters: int | None = None) -> Iterator[str]:
+    """Yields the paragraphs of an html page while its chunks arrive.
+
+    Stops reading chunks once max_characters of text were yielded, the paragraph that crosses the budget is still
+    yielded whole. Only the current chunk and the unparsed end of the previous one are held in memory.
+    The encoding comes from content_type, else from a meta tag in the first kilobyte, else utf-8.
+    """
+    parser = ParagraphExtractor()
+
+    def parsed():
+        """Feeds the chunks to the parser, pausing after every chunk to hand out its paragraphs."""
+        decoder, start = None, b""
+        for chunk in chunks:
+            if decoder is None: # the meta charset is in the first kilobyte
+                start += chunk
+                if len(start) < 1024:
+                    continue
+                decoder = codecs.getincrementaldecoder(page_encoding(content_type, start))(errors="replace")
+                chunk, start = start, b""
+            parser.feed(decoder.decode(chunk))
+            yield
+        if decoder is None:
+            decoder = codecs.getincrementaldecoder(page_encoding(content_type, start))(errors="replace")
+        parser.feed(decoder.decode(start, final=True))
+        parser.close()
+        yield
+
+    characters = 0
+    for _ in parsed():
+        for paragraph in parser.paragraphs:
+            yield paragraph
+            characters += len(paragraph)
+            if max_characters is not None and characters >= max_characters:
+                return
+        parser.paragraphs.clear()
@@ -0,0 +1,244 @@
+"""Shared http client of the tools, keeps the connections to the hosts alive between tool calls."""
+import asyncio
+import json
+import threading
+import time
+import weakref
+from urllib.parse import urlsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+from requests.structures import CaseInsensitiveDict
+from urllib3.exceptions import ConnectTimeoutError
+
+from helpers.cache import LRUCache
+from helpers.tool_context import remaining_time
+
+try:
+    import httpx
+except ImportError: # the async methods fall back to the sync client on a thread
+    httpx = None
+
+RETRY_STATUSES = frozenset({429, 500, 502, 503, 504})
+IDEMPOTENT_METHODS = frozenset({"GET", "HEAD", "OPTIONS", "PUT", "DELETE"})
+MAX_REVALIDATED_SIZE = 1024 * 1024 # bytes, larger responses are not kept for revalidation
+VARY_HEADERS = ("Accept", "Accept-Language", "Authorization") # a kept response is only reused with the same values
+
+
+def not_sent(error: requests.ConnectionError) -> bool:
+    """The connection failed before the request was sent, so any request can be retried."""
+    reason = getattr(error.args[0] if error.args else None, "reason", None)
+    return isinstance(error, requests.ConnectTimeout) or isinstance(reason, ConnectTimeoutError)
+
+
+class HttpClient:
+    """Pooled http client with default timeouts, retries and a concurrency limit per host.
+
+    The sync methods use one requests.Session, so get_weather followed by get_weekly_forecast reuses the TLS
+    connection to the api instead of paying the handshake twice. The async methods use one httpx.AsyncClient per event
+    loop (the workflow loop and the isolated tool loops) and return httpx responses, which have the same basics
+    (status_code, text, content, json(), raise_for_status()). Without httpx they run the sync client on a thread.
+
+    Every request gets the timeout of the client unless it passes one, capped by the deadline of the running tool
+    call. The timeout covers the wait for a connection, the retries and their backoff: failed connections (and
+    failed reads, 429/5xx responses of idempotent requests) are retried with exponential backoff while time is left,
+    every attempt gets what is left, and a request out of time raises requests.Timeout (httpx.TimeoutException).
+    At most max_per_host requests run against one host at the same time, the others wait for a connection.
+
+    The last revalidate_size GET responses that came with an ETag or Last-Modified header are kept, by url, params
+    and VARY_HEADERS. Repeating such a request sends If-None-Match/If-Modified-Since and a 304 answer is turned back
+    into the kept response, so refreshing an expired tool result only transfers the headers when the data did not
+    change.
+    """
+    def __init__(self, timeout: float = 10, retries: int = 2, backoff: float = 0.3, max_per_host: int = 4,
+                 pool_hosts: int = 16, revalidate_size: int = 0):
+        self.timeout = timeout
+        self.retries = retries
+        self.backoff = backoff
+        self.max_per_host = max_per_host
+        self.pool_hosts = pool_hosts
+        self.session = requests.Session()
+        # retried in request, urllib3 would give every attempt the whole timeout
+        adapter = HTTPAdapter(pool_connections=pool_hosts, pool_maxsize=max_per_host)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+        self._host_limits: dict[str, threading.BoundedSemaphore] = {}
+        self._lock = threading.Lock()
+        # event loop -> its async client and the per host limits of the loop
+        self._async_clients: weakref.WeakKeyDictionary = weakref.WeakKeyDictionary()
+        # request -> (etag, last modified, status, headers, content) of its last response
+        self.validators = LRUCache(max_size=revalidate_size) if revalidate_size else None
+        self.revalidations = {"conditional": 0, "not_modified": 0}
+
+    def _host_limit(self, host: str) -> threading.BoundedSemaphore:
+        with self._lock:
+            if host not in self._host_limits:
+                self._host_limits[host] = threading.BoundedSemaphore(self.max_per_host)
+            return self._host_limits[host]
+
+    def _conditional(self, method: str, url: str, kwargs: dict) -> tuple[str | None, tuple | None]:
+        """Adds the validators of the kept response to the headers, returns the key and the kept response."""
+        if self.validators is None or method.upper() != "GET":
+            return None, None
+        headers = CaseInsensitiveDict(kwargs.get("headers") or {})
+        vary = {name: headers[name] for name in VARY_HEADERS if headers.get(name) is not None}
+        key = json.dumps([url, kwargs.get("params"), vary], sort_keys=True, default=str)
+        kept = self.validators.get(key)
+        if kept:
+            etag, last_modified = kept[0], kept[1]
+            headers = dict(kwargs.get("headers") or {})
+            if etag:
+                headers["If-None-Match"] = etag
+            if last_modified:
+                headers["If-Modified-Since"] = last_modified
+            kwargs["headers"] = headers
+            self._count("conditional")
+        return key, kept
+
+    def _count(self, name: str):
+        with self._lock: # the tools call the client from many threads
+            self.revalidations[name] += 1
+
+    def _keep(self, key: str | None, status: int, headers, content: bytes):
+        etag, last_modified = headers.get("ETag"), headers.get("Last-Modified")
+        if key and status == 200 and (etag or last_modified) and len(content) <= MAX_REVALIDATED_SIZE:
+            self.validators.put(key, (etag, last_modified, status, dict(headers), content))
+
+    def request(self, method: str, url: str, **kwargs) -> requests.Response:
+        """Sends a request with the shared session, takes the arguments of requests.request."""
+        timeout = remaining_time(kwargs.pop("timeout", None) or self.timeout)
+        if timeout <= 0:
+            raise requests.Timeout(f"No time left for {method} {url}")
+        deadline = time.monotonic() + timeout
+        host = urlsplit(url).netloc
+        key, kept = self._conditional(method, url, kwargs)
+        limit = self._host_limit(host)
+        if not limit.acquire(timeout=timeout):
+            raise requests.Timeout(f"No free connection to {host} within {timeout:.1f} seconds")
+        try:
+            response = self._send(method, url, deadline, kwargs)
+        finally:
+            limit.release()
+        if response.status_code == 304 and kept:
+            self._count("not_modified")
+            fresh = requests.Response()
+            fresh.status_code, fresh.headers, fresh._content = kept[2], CaseInsensitiveDict(kept[3]), kept[4]
+            fresh.url, fresh.request, fresh.reason = response.url, response.request, "OK"
+            fresh.encoding = requests.utils.get_encoding_from_headers(fresh.headers)
+            return fresh
+        if not kwargs.get("stream"): # reading a streamed body here would defeat streaming
+            self._keep(key, response.status_code, response.headers, response.content)
+        return response
+
+    def _send(self, method: str, url: str, deadline: float, kwargs: dict) -> requests.Response:
+        """Sends the request until it gets an answer that is not retried, the retries and their backoff fit before the
+        deadline. The last answer is returned, the last connection error raised."""
+        retry = method.upper() in IDEMPOTENT_METHODS
+        for attempt in range(self.retries + 1):
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                raise requests.Timeout(f"No time left for {method} {url} after {attempt} attempts")
+            delay = self.backoff * 2 ** attempt
+            last = attempt == self.retries
+            try:
+                response = self.session.request(method, url, timeout=remaining, **kwargs)
+            except requests.ConnectionError as e: # connect timeouts too, read timeouts are not retried
+                if last or not (retry or not_sent(e)) or time.monotonic() + delay >= deadline:
+                    raise
+            else:
+                if last or not retry or response.status_code not in RETRY_STATUSES or \
+                        time.monotonic() + delay >= deadline:
+                    return response
+                response.close()
+            time.sleep(delay)
+
+    def get(self, url: str, params=None, **kwargs) -> requests.Response:
+        return self.request("GET", url, params=params, **kwargs)
+
+    def post(self, url: str, **kwargs) -> requests.Response:
+        return self.request("POST", url, **kwargs)
+
+    def _async_client(self):
+        loop = asyncio.get_running_loop()
+        if loop not in self._async_clients:
+            limits = httpx.Limits(max_connections=self.pool_hosts * self.max_per_host,
+                                  max_keepalive_connections=self.pool_hosts * self.max_per_host)
+            client = httpx.AsyncClient(limits=limits, follow_redirects=True,
+                                       transport=httpx.AsyncHTTPTransport(limits=limits, retries=self.retries))
+            self._async_clients[loop] = (client, {})
+        return self._async_clients[loop]
+
+    async def arequest(self, method: str, url: str, **kwargs):
+        """Sends a request with the async client of the running loop, takes the arguments of httpx.request."""
+        if httpx is None:
+            return await asyncio.to_thread(self.request, method, url, **kwargs)
+        client, host_limits = self._async_client()
+        timeout = remaining_time(kwargs.pop("timeout", None) or self.timeout)
+        if timeout <= 0:
+            raise httpx.TimeoutException(f"No time left for {method} {url}")
+        deadline = time.monotonic() + timeout
+        host = urlsplit(url).netloc
+        key, kept = self._conditional(method, url, kwargs)
+        limit = host_limits.setdefault(host, asyncio.Semaphore(self.max_per_host))
+        try:
+            await asyncio.wait_for(limit.acquire(), timeout)
+        except asyncio.TimeoutError:
+            raise httpx.PoolTimeout(f"No free connection to {host} within {timeout:.1f} seconds")
+        try:
+            retry = method.upper() in IDEMPOTENT_METHODS
+            for attempt in range(self.retries + 1):
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    raise httpx.TimeoutException(f"No time left for {method} {url} after {attempt} attempts")
+                delay = self.backoff * 2 ** attempt
+                # the transport already retries failed connections
+                response = await client.request(method, url, timeout=remaining, **kwargs)
+                if response.status_code == 304 and kept:
+                    self._count("not_modified")
+                    return httpx.Response(kept[2], headers=kept[3], content=kept[4], request=response.request)
+                if not retry or response.status_code not in RETRY_STATUSES or attempt == self.retries or \
+                        time.monotonic() + delay >= deadline:
+                    self._keep(key, response.status_code, response.headers, response.content)
+                    return response
+                await response.aclose()
+                await asyncio.sleep(delay)
+        finally:
+            limit.release()
+
+    async def aget(self, url: str, params=None, **kwargs):
+        return await self.arequest("GET", url, params=params, **kwargs)
+
+    async def apost(self, url: str, **kwargs):
+        return await self.arequest("POST", url, **kwargs)
+
+    def stats(self) -> dict:
+        """Conditional requests sent and how many of them were answered with 304 Not Modified."""
+        with self._lock:
+            return {**self.revalidations, "kept_responses": len(self.validators) if self.validators else 0}
+
+    def close(self):
+        """Closes the pooled connections of the sync client and of the async clients. An async client is closed on its
+        loop: right away if the loop is not running, else in a task of the loop (use aclose to wait for the client of
+        the running loop). The clients of closed loops lost their connections with the loop."""
+        self.session.close()
+        clients, self._async_clients = list(self._async_clients.items()), weakref.WeakKeyDictionary()
+        try:
+            current = asyncio.get_running_loop()
+        except RuntimeError:
+            current = None
+        for loop, (client, _) in clients:
+            if loop.is_closed():
+                continue
+            if loop is current:
+                loop.create_task(client.aclose())
+            elif loop.is_running():
+                asyncio.run_coroutine_threadsafe(client.aclose(), loop)
+            else:
+                loop.run_until_complete(client.aclose())
+
+    async def aclose(self):
+        """close, waiting for the async client of the running loop to be closed."""
+        entry = self._async_clients.pop(asyncio.get_running_loop(), None)
+        self.close()
+        if entry:
+            await entry[0].aclose()
@@ -0,0 +1,86 @@
+"""Two stage ranking of page chunks: BM25 picks the candidates, only those are embedded and reranked."""
+import math
+import re
+from typing import Callable
+
+import numpy as np
+
+from helpers.tool_retriever import normalize, top_k_indices
+
+TOKEN = re.compile(r"\w+")
+
+
+def tokenize(text: str) -> list[str]:
+    return TOKEN.findall(text.casefold())
+
+
+class BM25Index:
+    """In memory BM25 (Okapi) index over a list of texts, built in a single pass over them.
+
+    The postings are kept like a sparse matrix: the texts containing a term and the term counts are the slice
+    start[term]:start[term + 1] of texts and counts, so a query only touches the postings of its own terms.
+    """
+    def __init__(self, texts: list[str], k1: float = 1.5, b: float = 0.75):
+        self.k1 = k1
+        self.size = len(texts)
+        self.vocabulary: dict[str, int] = {}
+        width = max(self.size, 1)
+        lengths = np.empty(len(texts), dtype=np.int64)
+        term_ids: list[int] = []
+        for i, text in enumerate(texts):
+            tokens = tokenize(text)
+            lengths[i] = len(tokens)
+            term_ids += [self.vocabulary.setdefault(token, len(self.vocabulary)) for token in tokens]
+        # one key per (term, text) pair, sorted by term and then by text
+        keys, counts = np.unique(np.asarray(term_ids, dtype=np.int64) * width
+                                 + np.repeat(np.arange(self.size), lengths), return_counts=True)
+        self.texts = keys % width
+        self.counts = counts.astype(np.float32)
+        self.start = np.searchsorted(keys // width, np.arange(len(self.vocabulary) + 1))
+        average = float(lengths.mean()) if self.size and lengths.any() else 1.0
+        # the length normalization of the term frequency, per text
+        self.length_norm = (k1 * (1 - b + b * lengths / average)).astype(np.float32)
+
+    def scores(self, query: str) -> np.ndarray:
+        """The BM25 score of every text for the query, 0 for the texts sharing no term with it."""
+        scores = np.zeros(self.size, dtype=np.float32)
+        for term in set(tokenize(query)):
+            if term not in self.vocabulary:
+                continue
+            term_id = self.vocabulary[term]
+            postings = slice(self.start[term_id], self.start[term_id + 1])
+            texts, counts = self.texts[postings], self.counts[postings]
+            idf = math.log(1 + (self.size - len(texts) + 0.5) / (len(texts) + 0.5))
+            scores[texts] += idf * counts * (self.k1 + 1) / (counts + self.length_norm[texts])
+        return scores
+
+
+def _scale(scores: np.ndarray) -> np.ndarray:
+    """Min-max scales the scores to [0, 1], so BM25 and cosine scores can be added."""
+    low, high = float(scores.min()), float(scores.max())
+    return (scores - low) / (high - low) if high > low else np.zeros_like(scores)
+
+
+def hybrid_rank(texts: list[str], query: str, embed_texts: Callable[[list[str]], np.ndarray],
+                embed_query: Callable[[str], list[float]], top_k: int = 2, candidates: int = 64,
+                lexical_weight: float = 0.3) -> list[tuple[int, float]]:
+    """Returns the (index, score) of the top_k texts for the query, best first.
+
+    The `candidates` texts with the highest BM25 score are embedded with embed_texts (normalized vectors) and
+    reranked by lexical_weight * BM25 + (1 - lexical_weight) * cosine similarity, both scaled to [0, 1] over the
+    candidates. All the texts are embedded when candidates is 0 or when no text shares a term with the query.
+    """
+    if not texts:
+        return []
+    if not candidates and not lexical_weight: # dense only
+        lexical = np.zeros(len(texts), dtype=np.float32)
+    else:
+        lexical = BM25Index(texts).scores(query)
+    if candidates and len(texts) > candidates and lexical.any():
+        pool = top_k_indices(lexical, candidates)
+    else:
+        pool = np.arange(len(texts))
+    embeddings = embed_texts([texts[i] for i in pool])
+    dense = embeddings @ normalize(np.asarray(embed_query(query), dtype=np.float32))
+    fused = lexical_weight * _scale(lexical[pool]) + (1 - lexical_weight) * _scale(dense)
+    return [(int(pool[i]), float(fused[i])) for i in top_k_indices(fused, top_k)]
@@ -0,0 +1,108 @@
+import json
+import os
+import threading
+import time
+
+import numpy as np
+
+from config import PlanningRouterConfig
+from helpers.tool_retriever import normalize
+from logger import app_logger as logging
+
+PLAN = "plan"
+DIRECT = "direct"
+
+# labelled utterances the router compares the query with
+EXAMPLES: dict[str, list[str]] = {
+    DIRECT: [
+        "stop",
+        "pause",
+        "thank you",
+        "never mind",
+        "hello",
+        "what time is it",
+        "what's the weather",
+        "what is the weather today",
+        "how many unread emails do I have",
+        "open youtube",
+        "open google",
+        "open a new tab",
+        "what is my battery level",
+        "how much memory is free",
+        "who is alan turing",
+        "what is the capital of france",
+        "tell me a joke",
+        "shorten this link",
+        "read my clipboard",
+        "reset the chat",
+        "how many tokens did we use",
+        "what's the latest news",
+    ],
+    PLAN: [
+        "research the best laptops under a thousand dollars and summarize them",
+        "check the weather in tokyo and translate it to japanese",
+        "find my unread emails from john and reply to each of them",
+        "compare the weather this week in paris and london and tell me where to travel",
+        "download the latest post of this instagram profile and move it to my documents folder",
+        "search the news about the election and email me a summary",
+        "write a python script that renames all files in my downloads folder by date",
+        "find the largest files on my desktop and delete the ones older than a year",
+        "look up the population of the five largest cities in europe and add them up",
+        "read the article in my active tab and write a short summary to a file",
+        "plan a three day trip to rome with the weather forecast for each day",
+        "archive all promotional emails and star the ones from my boss",
+    ],
+}
+
+
+class PlanningRouter:
+    """Decides per query whether thinking mode needs the planning llm call.
+
+    The query embedding is compared with the embeddings of labelled example utterances (nearest neighbours). The
+    planning call is only skipped when the query is closer to a direct example than to a planning example and the
+    similarity is at least threshold, anything uncertain is planned. Every decision is appended to a jsonl log.
+    """
+    def __init__(self, embed_model, examples: dict[str, list[str]] | None = None,
+                 threshold: float = PlanningRouterConfig.THRESHOLD, k: int = PlanningRouterConfig.K,
+                 log_path: str | None = None):
+        self.embed_model = embed_model
+        self.threshold = threshold
+        self.k = k # neighbours averaged per label
+        self.log_path = log_path
+        self.decisions = {PLAN: 0, DIRECT: 0}
+        examples = examples or EXAMPLES
+        self.labels = list(examples)
+        texts = [text for label in self.labels for text in examples[label]]
+        self.example_labels = np.array([label for label in self.labels for _ in examples[label]])
+        self.embeddings = normalize(np.asarray(embed_model.get_text_embedding_batch(texts), dtype=np.float32))
+        self._lock = threading.Lock()
+
+    def scores(self, embedding: np.ndarray) -> dict[str, float]:
+        """Mean similarity of the k closest examples of every label."""
+        similarities = self.embeddings @ normalize(embedding)
+        return {
+            label: float(np.mean(np.sort(similarities[self.example_labels == label])[-self.k:]))
+            for label in self.labels
+        }
+
+    async def route(self, query: str, embedding: np.ndarray | None = None) -> str:
+        """Returns PLAN or DIRECT for the query. The query is only embedded if its embedding is not given."""
+        start = time.perf_counter()
+        if embedding is None:
+            embedding = np.asarray(await self.embed_model.aget_query_embedding(query), dtype=np.float32)
+        scores = self.scores(embedding)
+        direct = scores[DIRECT] >= self.threshold and scores[DIRECT] > scores[PLAN]
+        decision = DIRECT if direct else PLAN
+        self.log(query, decision, scores, time.perf_counter() - start)
+        return decision
+
+    def log(self, query: str, decision: str, scores: dict[str, float], duration: float):
+        logging.info(f"Planning router: {decision} ({', '.join(f'{label} {score:.2f}' for label, score in scores.items())})")
+        with self._lock:
+            self.decisions[decision] += 1
+            if self.log_path:
+                os.makedirs(os.path.dirname(self.log_path) or ".", exist_ok=True)
+                with open(self.log_path, "a", encoding="utf-8") as f:
+                    f.write(json.dumps({"time": time.time(), "query": query, "decision": decision, "scores": scores,
+                                        "duration": duration}) + "\n")
+
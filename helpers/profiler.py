@@ -0,0 +1,230 @@
+import builtins
+import json
+import math
+import os
+import sys
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+
+import psutil
+
+
+class BootProfiler:
+    """Records the phases of the startup: wall time, RSS delta and time spent importing modules.
+
+    Import time is measured by timing the outermost import statement of every thread while the profiler is
+    installed, so phases that run on different threads get their own import time. RSS is measured for the whole
+    process, so the RSS delta of phases that overlap includes memory allocated by the other phases.
+    The timeline is written in the Chrome trace format, it can be opened in chrome://tracing or https://ui.perfetto.dev
+    """
+    def __init__(self):
+        self.start = time.perf_counter()
+        self.phases: list[dict] = []
+        self._open: dict[str, dict] = {}
+        self._process = psutil.Process()
+        self._local = threading.local()
+        self._original_import = builtins.__import__
+        self._lock = threading.Lock()
+        builtins.__import__ = self._timed_import
+
+    def _timed_import(self, *args, **kwargs):
+        depth = getattr(self._local, "depth", 0)
+        if depth:
+            return self._original_import(*args, **kwargs)
+        self._local.depth = 1
+        start = time.perf_counter()
+        try:
+            return self._original_import(*args, **kwargs)
+        finally:
+            self._local.depth = 0
+            self._local.import_time = getattr(self._local, "import_time", 0.0) + time.perf_counter() - start
+
+    def begin(self, name: str):
+        self._open[name] = {
+            "name": name,
+            "thread": threading.current_thread().name,
+            "start": time.perf_counter(),
+            "rss": self._process.memory_info().rss,
+            "import_time": getattr(self._local, "import_time", 0.0),
+            "modules": len(sys.modules),
+        }
+
+    def end(self, name: str):
+        phase = self._open.pop(name)
+        end = time.perf_counter()
+        with self._lock:
+            self.phases.append({
+                "name": name,
+                "thread": phase["thread"],
+                "start": phase["start"] - self.start,
+                "duration": end - phase["start"],
+                "rss_delta": self._process.memory_info().rss - phase["rss"],
+                "import_time": getattr(self._local, "import_time", 0.0) - phase["import_time"],
+                "modules_imported": len(sys.modules) - phase["modules"],
+            })
+
+    @contextmanager
+    def phase(self, name: str):
+        self.begin(name)
+        try:
+            yield
+        finally:
+            self.end(name)
+
+    def run_phase(self, name: str, function, *args, **kwargs):
+        """Calls the function as a phase, useful to submit phases to a thread pool."""
+        with self.phase(name):
+            return function(*args, **kwargs)
+
+    def finish(self, path: str):
+        """Stops measuring imports and writes the timeline to path as a Chrome trace."""
+        builtins.__import__ = self._original_import
+        total = time.perf_counter() - self.start
+        threads = {name: tid for tid, name in enumerate(dict.fromkeys(phase["thread"] for phase in self.phases))}
+        events = [
+            {
+                "name": phase["name"],
+                "ph": "X",
+                "ts": phase["start"] * 1e6,
+                "dur": phase["duration"] * 1e6,
+                "pid": os.getpid(),
+                "tid": threads[phase["thread"]],
+                "args": {
+                    "rss_delta_mb": round(phase["rss_delta"] / 2 ** 20, 1),
+                    "import_time_ms": round(phase["import_time"] * 1000, 1),
+                    "modules_imported": phase["modules_imported"],
+                },
+            }
+            for phase in self.phases
+        ]
+        events += [{"name": "thread_name", "ph": "M", "pid": os.getpid(), "tid": tid, "args": {"name": name}}
+                   for name, tid in threads.items()]
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump({"traceEvents": events, "otherData": {"total_seconds": total}}, f, indent=4)
+        return total
+
+    def summary(self) -> str:
+        return "\n".join(
+            f"{phase['name']:>12}: {phase['duration'] * 1000:8.0f}ms, imports {phase['import_time'] * 1000:6.0f}ms, "
+            f"rss {phase['rss_delta'] / 2 ** 20:+7.1f}MB ({phase['thread']})"
+            for phase in sorted(self.phases, key=lambda phase: phase["start"])
+        )
+
+
+class TurnRecorder:
+    """Keeps a per stage latency breakdown of the last turns of the voice pipeline.
+
+    A turn starts when the user starts speaking and lasts until the answer is heard (end_turn can be given an earlier
+    end than the call). Stages are recorded either as spans (a duration) or as marks (a point in time since the start
+    of the turn), from any thread. Spans and marks outside of a turn are ignored.
+    The token counts of a turn are taken from the TokenCountingHandler when the turn ends.
+    """
+    def __init__(self, max_turns: int = 100, token_counter=None):
+        self.turns: deque[dict] = deque(maxlen=max_turns)
+        self.token_counter = token_counter
+        self.current: dict | None = None
+        self._lock = threading.Lock()
+
+    def begin_turn(self):
+        """Starts a new turn, an unfinished turn is discarded."""
+        with self._lock:
+            self.current = {
+                "started_at": time.time(),
+                "start": time.perf_counter(),
+                "spans": [],
+                "marks": {},
+                "tokens": self._token_counts(),
+            }
+
+    def end_turn(self, end: float | None = None):
+        """Ends the turn, its duration is up to end (time.perf_counter, default now)."""
+        end = end or time.perf_counter()
+        with self._lock:
+            turn, self.current = self.current, None
+            if turn is None:
+                return
+            tokens = self._token_counts()
+            self.turns.append({
+                "started_at": turn["started_at"],
+                "duration": end - turn["start"],
+                "spans": turn["spans"],
+                "marks": turn["marks"],
+                # the counter can be reset during the turn
+                "tokens": {name: max(0, tokens[name] - turn["tokens"][name]) for name in tokens},
+            })
+
+    def mark(self, name: str):
+        """Records the time since the start of the turn, only the first mark of a name is kept."""
+        with self._lock:
+            if self.current is not None:
+                self.current["marks"].setdefault(name, time.perf_counter() - self.current["start"])
+
+    def add_span(self, name: str, start: float, end: float | None = None):
+        """Records a stage that started at start (time.perf_counter) and ended at end (default now)."""
+        end = end or time.perf_counter()
+        with self._lock:
+            if self.current is not None:
+                self.current["spans"].append({
+                    "name": name,
+                    "start": start - self.current["start"],
+                    "duration": end - start,
+                })
+
+    @contextmanager
+    def span(self, name: str):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add_span(name, start)
+
+    def _token_counts(self) -> dict:
+        if self.token_counter is None:
+            return {"prompt": 0, "cached_prompt": 0, "completion": 0, "embedding": 0}
+        return {
+            "prompt": self.token_counter.prompt_llm_token_count,
+            "cached_prompt": getattr(self.token_counter, "cached_prompt_token_count", 0),
+            "completion": self.token_counter.completion_llm_token_count,
+            "embedding": self.token_counter.total_embedding_token_count,
+        }
+
+    def stage_stats(self) -> dict[str, dict]:
+        """p50 and p95 in seconds of every stage over the recorded turns, spans with the same name in a turn are summed."""
+        durations: dict[str, list[float]] = {}
+        for turn in list(self.turns):
+            per_turn: dict[str, float] = dict(turn["marks"])
+            for span in turn["spans"]:
+                per_turn[span["name"]] = per_turn.get(span["name"], 0.0) + span["duration"]
+            per_turn["turn"] = turn["duration"]
+            for name, duration in per_turn.items():
+                durations.setdefault(name, []).append(duration)
+        return {
+            name: {"count": len(values), "p50": percentile(values, 50), "p95": percentile(values, 95)}
+            for name, values in durations.items()
+        }
+
+    def token_stats(self) -> dict[str, dict]:
+        """p50 and p95 of the tokens used per turn."""
+        tokens = [turn["tokens"] for turn in list(self.turns)]
+        return {
+            name: {"p50": percentile([turn[name] for turn in tokens], 50),
+                   "p95": percentile([turn[name] for turn in tokens], 95)}
+            for name in (tokens[0] if tokens else {})
+        }
+
+    def dump(self, path: str):
+        """Writes the recorded turns and the stage statistics as json."""
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump({"stages": self.stage_stats(), "tokens": self.token_stats(), "turns": list(self.turns)}, f, indent=4)
+
+
+def percentile(values: list[float], percent: float) -> float:
+    """Nearest rank percentile, 0 for an empty list."""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[max(0, math.ceil(percent / 100 * len(ordered)) - 1)]
@@ -0,0 +1,218 @@
+import hashlib
+import json
+import os
+import re
+import threading
+import time
+from collections import OrderedDict
+from typing import Iterable
+
+import numpy as np
+
+from logger import app_logger as logging
+
+# words that refer to the conversation, a query containing one only means the same in the same context
+CONTEXT_WORDS = frozenset({"it", "its", "that", "this", "these", "those", "them", "they", "he", "she", "him", "her",
+                           "there", "again", "why", "more", "else", "same", "yes", "no", "previous", "last"})
+WORD = re.compile(r"[\w']+")
+
+
+def context_key(messages: Iterable[tuple[str, str]]) -> str:
+    """A short hash of (role, content) pairs of the recent conversation."""
+    return hashlib.sha1(json.dumps(list(messages)).encode()).hexdigest()[:16]
+
+
+class SemanticResponseCache:
+    """Reuses the answer of a recent query whose embedding is similar enough to the new query.
+
+    Every answer expires with the most volatile tool that was called to generate it (tool_ttls), answers that used
+    a tool with a ttl of 0 are not cached at all. The least recently used answer is evicted once max_size is
+    reached. Queries shorter than short_query_words or containing a CONTEXT_WORDS word ("yes", "why?", "do it
+    again") depend on the conversation, they are only matched with answers given in the same context (context_key
+    of the recent messages). The cache is saved as json so it survives a restart, save_delay seconds after a change
+    on a background thread.
+    """
+    def __init__(self, embed_model, threshold: float = 0.95, max_size: int = 256, no_tool_ttl: float = 3600,
+                 default_tool_ttl: float = 0, tool_ttls: dict[str, float] | None = None, path: str | None = None,
+                 short_query_words: int = 4, save_delay: float = 5.0):
+        self.embed_model = embed_model
+        self.threshold = threshold
+        self.max_size = max_size
+        self.no_tool_ttl = no_tool_ttl
+        self.default_tool_ttl = default_tool_ttl
+        self.tool_ttls = tool_ttls or {}
+        self.path = path
+        self.short_query_words = short_query_words
+        self.save_delay = save_delay
+        self.clock = time.time
+        self.hits = 0
+        self.misses = 0
+        self.expired = 0
+        self.skipped = 0 # answers that were not cached because of their tools or a failed tool call
+        self._entries: OrderedDict[str, dict] = OrderedDict() # normalized query -> entry
+        self._matrix: np.ndarray | None = None # normalized embeddings of the entries, rebuilt when they change
+        self._keys: list[str] = []
+        self._contexts: list[str | None] = [] # context of every row of the matrix
+        self._lock = threading.Lock()
+        self._save_timer: threading.Timer | None = None
+        if path and os.path.exists(path):
+            self.load()
+
+    @staticmethod
+    def normalize_query(query: str) -> str:
+        return " ".join(query.lower().split())
+
+    async def embed(self, query: str) -> np.ndarray:
+        embedding = np.asarray(await self.embed_model.aget_query_embedding(query), dtype=np.float32)
+        return embedding / (np.linalg.norm(embedding) or 1.0)
+
+    def ttl(self, tools: Iterable[str]) -> float:
+        """Seconds the answer stays fresh, the smallest ttl of the tools that were called."""
+        return min((self.tool_ttls.get(tool, self.default_tool_ttl) for tool in tools), default=self.no_tool_ttl)
+
+    def query_context(self, query: str, context: str | None) -> str | None:
+        """The context the answer of the query depends on, None for queries that mean the same in any conversation."""
+        words = WORD.findall(query.lower())
+        if len(words) < self.short_query_words or not CONTEXT_WORDS.isdisjoint(words):
+            return context or ""
+        return None
+
+    def _key(self, query: str, context: str | None) -> str:
+        key = self.normalize_query(query)
+        return f"{context}|{key}" if context is not None else key
+
+    def lookup(self, query: str, embedding: np.ndarray, context: str | None = None) -> str | None:
+        """Returns the answer of the most similar fresh query, or None. context is the context_key of the
+        conversation so far, used for queries that depend on it."""
+        context = self.query_context(query, context)
+        with self._lock:
+            key = self._key(query, context)
+            candidates = [key] if key in self._entries else []
+            if self._matrix is None:
+                self._build_matrix()
+            if self._keys:
+                scores = self._matrix @ embedding
+                # then every match above the threshold in the same context, best first, expired ones are skipped
+                candidates += [self._keys[i] for i in np.argsort(-scores)
+                               if scores[i] >= self.threshold and self._contexts[i] == context and self._keys[i] != key]
+            now = self.clock()
+            for key in candidates:
+                entry = self._entries[key]
+                if entry["expires"] <= now:
+                    self._remove(key)
+                    self.expired += 1
+                    continue
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry["response"]
+            self.misses += 1
+            return None
+
+    def put(self, query: str, embedding: np.ndarray, response: str, tools: Iterable[str], failed: bool = False,
+            context: str | None = None):
+        """Caches the answer if none of its tools failed or has a ttl of 0, the cache is saved in the background."""
+        tools = sorted(set(tools))
+        ttl = self.ttl(tools)
+        if ttl <= 0 or failed or not response:
+            self.skipped += 1
+            return
+        context = self.query_context(query, context)
+        with self._lock:
+            key = self._key(query, context)
+            self._entries[key] = {
+                "response": response,
+                "tools": tools,
+                "expires": self.clock() + ttl,
+                "embedding": embedding,
+                "context": context,
+            }
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+            self._matrix = None
+        self.schedule_save()
+
+    def _remove(self, key: str):
+        del self._entries[key]
+        self._matrix = None
+
+    def _build_matrix(self):
+        self._keys = list(self._entries)
+        self._contexts = [entry.get("context") for entry in self._entries.values()]
+        self._matrix = np.stack([entry["embedding"] for entry in self._entries.values()]) if self._keys else None
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._matrix = None
+        self.schedule_save()
+
+    def schedule_save(self):
+        """Saves the cache save_delay seconds from now on a timer thread, changes made meanwhile are saved together."""
+        if not self.path:
+            return
+        with self._lock:
+            if self._save_timer is None:
+                self._save_timer = threading.Timer(self.save_delay, self._save_scheduled)
+                self._save_timer.daemon = True
+                self._save_timer.start()
+
+    def _save_scheduled(self):
+        with self._lock:
+            self._save_timer = None
+        try:
+            self.save()
+        except OSError as e:
+            logging.warning(f"Could not save the response cache: {e}")
+
+    def close(self):
+        """Saves a pending change right away."""
+        with self._lock:
+            timer, self._save_timer = self._save_timer, None
+        if timer is not None:
+            timer.cancel()
+            self._save_scheduled()
+
+    def save(self):
+        """Writes the fresh entries to path, through a temporary file so a crash never leaves half a cache."""
+        with self._lock:
+            now = self.clock()
+            entries = {
+                key: {**entry, "embedding": entry["embedding"].tolist()}
+                for key, entry in self._entries.items() if entry["expires"] > now
+            }
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(entries, f)
+        os.replace(tmp_path, self.path)
+
+    def load(self):
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                entries = json.load(f)
+        except (OSError, json.JSONDecodeError) as e:
+            logging.warning(f"Ignoring the response cache {self.path}: {e}")
+            return
+        now = self.clock()
+        with self._lock:
+            for key, entry in entries.items():
+                if entry["expires"] > now:
+                    entry["embedding"] = np.asarray(entry["embedding"], dtype=np.float32)
+                    self._entries[key] = entry
+            self._matrix = None
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "size": len(self._entries),
+            "max_size": self.max_size,
+            "hits": self.hits,
+            "misses": self.misses,
+            "expired": self.expired,
+            "skipped": self.skipped,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+        }
+
+    def __len__(self):
+        return len(self._entries)
@@ -0,0 +1,228 @@
+"""Runs python code from the llm in warm worker processes that can be killed."""
+import contextlib
+import importlib
+import io
+import multiprocessing
+import os
+import queue
+import threading
+import time
+import traceback
+import types
+
+import psutil
+
+from helpers.tool_context import cancel_requested, remaining_time
+
+try:
+    import resource # posix only, on windows the code is only stopped by the timeout and the memory limit
+except ImportError:
+    resource = None
+
+POLL_INTERVAL = 0.05 # seconds between the checks for a result, a cancellation or the limits
+
+# processes started and killed, reported by ToolExecutor.stats
+STATS = {"processes": 0, "killed": 0}
+_stats_lock = threading.Lock()
+
+
+def _count(key: str):
+    with _stats_lock:
+        STATS[key] += 1
+
+
+def _preload(modules: dict[str, str]) -> dict[str, types.ModuleType]:
+    """Imports the modules that exist, returns them by the name they get in the namespace of the code."""
+    namespace = {}
+    for module, name in modules.items():
+        try:
+            namespace[name] = importlib.import_module(module)
+        except ImportError:
+            pass
+    return namespace
+
+
+def _lower_priority():
+    try:
+        psutil.Process().nice(10 if os.name == "posix" else psutil.BELOW_NORMAL_PRIORITY_CLASS)
+    except psutil.Error:
+        pass
+
+
+def _limit_cpu(cpu_limit: float):
+    """Allows cpu_limit more seconds of cpu time, the kernel kills the worker with SIGXCPU after that."""
+    if resource is None or not cpu_limit:
+        return
+    usage = resource.getrusage(resource.RUSAGE_SELF)
+    soft = int(usage.ru_utime + usage.ru_stime + cpu_limit) + 1
+    hard = resource.getrlimit(resource.RLIMIT_CPU)[1]
+    resource.setrlimit(resource.RLIMIT_CPU, (soft if hard == resource.RLIM_INFINITY else min(soft, hard), hard))
+
+
+def _repr(value, max_output: int) -> str:
+    try:
+        return repr(value)[:max_output]
+    except Exception: # e.g. ints above sys.get_int_max_str_digits
+        return f"<{type(value).__name__} object>"
+
+
+def _execute(code: str, modules: dict[str, types.ModuleType], max_output: int) -> dict:
+    """Executes the code in a fresh namespace with the preloaded modules, captures stdout and the new variables."""
+    namespace = {"__name__": "__sandbox__", **modules}
+    stdout = io.StringIO()
+    error = None
+    start = time.perf_counter()
+    try:
+        with contextlib.redirect_stdout(stdout):
+            exec(code, namespace)
+    except BaseException as e: # SystemExit and MemoryError included, the worker keeps serving
+        error = "".join(traceback.format_exception_only(type(e), e)).strip()
+    variables = {
+        name: _repr(value, max_output)
+        for name, value in namespace.items()
+        if not name.startswith("_") and name not in modules and not isinstance(value, types.ModuleType)
+    }
+    return {
+        "stdout": stdout.getvalue()[:max_output],
+        "variables": variables,
+        "error": error,
+        "seconds": round(time.perf_counter() - start, 3),
+    }
+
+
+def _worker(connection, modules: dict[str, str], cpu_limit: float, max_output: int):
+    preloaded = _preload(modules)
+    _lower_priority()
+    connection.send("ready")
+    while True:
+        try:
+            code = connection.recv()
+        except (EOFError, KeyboardInterrupt):
+            return
+        _limit_cpu(cpu_limit)
+        connection.send(_execute(code, preloaded, max_output))
+
+
+class _Worker:
+    def __init__(self, process, connection):
+        self.process = process
+        self.connection = connection
+        self.psutil_process = psutil.Process(process.pid)
+
+    def memory_mb(self) -> float:
+        try:
+            return self.psutil_process.memory_info().rss / 1024 / 1024
+        except psutil.Error:
+            return 0.0
+
+
+class WorkerPool:
+    """A pool of warm python processes that execute code from the llm.
+
+    The workers are started ahead of time with the common modules imported, so a call only pays for sending the
+    code. Each worker runs at a lower priority with a per call cpu limit (an rlimit on posix) and a memory limit on its
+    resident memory, watched from this process with psutil while the code runs (an address space rlimit would break
+    numpy, OpenBLAS reserves far more than it uses). A worker that hangs, runs past the timeout, exceeds a limit or
+    whose call is cancelled is killed and replaced. The workers are started by the first call. The code never runs in
+    the assistant process, so it can't hold the GIL of the audio threads.
+    """
+    def __init__(self, size: int = 2, modules: dict[str, str] | None = None, memory_limit_mb: int = 1024,
+                 cpu_limit: float = 10, max_output: int = 10_000):
+        self.size = size
+        self.modules = modules or {}
+        self.memory_limit_mb = memory_limit_mb
+        self.cpu_limit = cpu_limit
+        self.max_output = max_output
+        self.context = multiprocessing.get_context("spawn")
+        self.idle: queue.Queue[_Worker] = queue.Queue()
+        self.started = False
+        self._start_lock = threading.Lock()
+
+    def start(self):
+        """Starts the workers, they import the modules in the background."""
+        with self._start_lock:
+            if self.started:
+                return
+            self.started = True
+            for _ in range(self.size):
+                self.idle.put(self._spawn())
+
+    def _spawn(self) -> _Worker:
+        parent, child = self.context.Pipe()
+        process = self.context.Process(
+            target=_worker, args=(child, self.modules, self.cpu_limit, self.max_output),
+            daemon=True, name="sandbox")
+        process.start()
+        child.close()
+        _count("processes")
+        return _Worker(process, parent)
+
+    def _kill(self, worker: _Worker):
+        worker.process.kill() # also counted when the kernel already killed it for its cpu limit
+        _count("killed")
+        worker.process.join()
+        worker.connection.close()
+        self.idle.put(self._spawn())
+
+    def _wait(self, ready, deadline: float, what: str):
+        """Polls ready() until it returns a value, raises on cancellation or timeout."""
+        while True:
+            result = ready()
+            if result is not None:
+                return result
+            if cancel_requested():
+                raise InterruptedError("The tool call was cancelled")
+            if time.monotonic() >= deadline:
+                raise TimeoutError(f"{what} within the timeout")
+
+    def run(self, code: str, timeout: float) -> dict:
+        """Executes the code in a free worker, returns its stdout, the variables it defined, its error and duration.
+
+        Raises TimeoutError or InterruptedError when the timeout (capped by the deadline of the running tool call)
+        passes or the tool call is cancelled, RuntimeError when the worker died or exceeded its memory limit.
+        """
+        self.start()
+        deadline = time.monotonic() + remaining_time(timeout)
+
+        def free_worker():
+            try:
+                return self.idle.get(timeout=POLL_INTERVAL)
+            except queue.Empty:
+                return None
+        worker = self._wait(free_worker, deadline, "No sandbox worker was free")
+
+        healthy = False
+        try:
+            def result():
+                if worker.connection.poll(POLL_INTERVAL):
+                    message = worker.connection.recv()
+                    if message != "ready": # sent once, when the worker finished importing the modules
+                        return message
+                elif self.memory_limit_mb and worker.memory_mb() > self.memory_limit_mb:
+                    raise RuntimeError(f"The code used more than {self.memory_limit_mb} MB of memory")
+                return None
+            try:
+                worker.connection.send(code)
+                output = self._wait(result, deadline, "The code did not finish")
+            except (TimeoutError, InterruptedError): # OSErrors too, but the worker is still running
+                raise
+            except (EOFError, OSError): # killed by the cpu limit or crashed, the pipe is closed or broken
+                worker.process.join()
+                raise RuntimeError(f"The sandbox process exited with code {worker.process.exitcode}")
+            healthy = True
+            return output
+        finally:
+            if healthy:
+                self.idle.put(worker)
+            else:
+                self._kill(worker)
+
+    def shutdown(self):
+        while True:
+            try:
+                worker = self.idle.get_nowait()
+            except queue.Empty:
+                return
+            worker.process.kill()
+            worker.process.join()
+            worker.connection.close()
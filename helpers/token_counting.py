@@ -0,0 +1,56 @@
+from typing import Any
+
+from llama_index.core.callbacks import TokenCountingHandler, CBEventType, EventPayload
+
+
+class CachedTokenCountingHandler(TokenCountingHandler):
+    """TokenCountingHandler that also counts the prompt tokens the provider served from its prompt cache.
+
+    The cached counts are read from the usage of the raw responses (OpenAI prompt_tokens_details.cached_tokens,
+    Gemini cached_content_token_count). Responses without usage, like streamed OpenAI responses, count as 0.
+    """
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.cached_token_counts: list[int] = []
+
+    def on_event_end(self, event_type: CBEventType, payload: dict[str, Any] | None = None, event_id: str = "",
+                     **kwargs: Any) -> None:
+        super().on_event_end(event_type, payload=payload, event_id=event_id, **kwargs)
+        if event_type == CBEventType.LLM and event_type not in self.event_ends_to_ignore and payload is not None:
+            response = payload.get(EventPayload.RESPONSE) or payload.get(EventPayload.COMPLETION)
+            self.cached_token_counts.append(get_cached_tokens(response))
+
+    @property
+    def cached_prompt_token_count(self) -> int:
+        """Prompt tokens served from the provider prompt cache."""
+        return sum(self.cached_token_counts)
+
+    @property
+    def prompt_cache_hit_rate(self) -> float:
+        prompt_tokens = self.prompt_llm_token_count
+        return self.cached_prompt_token_count / prompt_tokens if prompt_tokens else 0.0
+
+    def reset_counts(self) -> None:
+        super().reset_counts()
+        self.cached_token_counts = []
+
+
+def get_cached_tokens(response) -> int:
+    """Cached prompt tokens from the usage of a ChatResponse or CompletionResponse, 0 if it is not reported."""
+    raw = getattr(response, "raw", None)
+    if raw is None:
+        return 0
+    if not isinstance(raw, dict):
+        raw = raw.model_dump() if hasattr(raw, "model_dump") else dict(raw)
+    usage = raw.get("usage") or raw.get("usage_metadata") or {}
+    if not isinstance(usage, dict):
+        usage = usage.model_dump() if hasattr(usage, "model_dump") else vars(usage)
+    details = usage.get("prompt_tokens_details") or {}
+    if not isinstance(details, dict):
+        details = details.model_dump() if hasattr(details, "model_dump") else vars(details)
+    return int(
+        details.get("cached_tokens")
+        or usage.get("cached_content_token_count")
+        or usage.get("cache_read_input_tokens")
+        or 0
+    )
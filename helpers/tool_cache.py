@@ -0,0 +1,148 @@
+import functools
+import inspect
+import json
+import os
+import sqlite3
+import threading
+import time
+from typing import Any, Callable, Iterable
+
+from helpers.cache import LRUCache
+from logger import app_logger as logging
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS results (key TEXT PRIMARY KEY, tool TEXT NOT NULL, value TEXT NOT NULL, expires REAL NOT NULL);
+CREATE INDEX IF NOT EXISTS results_expires ON results (expires);
+"""
+_MISSING = object()
+
+
+def normalize(value: Any, fold: bool = False) -> Any:
+    """Makes equivalent arguments equal. With fold the strings are stripped, whitespace collapsed and case folded,
+    only for arguments that mean the same in any case (a search query, not a title, url or code)."""
+    if isinstance(value, str):
+        return " ".join(value.split()).casefold() if fold else value
+    if isinstance(value, dict):
+        return {str(k): normalize(v, fold) for k, v in sorted(value.items(), key=lambda item: str(item[0]))}
+    if isinstance(value, (list, tuple)):
+        return [normalize(v, fold) for v in value]
+    return value
+
+
+def is_error(result: Any) -> bool:
+    """The tools report failures as "Error ..." strings, those are never cached."""
+    return isinstance(result, str) and result.startswith("Error")
+
+
+class ToolResultCache:
+    """Results of read only tools, kept in memory (LRU) and in a SQLite file so they survive restarts.
+
+    wrap turns a tool into a cached one, the key is the tool name and its normalized arguments (defaults applied),
+    the arguments the tool declares case insensitive are compared without case and extra whitespace.
+    Every tool has its own ttl; a result found on disk is kept in memory for the rest of its ttl. Raised exceptions
+    and error strings are not cached. The database is opened on first use.
+    """
+    def __init__(self, path: str | None = None, max_size: int = 256):
+        self.path = path # None keeps the results in memory only
+        self.memory = LRUCache(max_size=max_size)
+        self.tool_stats: dict[str, dict[str, int]] = {}
+        self._connection: sqlite3.Connection | None = None
+        self._lock = threading.Lock()
+
+    def _db(self) -> sqlite3.Connection | None:
+        if self.path is None:
+            return None
+        if self._connection is None:
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+            self._connection = sqlite3.connect(self.path, check_same_thread=False, isolation_level=None)
+            self._connection.execute("PRAGMA journal_mode=WAL")
+            self._connection.executescript(SCHEMA)
+            self._connection.execute("DELETE FROM results WHERE expires < ?", (time.time(),))
+        return self._connection
+
+    def _count(self, tool: str, key: str):
+        stats = self.tool_stats.setdefault(tool, {"hits": 0, "disk_hits": 0, "misses": 0, "stored": 0})
+        stats[key] += 1
+
+    def get(self, tool: str, key: str) -> Any:
+        """The cached result, _MISSING if there is none or it expired."""
+        value = self.memory.get(key, _MISSING)
+        if value is not _MISSING:
+            self._count(tool, "hits")
+            return value
+        row = None
+        with self._lock:
+            db = self._db()
+            if db:
+                row = db.execute("SELECT value, expires FROM results WHERE key = ? AND expires > ?",
+                                 (key, time.time())).fetchone()
+        if row:
+            value = json.loads(row[0])
+            self.memory.put(key, value, ttl=row[1] - time.time())
+            self._count(tool, "disk_hits")
+            return value
+        self._count(tool, "misses")
+        return _MISSING
+
+    def put(self, tool: str, key: str, value: Any, ttl: float):
+        self.memory.put(key, value, ttl=ttl)
+        self._count(tool, "stored")
+        try:
+            serialized = json.dumps(value)
+        except (TypeError, ValueError): # only kept in memory
+            return
+        with self._lock:
+            db = self._db()
+            if db:
+                db.execute("INSERT OR REPLACE INTO results (key, tool, value, expires) VALUES (?, ?, ?, ?)",
+                           (key, tool, serialized, time.time() + ttl))
+
+    def clear(self):
+        self.memory.clear()
+        with self._lock:
+            db = self._db()
+            if db:
+                db.execute("DELETE FROM results")
+
+    def stats(self) -> dict:
+        return {"memory": self.memory.stats(), "tools": self.tool_stats}
+
+    def wrap(self, func: Callable[..., Any], tool: str, ttl: float,
+             case_insensitive: Iterable[str] = ()) -> Callable[..., Any]:
+        """Returns func with its results cached for ttl seconds, works for sync and async functions."""
+        signature = inspect.signature(func)
+        case_insensitive = frozenset(case_insensitive)
+
+        def lookup(args, kwargs) -> tuple[str | None, Any]:
+            try:
+                bound = signature.bind(*args, **kwargs)
+            except TypeError as e: # wrong arguments, the tool raises them
+                logging.debug(f"Not caching {tool}: {e}")
+                return None, _MISSING
+            bound.apply_defaults()
+            arguments = {name: normalize(value, name in case_insensitive) for name, value in bound.arguments.items()}
+            key = json.dumps([tool, arguments], sort_keys=True, default=str)
+            return key, self.get(tool, key)
+
+        def store(key: str | None, result: Any):
+            if key is not None and not is_error(result):
+                self.put(tool, key, result, ttl)
+
+        if inspect.iscoroutinefunction(func):
+            @functools.wraps(func)
+            async def async_wrapper(*args, **kwargs):
+                key, result = lookup(args, kwargs)
+                if result is _MISSING:
+                    result = await func(*args, **kwargs)
+                    store(key, result)
+                return result
+            return async_wrapper
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            key, result = lookup(args, kwargs)
+            if result is _MISSING:
+                result = func(*args, **kwargs)
+                store(key, result)
+            return result
+        return wrapper
@@ -0,0 +1,34 @@
+import contextvars
+import threading
+import time
+
+
+class ToolCall:
+    """Deadline and cancellation flag of one running tool call.
+
+    ToolExecutor sets it for the tool (also in the thread of a blocking tool) and cancels it when the call times out
+    or the workflow is cancelled. Long running tools check cancel_requested between steps and pass remaining_time to
+    their blocking calls, so they stop instead of running on in the background.
+    """
+    def __init__(self, name: str, timeout: float):
+        self.name = name
+        self.deadline = time.monotonic() + timeout
+        self.cancelled = threading.Event()
+
+    def remaining(self) -> float:
+        return max(0.0, self.deadline - time.monotonic())
+
+
+CURRENT_TOOL_CALL: contextvars.ContextVar[ToolCall | None] = contextvars.ContextVar("current_tool_call", default=None)
+
+
+def cancel_requested() -> bool:
+    """True once the running tool call timed out or was cancelled, always False outside of a tool call."""
+    call = CURRENT_TOOL_CALL.get()
+    return call is not None and (call.cancelled.is_set() or call.remaining() == 0)
+
+
+def remaining_time(default: float) -> float:
+    """Seconds left before the deadline of the running tool call, at most default."""
+    call = CURRENT_TOOL_CALL.get()
+    return default if call is None else min(default, call.remaining())
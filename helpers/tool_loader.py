@@ -0,0 +1,84 @@
+import importlib
+import importlib.util
+import json
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from config import CACHE_DIRECTORY, ToolLoadingConfig
+from logger import app_logger as logging
+from tool_registry import TOOL_REGISTRY
+
+MANIFEST_PATH = os.path.join(CACHE_DIRECTORY, "tool_manifest.json")
+IMPORT_TIMES: dict[str, float] = {} # module -> seconds it took to import
+_import_lock = threading.Lock()
+
+
+def import_module(module: str):
+    """Imports a feature module and records how long it took."""
+    if module in IMPORT_TIMES:
+        return
+    start = time.perf_counter()
+    importlib.import_module(module)
+    with _import_lock:
+        if module not in IMPORT_TIMES:
+            IMPORT_TIMES[module] = time.perf_counter() - start
+            logging.info(f"Imported {module} in {IMPORT_TIMES[module] * 1000:.0f}ms.")
+
+
+class ToolLoader:
+    """Loads the feature modules of a package.
+
+    With ToolLoadingConfig.LAZY the tools of a module are registered from a manifest that describes them (name,
+    description and json schema) and the module is only imported when one of its tools is first called.
+    Modules that are missing from the manifest or changed since it was written are imported at startup, on a thread
+    pool, and the manifest is updated. The modules in ToolLoadingConfig.WARMUP are imported in the background.
+    """
+    def __init__(self, package: str, module_names: list[str]):
+        self.package = package
+        self.module_names = module_names
+        self.thread_pool = ThreadPoolExecutor(max_workers=ToolLoadingConfig.MAX_WORKERS, thread_name_prefix="tool_loader")
+
+    def load(self):
+        modules = [f"{self.package}.{name}" for name in self.module_names]
+        if not ToolLoadingConfig.LAZY:
+            for module in modules:
+                import_module(module)
+            return
+
+        manifest = self._load_manifest()
+        stale = []
+        for module in modules:
+            entry = manifest.get(module)
+            if entry and entry["mtime"] == self._mtime(module):
+                for description in entry["tools"]:
+                    TOOL_REGISTRY.add_lazy(module, description, import_module)
+            else:
+                stale.append(module)
+
+        if stale:
+            list(self.thread_pool.map(import_module, stale))
+            for module in stale:
+                manifest[module] = {"mtime": self._mtime(module), "tools": TOOL_REGISTRY.describe(module)}
+            self._save_manifest(manifest)
+        for name in ToolLoadingConfig.WARMUP:
+            if f"{self.package}.{name}" in modules:
+                self.thread_pool.submit(import_module, f"{self.package}.{name}")
+
+    def _mtime(self, module: str) -> float:
+        return os.path.getmtime(importlib.util.find_spec(module).origin)
+
+    @staticmethod
+    def _load_manifest() -> dict:
+        if not os.path.exists(MANIFEST_PATH):
+            return {}
+        with open(MANIFEST_PATH, "r", encoding="utf-8") as f:
+            return json.load(f)
+
+    @staticmethod
+    def _save_manifest(manifest: dict):
+        os.makedirs(CACHE_DIRECTORY, exist_ok=True)
+        with open(MANIFEST_PATH + ".tmp", "w", encoding="utf-8") as f:
+            json.dump(manifest, f, indent=4)
+        os.replace(MANIFEST_PATH + ".tmp", MANIFEST_PATH)
@@ -0,0 +1,206 @@
+import hashlib
+import json
+import os
+
+import numpy as np
+from llama_index.core.node_parser import SentenceSplitter
+from llama_index.core.schema import MetadataMode, NodeWithScore, TextNode
+
+
+class MatrixRetriever:
+    """Top-k retriever over the tool docstrings that keeps every embedding in one float32 matrix.
+
+    The embeddings are normalized when they are stored, so the cosine similarity of a query against all the
+    docstrings is a single matrix-vector product and the top-k is selected with argpartition.
+    The matrix is saved as a .npy file and memory mapped when it is loaded from the cache.
+    """
+    MATRIX_FILE = "embeddings.npy"
+    NODES_FILE = "nodes.json"
+
+    def __init__(self, embed_model, nodes: list[TextNode | dict], embeddings: np.ndarray, similarity_top_k: int = 2):
+        self.embed_model = embed_model
+        self.nodes = nodes # loaded nodes stay plain dicts until they are retrieved
+        self.embeddings = embeddings
+        self.similarity_top_k = similarity_top_k
+
+    @classmethod
+    def from_documents(cls, documents: list, embed_model, similarity_top_k: int = 2) -> "MatrixRetriever":
+        """Splits the documents into nodes and embeds them in batches."""
+        return cls(embed_model, *embed_documents(documents, embed_model), similarity_top_k)
+
+    @classmethod
+    def load(cls, persist_dir: str, embed_model, similarity_top_k: int = 2, mmap: bool = True) -> "MatrixRetriever":
+        """Loads a persisted retriever, use mmap=False if it is going to be modified and persisted again."""
+        with open(os.path.join(persist_dir, cls.NODES_FILE), "r", encoding="utf-8") as f:
+            nodes = json.load(f)
+        embeddings = np.load(os.path.join(persist_dir, cls.MATRIX_FILE), mmap_mode="r" if mmap else None)
+        return cls(embed_model, nodes, embeddings, similarity_top_k)
+
+    @classmethod
+    def exists(cls, persist_dir: str) -> bool:
+        return all(os.path.exists(os.path.join(persist_dir, file)) for file in (cls.MATRIX_FILE, cls.NODES_FILE))
+
+    def persist(self, persist_dir: str):
+        """Saves the matrix and the nodes, the files are replaced only once they are completely written."""
+        os.makedirs(persist_dir, exist_ok=True)
+        matrix_path = os.path.join(persist_dir, self.MATRIX_FILE)
+        with open(matrix_path + ".tmp", "wb") as f:
+            np.save(f, np.ascontiguousarray(self.embeddings, dtype=np.float32))
+        nodes_path = os.path.join(persist_dir, self.NODES_FILE)
+        with open(nodes_path + ".tmp", "w", encoding="utf-8") as f:
+            json.dump([self._node_dict(node) for node in self.nodes], f)
+        os.replace(matrix_path + ".tmp", matrix_path)
+        os.replace(nodes_path + ".tmp", nodes_path)
+
+    def add_documents(self, documents: list):
+        """Embeds the documents and adds their nodes to the matrix."""
+        nodes, embeddings = embed_documents(documents, self.embed_model)
+        if not nodes:
+            return
+        self.nodes = self.nodes + nodes
+        self.embeddings = np.concatenate([self.embeddings, embeddings]) if len(self.embeddings) else embeddings
+
+    def remove_files(self, file_names: set[str]):
+        """Removes the nodes that were loaded from the given files."""
+        keep = [i for i in range(len(self.nodes)) if self._metadata(i).get("file_name") not in file_names]
+        if len(keep) != len(self.nodes):
+            self.nodes = [self.nodes[i] for i in keep]
+            self.embeddings = np.asarray(self.embeddings[keep])
+
+    def retrieve(self, query: str) -> list[NodeWithScore]:
+        """Embeds the query and returns the most similar nodes, best first."""
+        if not self.nodes:
+            return []
+        return self.retrieve_by_embedding(self.embed_model.get_query_embedding(query))
+
+    def retrieve_by_embedding(self, query_embedding) -> list[NodeWithScore]:
+        query = normalize(np.asarray(query_embedding, dtype=np.float32))
+        scores = self.embeddings @ query
+        indices = top_k_indices(scores, self.similarity_top_k)
+        return [NodeWithScore(node=self._node(i), score=float(scores[i])) for i in indices]
+
+    def _node(self, index: int) -> TextNode:
+        node = self.nodes[index]
+        if isinstance(node, dict):
+            node = self.nodes[index] = TextNode(id_=node["id"], text=node["text"], metadata=node["metadata"])
+        return node
+
+    def _metadata(self, index: int) -> dict:
+        node = self.nodes[index]
+        return node["metadata"] if isinstance(node, dict) else node.metadata
+
+    @staticmethod
+    def _node_dict(node: TextNode | dict) -> dict:
+        if isinstance(node, dict):
+            return node
+        return {"id": node.node_id, "text": node.text, "metadata": node.metadata}
+
+
+class ToolIndexManifest:
+    """Modification time and content hash of every file that is in the tool index, and the embedding model used.
+    Decides which files have to be embedded again when the tool index is loaded."""
+    FILE = "manifest.json"
+
+    def __init__(self, embed_model_name: str, files: dict[str, dict] | None = None):
+        self.embed_model_name = embed_model_name
+        self.files = files or {} # file name -> {"mtime": float, "hash": str}
+
+    @classmethod
+    def load(cls, persist_dir: str) -> "ToolIndexManifest | None":
+        path = os.path.join(persist_dir, cls.FILE)
+        if not os.path.exists(path):
+            return None
+        with open(path, "r", encoding="utf-8") as f:
+            data = json.load(f)
+        return cls(data["embed_model"], data["files"])
+
+    def save(self, persist_dir: str):
+        os.makedirs(persist_dir, exist_ok=True)
+        path = os.path.join(persist_dir, self.FILE)
+        with open(path + ".tmp", "w", encoding="utf-8") as f:
+            json.dump({"embed_model": self.embed_model_name, "files": self.files}, f, indent=4)
+        os.replace(path + ".tmp", path)
+
+
+def list_source_files(directory_path: str) -> dict[str, str]:
+    """Returns the python files that DocstringWalker loads from the directory, by file name."""
+    files = {}
+    for root, _, file_names in os.walk(directory_path):
+        for file_name in file_names:
+            if file_name.endswith(".py") and file_name != "__init__.py":
+                files[file_name] = os.path.join(root, file_name)
+    return files
+
+
+def load_tool_retriever(directory_path: str, persist_dir: str, embed_model,
+                        similarity_top_k: int = 2) -> tuple[MatrixRetriever, bool]:
+    """Loads the tool index from persist_dir and brings it up to date with the files in directory_path.
+
+    Only new and changed files are embedded again and the nodes of deleted files are removed. When no file was
+    modified since the last run the docstrings are not parsed at all.
+    Returns the retriever and whether the index changed.
+    """
+    files = list_source_files(directory_path)
+    mtimes = {file_name: os.path.getmtime(path) for file_name, path in files.items()}
+    manifest = ToolIndexManifest.load(persist_dir)
+    if (not manifest or manifest.embed_model_name != embed_model.model_name
+            or not MatrixRetriever.exists(persist_dir)):
+        manifest = ToolIndexManifest(embed_model.model_name) # rebuild everything
+        retriever = MatrixRetriever(embed_model, [], np.empty((0, 0), dtype=np.float32), similarity_top_k)
+    elif files.keys() == manifest.files.keys() and all(
+            manifest.files[file_name]["mtime"] == mtime for file_name, mtime in mtimes.items()):
+        return MatrixRetriever.load(persist_dir, embed_model, similarity_top_k), False
+    else:
+        # not memory mapped, the file is replaced if anything changed
+        retriever = MatrixRetriever.load(persist_dir, embed_model, similarity_top_k, mmap=False)
+
+    changed = set()
+    for file_name, path in files.items():
+        entry = manifest.files.get(file_name)
+        if entry and entry["mtime"] == mtimes[file_name]:
+            continue
+        file_hash = compute_file_hash(path)
+        if not entry or entry["hash"] != file_hash:
+            changed.add(file_name)
+        manifest.files[file_name] = {"mtime": mtimes[file_name], "hash": file_hash}
+    deleted = manifest.files.keys() - files.keys()
+    for file_name in deleted:
+        del manifest.files[file_name]
+
+    if changed or deleted:
+        retriever.remove_files(changed | deleted)
+        if changed:
+            from llama_index.readers.docstring_walker import DocstringWalker
+            documents = DocstringWalker().load_data(directory_path)
+            retriever.add_documents([doc for doc in documents if doc.metadata.get("file_name") in changed])
+        retriever.persist(persist_dir)
+    manifest.save(persist_dir)
+    return retriever, bool(changed or deleted)
+
+
+def embed_documents(documents: list, embed_model) -> tuple[list[TextNode], np.ndarray]:
+    """Splits the documents into nodes and returns the nodes with their normalized embeddings."""
+    nodes = SentenceSplitter().get_nodes_from_documents(documents)
+    texts = [node.get_content(metadata_mode=MetadataMode.EMBED) for node in nodes]
+    embeddings = embed_model.get_text_embedding_batch(texts) if texts else []
+    return nodes, normalize(np.asarray(embeddings, dtype=np.float32))
+
+
+def compute_file_hash(path: str) -> str:
+    with open(path, "rb") as f:
+        return hashlib.md5(f.read()).hexdigest()
+
+
+def normalize(vectors: np.ndarray) -> np.ndarray:
+    """Scales the vectors (rows of a matrix or a single vector) to unit length."""
+    norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+    return vectors / np.where(norms == 0, 1, norms)
+
+
+def top_k_indices(scores: np.ndarray, k: int) -> np.ndarray:
+    """Returns the indices of the k highest scores sorted from highest to lowest, without sorting all the scores."""
+    if k < len(scores):
+        candidates = np.argpartition(scores, -k)[-k:]
+    else:
+        candidates = np.arange(len(scores))
+    return candidates[np.argsort(-scores[candidates])]
@@ -1,22 +1,160 @@
-import hashlib
 import re
 
+URL_PATTERN = re.compile(r'https*://[\w\.-]+\.com[\w/\-]+|https*://[\w\.]+\.com|[\w\.]+\.com/[\w/\-]+')
+DOMAIN_PATTERN = re.compile(r'(?<=\://)[\w\.]+\.com|[\w\.]+\.com')
+MARKDOWN_CHARACTERS = str.maketrans("", "", "*_`~><")
+
+def shorten_url(match: re.Match) -> str:
+    """Replaces a matched url with its domain."""
+    return DOMAIN_PATTERN.findall(match.group())[0]
 def clean_text(text) -> str:
     """Cleans the text by removing the assistant's name and any leading/trailing whitespace."""
-    return re.sub(r'https*://[\w\.-]+\.com[\w/\-]+|https*://[\w\.]+\.com|[\w\.]+\.com/[\w/\-]+', lambda x:re.findall(r'(?<=\://)[\w\.]+\.com|[\w\.]+\.com', x.group())[0], text).replace("*", "").replace("_", "").replace("`", "").replace("~", "").replace(">", "").replace("<", "")
+    return URL_PATTERN.sub(shorten_url, text).translate(MARKDOWN_CHARACTERS)
 def extract_final_answer(response):
     # Remove all text inside <think>...</think> tags
     return re.sub(r'<think>.*?</think>', '', response, flags=re.DOTALL).strip()
-def compute_documents_hash(documents, meta_data: str) -> str:
-    """
-    Computes a combined hash for a list of documents, only works for documents loaded with docstring walker.
+
+
+class ThinkTagFilter:
+    """Removes <think>...</think> regions from text that arrives in chunks, a tag may be split between chunks.
+    Like extract_final_answer, a <think> tag that is never closed is kept as normal text."""
+    OPEN_TAG = "<think>"
+    CLOSE_TAG = "</think>"
+
+    def __init__(self):
+        self._buffer = "" # end of the text that could be the start of a tag
+        self._hidden = [] # text after an open tag, returned on flush if the tag is never closed
+        self._thinking = False
+
+    def feed(self, chunk: str) -> str:
+        """Feeds a chunk of text and returns the part of the text that is known to be outside the think tags."""
+        text = self._buffer + chunk
+        output = []
+        position = 0
+        while True:
+            tag = self.CLOSE_TAG if self._thinking else self.OPEN_TAG
+            index = text.find(tag, position)
+            if index == -1:
+                break
+            if self._thinking:
+                self._hidden = []
+            else:
+                output.append(text[position:index])
+            position = index + len(tag)
+            self._thinking = not self._thinking
+        # keep the end of the text if it could be the start of a tag
+        keep = len(text) - _partial_tag_length(text, tag)
+        keep = max(keep, position)
+        (self._hidden if self._thinking else output).append(text[position:keep])
+        self._buffer = text[keep:]
+        return "".join(output)
+
+    def flush(self) -> str:
+        """Returns the remaining text once the stream has ended."""
+        remaining = self._buffer
+        if self._thinking:
+            remaining = self.OPEN_TAG + "".join(self._hidden) + remaining
+        self._buffer = ""
+        self._hidden = []
+        self._thinking = False
+        return remaining
+
+
+def _partial_tag_length(text: str, tag: str) -> int:
+    """Returns the length of the longest suffix of text that is a prefix of tag."""
+    for length in range(min(len(tag) - 1, len(text)), 0, -1):
+        if text.endswith(tag[:length]):
+            return length
+    return 0
+
+
+class StreamingTextFilter:
+    """Chunk at a time version of clean_text(extract_final_answer(text)).
+
+    Every character goes through the think tag filter, the strip, the url shortening and the markdown removal once,
+    only the text that could still change (a partial tag, trailing whitespace or an unfinished url) is held back.
+    Feeding the whole text and flushing returns exactly what clean_text(extract_final_answer(text)) returns.
     """
-    hash_obj = hashlib.md5(meta_data.encode("utf-8"))
+    _non_url_character = re.compile(r'[^\w.\-/:]') # a url match can never contain any other character
+
+    def __init__(self):
+        self._think_filter = ThinkTagFilter()
+        self._started = False # leading whitespace is dropped until the first visible character
+        self._whitespace = "" # trailing whitespace, dropped if nothing follows it
+        self._word = [] # unfinished run of url characters
+
+    def feed(self, chunk: str) -> str:
+        """Feeds a chunk of text and returns the cleaned text that can be spoken."""
+        return self._clean(self._strip(self._think_filter.feed(chunk)))
+
+    def flush(self) -> str:
+        """Returns the remaining cleaned text once the stream has ended."""
+        text = self._clean(self._strip(self._think_filter.flush()))
+        text += self._clean("".join(self._word), final=True)
+        self._started = False
+        self._whitespace = ""
+        self._word = []
+        return text
+
+    def _strip(self, text: str) -> str:
+        if not self._started:
+            text = text.lstrip()
+            if not text:
+                return ""
+            self._started = True
+        stripped = text.rstrip()
+        if not stripped:
+            self._whitespace += text
+            return ""
+        text, self._whitespace = self._whitespace + stripped, text[len(stripped):]
+        return text
+
+    def _clean(self, text: str, final: bool = False) -> str:
+        if not final:
+            match = self._non_url_character.search(text[::-1])
+            if not match: # the whole text may still be part of a url
+                self._word.append(text)
+                return ""
+            cut = len(text) - match.start()
+            text, self._word = "".join(self._word) + text[:cut], [text[cut:]]
+        return URL_PATTERN.sub(shorten_url, text).translate(MARKDOWN_CHARACTERS)
+
+
+class SentenceChunker:
+    """Groups streamed text into whole sentences so they can be sent to the TTS engine one at a time."""
+    _boundary = re.compile(r'(?<=[.!?:;])\s+|\n+')
+
+    def __init__(self):
+        self._buffer = ""
+
+    def feed(self, text: str) -> list[str]:
+        """Feeds text and returns the sentences that are complete."""
+        self._buffer += text
+        sentences = []
+        start = 0
+        for match in self._boundary.finditer(self._buffer):
+            if match.end() == len(self._buffer):
+                break # the sentence might continue in the next chunk
+            sentence = self._buffer[start:match.start()].strip()
+            if sentence:
+                sentences.append(sentence)
+            start = match.end()
+        self._buffer = self._buffer[start:]
+        return sentences
 
-    sorted_docs: list = sorted(documents, key=lambda doc: doc.metadata.get("file_name") + doc.text) # use metadata and text incase the document is chunked
+    def flush(self) -> list[str]:
+        """Returns the last sentence once the stream has ended."""
+        sentence = self._buffer.strip()
+        self._buffer = ""
+        return [sentence] if sentence else []
 
-    for doc in sorted_docs:
-        doc_str = f"{doc.metadata["file_name"]}-{doc.text}"
-        hash_obj.update(doc_str.encode("utf-8")) # update hash
 
-    return hash_obj.hexdigest() # return hash
\ No newline at end of file
+async def stream_sentences(deltas):
+    """Turns an async iterator of llm text deltas into an async iterator of speakable sentences."""
+    text_filter = StreamingTextFilter()
+    chunker = SentenceChunker()
+    async for delta in deltas:
+        for sentence in chunker.feed(text_filter.feed(delta)):
+            yield sentence
+    for sentence in chunker.feed(text_filter.flush()) + chunker.flush():
+        yield sentence
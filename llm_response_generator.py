@@ -1,26 +1,29 @@
 import llama_index.core.workflow.errors
 import tiktoken
-from llama_index.core.callbacks import TokenCountingHandler, CallbackManager
-from llama_index.readers.docstring_walker import DocstringWalker
-from llama_index.core import VectorStoreIndex, load_index_from_storage, StorageContext
-from llama_index.core.vector_stores import SimpleVectorStore
+from llama_index.core.callbacks import CallbackManager
 
 import config
 import prompts
 from workflow.workflow import FunctionCallingAgent
+from workflow.response_event import StreamEvent
 from tool_registry import TOOL_REGISTRY
 
 from config import *
 
 # Add Phoenix API Key for tracing
 import os
-from helpers import utils
+from helpers.cache import LRUCache
+from helpers.token_counting import CachedTokenCountingHandler
+from helpers.conversation_store import ConversationStore
+from helpers.response_cache import SemanticResponseCache, context_key
+from helpers.planning_router import PlanningRouter
+from helpers.profiler import TurnRecorder
+from helpers.tool_retriever import load_tool_retriever
 os.environ["OPENAI_API_KEY"] = APIConfig.OPENAI
 
 from logger import app_logger as logging
 
 from scripts import data_manager
-from helpers import llamaindex_helper # required monkey patching
 
 #region config
 if config.EmbeddingModel == "openai":
@@ -28,7 +31,7 @@ if config.EmbeddingModel == "openai":
     embed_model = OpenAIEmbedding(api_key=APIConfig.OPENAI, model=OpenaiEmbeddingConfig.MODEL, embed_batch_size=OpenaiEmbeddingConfig.EMBED_BATCH_SIZE)
 elif config.EmbeddingModel == "huggingface":
     from llama_index.embeddings.huggingface import HuggingFaceEmbedding
-    embed_model = HuggingFaceEmbedding(HuggingFaceEmbeddingConfig.MODEL)
+    embed_model = HuggingFaceEmbedding(HuggingFaceEmbeddingConfig.MODEL, embed_batch_size=HuggingFaceEmbeddingConfig.EMBED_BATCH_SIZE)
 
 if config.LLM_provider == "openai":
     from llama_index.llms.openai import OpenAI
@@ -41,40 +44,38 @@ elif config.LLM_provider == "gemini":
 
 class LlamaIndexHandler:
     def __init__(self, directory_path: str, api_key: str, callback_manager = None):
-        walker = DocstringWalker()
-        documents = walker.load_data(directory_path)
         self.embed_model = embed_model
-        hash_file = os.path.join(CACHE_DIRECTORY, "index/doc.hash") # cache directory
-        hash_meta = f"{embed_model.model_name}" # hash metadata
-        self.hash = None
-        if os.path.exists(hash_file):
-            with open(hash_file, "r") as f:
-                self.hash = f.read()
-        if utils.compute_documents_hash(documents, hash_meta) == self.hash:
-            logging.info("Loading index from cache.")
-            storage_context = StorageContext.from_defaults(persist_dir=CACHE_DIRECTORY + "/index")
-            self.index = load_index_from_storage(storage_context=storage_context, embed_model=self.embed_model, callback_manager=callback_manager)
-        else:
-            logging.info("Rebuilding index.")
-            vector_store = SimpleVectorStore()
-            self.index = VectorStoreIndex.from_documents(documents=documents, vector_store=vector_store,
-                                                         embed_model=self.embed_model,
-                                                         callback_manager=callback_manager)
-            self.index.storage_context.persist(persist_dir=CACHE_DIRECTORY + "/index")
-            with open(hash_file, "w") as f:
-                f.write(utils.compute_documents_hash(documents, hash_meta))
-        self.retriever = self.index.as_retriever(similarity_top_k=Top_K_Retriever)
+        if callback_manager:
+            self.embed_model.callback_manager = callback_manager # count the embedding tokens
+        # tools retrieved per query, so the same message is not embedded again in the same turn (thinking mode)
+        self.retrieval_cache = LRUCache(max_size=RetrievalCacheConfig.MAX_SIZE, ttl=RetrievalCacheConfig.TTL)
+        data_manager.DataManager.retrieval_cache = self.retrieval_cache
+        self.build_index(directory_path)
+
+    def build_index(self, directory_path: str):
+        """Loads the docstring index from the cache and embeds the docstrings of the files that changed since then."""
+        persist_dir = os.path.join(CACHE_DIRECTORY, "tool_index")
+        self.retriever, changed = load_tool_retriever(directory_path, persist_dir, embed_model=self.embed_model,
+                                                      similarity_top_k=Top_K_Retriever)
+        logging.info("Updated tool index." if changed else "Loaded tool index from cache.")
+        if changed:
+            self.retrieval_cache.clear() # cached results may point to tools that changed
+
     def retrieve_nodes(self, query: str):
-        """Retrieve relevant documents using the retriever."""
-        nodes = self.retriever.retrieve(query)
-        logging.info(f"Retrieved {len(nodes)} nodes.")
-        return nodes
+        """Retrieve relevant documents using the retriever, results are cached per normalized query."""
+        key = (" ".join(query.lower().split()), self.embed_model.model_name)
+        nodes = self.retrieval_cache.get(key)
+        if nodes is None:
+            nodes = self.retriever.retrieve(query)
+            self.retrieval_cache.put(key, nodes)
+            logging.info(f"Retrieved {len(nodes)} nodes.")
+        return list(nodes)
 
 
 
 
 class LLMResponseGenerator:
-    def __init__(self, api_key=APIConfig.OPENAI, sys_prompt=prompts.gemini_prompt, n_message_history=config.MAX_MESSAGE_HISTORY, directory_path="scripts", trace = trace):
+    def __init__(self, api_key=APIConfig.OPENAI, sys_prompt=prompts.gemini_prompt, n_message_history=config.MAX_MESSAGE_HISTORY, directory_path="scripts", trace = trace, turn_recorder: TurnRecorder | None = None):
         if trace:
             logging.info("Initializing LlamaIndex Tracing...")
             os.environ["OTEL_EXPORTER_OTLP_HEADERS"] = f"api_key={APIConfig.PHOENIX}"
@@ -96,8 +97,8 @@ class LLMResponseGenerator:
             # Instrument LlamaIndex
             LlamaIndexInstrumentor().instrument(tracer_provider=tracer_provider)
 
-        if config.thinking_mode:
-            sys_prompt = ""
+        if config.thinking_mode: # the planning instructions are the static start of every prompt, then the caller's prompt
+            sys_prompt = prompts.system_planning + ("\n\n" + sys_prompt if sys_prompt else "")
         self.workflow_handler = None
 
 
@@ -106,17 +107,40 @@ class LLMResponseGenerator:
             tokenizer = tiktoken.encoding_for_model(self.llm.model).encode
         except:
             tokenizer = tiktoken.encoding_for_model("gpt-4o-mini").encode
-        self.token_counter = TokenCountingHandler( # set up token counter
+        self.token_counter = CachedTokenCountingHandler( # set up token counter, including the prompt cache hits
             tokenizer=tokenizer,
         )
         self.callback_manager = CallbackManager([self.token_counter]) # set up callback manager for token counter
         data_manager.DataManager.token_counter = self.token_counter # set the token counter for data manager to use in scripts
         data_manager.DataManager.llm = self
+        data_manager.DataManager.embed_model = embed_model # the tools embed with the same model
+        self.turn_recorder = turn_recorder or TurnRecorder(max_turns=LatencyConfig.MAX_TURNS)
+        self.turn_recorder.token_counter = self.token_counter # token usage per turn
+        data_manager.DataManager.turn_recorder = self.turn_recorder
         self.tools = TOOL_REGISTRY
+        self.conversation_store = None
+        if ConversationStoreConfig.ENABLED:
+            os.makedirs(CACHE_DIRECTORY, exist_ok=True)
+            self.conversation_store = ConversationStore(
+                os.path.join(CACHE_DIRECTORY, ConversationStoreConfig.FILE),
+                batch_size=ConversationStoreConfig.BATCH_SIZE,
+                flush_interval=ConversationStoreConfig.FLUSH_INTERVAL,
+                resume=ConversationStoreConfig.RESUME,
+            )
+        data_manager.DataManager.conversation_store = self.conversation_store
         self.index_handler = None
         if Top_K_Retriever != -1:
             self.index_handler = LlamaIndexHandler(directory_path=directory_path, api_key=api_key, callback_manager=self.callback_manager)
 
+        self.planning_router = None
+        if config.thinking_mode and PlanningRouterConfig.ENABLED:
+            self.planning_router = PlanningRouter(
+                embed_model,
+                threshold=PlanningRouterConfig.THRESHOLD,
+                k=PlanningRouterConfig.K,
+                log_path=os.path.join(CACHE_DIRECTORY, PlanningRouterConfig.LOG_FILE),
+            )
+
         self.agent_flow = FunctionCallingAgent(
             llm=self.llm,
             tools=self.tools,
@@ -124,15 +148,55 @@ class LLMResponseGenerator:
             n_message_history=n_message_history,
             index_handler=self.index_handler,
             timeout=timeout,
-            callback_manager=self.callback_manager
+            callback_manager=self.callback_manager,
+            turn_recorder=self.turn_recorder,
+            tokenizer=tokenizer,
+            conversation_store=self.conversation_store,
+            planning_router=self.planning_router
         )
-
+        self.response_cache = None
+        if ResponseCacheConfig.ENABLED:
+            self.response_cache = SemanticResponseCache(
+                embed_model,
+                threshold=ResponseCacheConfig.SIMILARITY_THRESHOLD,
+                max_size=ResponseCacheConfig.MAX_SIZE,
+                no_tool_ttl=ResponseCacheConfig.NO_TOOL_TTL,
+                default_tool_ttl=ResponseCacheConfig.DEFAULT_TOOL_TTL,
+                tool_ttls=ResponseCacheConfig.TOOL_TTLS,
+                path=os.path.join(CACHE_DIRECTORY, ResponseCacheConfig.FILE),
+                short_query_words=ResponseCacheConfig.SHORT_QUERY_WORDS,
+                save_delay=ResponseCacheConfig.SAVE_DELAY,
+            )
+        data_manager.DataManager.response_cache = self.response_cache
+
+    async def cached_response(self, input_text: str):
+        """Returns (cached answer or None, query embedding or None, conversation context or None). A cached answer is
+        added to the chat history, the embedding is reused by the planning router."""
+        if self.response_cache is None:
+            return None, None, None
+        embedding = await self.response_cache.embed(input_text)
+        context = context_key(self.agent_flow.recent_messages()) # follow-ups only match in the same conversation
+        response = self.response_cache.lookup(input_text, embedding, context)
+        if response is not None:
+            logging.info("Answered from the response cache.")
+            self.agent_flow.remember(input_text, response)
+        return response, embedding, context
+
+    def cache_response(self, input_text: str, embedding, context: str | None, result: dict):
+        if self.response_cache is not None and embedding is not None:
+            # every tool the turn called, failed and unknown ones too, a turn with a failed call is not cached
+            self.response_cache.put(input_text, embedding, result["response"], result["tool_calls"],
+                                    failed=result["tool_errors"] > 0, context=context)
 
     async def get_response(self, input_text: str) -> str | None:
         """Generates a response for the given input text using the LLM model. This passes the input into LlamaIndex workflow."""
+        response, embedding, context = await self.cached_response(input_text)
+        if response is not None:
+            return response
         try:
-            self.workflow_handler = self.agent_flow.run(input=input_text)
+            self.workflow_handler = self.agent_flow.run(input=input_text, embedding=embedding) # the router reuses the query embedding
             result = await self.workflow_handler
+            self.cache_response(input_text, embedding, context, result)
             return result["response"]
         except llama_index.core.workflow.errors.WorkflowCancelledByUser:
             return None
@@ -140,7 +204,23 @@ class LLMResponseGenerator:
         #     print(f"Error generating response: {e}")
         #     return "error" + str(e)
 
-    async def reset_messages(self):
+    async def stream_response(self, input_text: str):
+        """Generates a response for the given input text and yields the text deltas of the llm while they are generated.
+        Nothing more is yielded if the workflow gets cancelled."""
+        response, embedding, context = await self.cached_response(input_text)
+        if response is not None:
+            yield response
+            return
+        try:
+            self.workflow_handler = self.agent_flow.run(input=input_text, embedding=embedding)
+            async for event in self.workflow_handler.stream_events():
+                if isinstance(event, StreamEvent):
+                    yield event.delta
+            self.cache_response(input_text, embedding, context, await self.workflow_handler)
+        except llama_index.core.workflow.errors.WorkflowCancelledByUser:
+            return
+
+    def reset_messages(self):
         """Clears the assistant's message history. Call this method to clear the chat history, reset the assistant's memory, or initiate a new conversation."""
         self.agent_flow.reset()
 
@@ -2,6 +2,9 @@
 if __name__ == "__main__": # important to stop RealtimeSTT from reloading modules in child process.
     # logging
     from logger import app_logger as logging
+    from helpers.profiler import BootProfiler, TurnRecorder
+    boot_profiler = BootProfiler()
+    boot_profiler.begin("imports")
     logging.info("Importing libraries...")
     # Disable TensorFlow optimization for compatibility
     import os
@@ -11,6 +14,8 @@ if __name__ == "__main__": # important to stop RealtimeSTT from reloading module
     # Standard library imports
     import threading
     import asyncio
+    import queue
+    import time
     from concurrent.futures import ThreadPoolExecutor
     from functools import partial
 
@@ -21,15 +26,14 @@ if __name__ == "__main__": # important to stop RealtimeSTT from reloading module
     from RealtimeTTS import TextToAudioStream
     from RealtimeSTT import AudioToTextRecorder
 
-    # AI/ML imports
-    from llm_response_generator import LLMResponseGenerator
+    # AI/ML imports (llm_response_generator is imported while booting, it loads the embedding model)
     from prompts import *
     from config import *
     from scripts import data_manager
 
     # Helper imports
-    from helpers import llamaindex_helper
     from helpers.utils import *
+    boot_profiler.end("imports")
 
 
 
@@ -44,7 +48,7 @@ class AudioManager:
 
 
 class VoiceAssistant:
-    def __init__(self):
+    def __init__(self, boot_profiler):
         self.paused = False
         self.interrupt_audio_player = False
         self.is_active = True
@@ -53,15 +57,35 @@ class VoiceAssistant:
         self.listen_lock = threading.Lock()
         self.assistant_lock = threading.Lock()
         self.thread_pool = ThreadPoolExecutor(max_workers=3)
+        self.boot_profiler = boot_profiler # records how long each part of the startup takes
+        self.turn_recorder = TurnRecorder(max_turns=LatencyConfig.MAX_TURNS) # records how long each stage of a turn takes
+        self.recording_stopped_at = 0.0
+        self.tts_fed_at = 0.0
+        self.first_audio_at = None # when the answer of the turn started playing
 
         # Initialize components
         self.initialize_components()
         logging.info("Setting up hotkeys...")
-        self.setup_hotkeys()
+        with self.boot_profiler.phase("hotkeys"):
+            self.setup_hotkeys()
 
         self.paused = False # used to toggle pause
 
     def initialize_components(self):
+        """Initializes the TTS engine, the LLM (with the embedding model and tool index) and the STT model.
+        They don't depend on each other, so with BootConfig.PARALLEL they are initialized at the same time."""
+        phases = {"tts": self.initialize_tts, "llm": self.initialize_llm, "stt": self.initialize_stt}
+        if BootConfig.PARALLEL:
+            with ThreadPoolExecutor(max_workers=len(phases), thread_name_prefix="boot") as boot_pool:
+                futures = [boot_pool.submit(self.boot_profiler.run_phase, name, phase) for name, phase in phases.items()]
+                for future in futures:
+                    future.result()
+        else:
+            for name, phase in phases.items():
+                self.boot_profiler.run_phase(name, phase)
+        data_manager.DataManager.va = self
+
+    def initialize_tts(self):
         # Initialize text-to-speech engine based on selected Engine type
         logging.info(f"Initializing TTS Engine: {Engine}...")
         if Engine == "ElevenLabs":
@@ -99,17 +123,23 @@ class VoiceAssistant:
         # Initialize audio player
         self.audio_player = TextToAudioStream(
             engine=self.audio_engine,
+            on_audio_stream_start=self.on_play_start,
             on_audio_stream_stop=self.on_play_stop
         )
+
+    def initialize_llm(self):
         logging.info("Initializing LLM Response Generator...")
+        from llm_response_generator import LLMResponseGenerator
         # Initialize LLM
         self.llm = LLMResponseGenerator(
             api_key=APIConfig.OPENAI,
             sys_prompt=gemini_prompt,
             n_message_history=timeout,
-            trace=trace
+            trace=trace,
+            turn_recorder=self.turn_recorder
         )
-        data_manager.DataManager.va = self
+
+    def initialize_stt(self):
         logging.info("Initializing STT Engine...")
         # Initialize STT
         self.recorder = AudioToTextRecorder(
@@ -117,8 +147,8 @@ class VoiceAssistant:
             language=STTConfig.WHISPER_LANGUAGE,
             spinner=True,
             min_length_of_recording=1.1,
-            on_vad_detect_start=partial(AudioManager.play_sound, AUDIO_FILES.ACTIVATE),
-            on_recording_stop=partial(AudioManager.play_sound, AUDIO_FILES.DEACTIVATE),
+            on_vad_detect_start=self.on_vad_start,
+            on_recording_stop=self.on_recording_stop,
         )
 
     def setup_hotkeys(self):
@@ -149,7 +179,8 @@ class VoiceAssistant:
         """Pauses the assistant by stopping the audio player and recorder."""
         if self.llm.workflow_handler:
             try:
-                self.async_loop.create_task(self.llm.workflow_handler.cancel_run())
+                # called from the keyboard thread, cancelling the run also cancels the running tool calls
+                asyncio.run_coroutine_threadsafe(self.llm.workflow_handler.cancel_run(), self.async_loop)
             except Exception:
                 pass
         self.audio_player.stop()
@@ -173,8 +204,31 @@ class VoiceAssistant:
             self.audio_player.stop()
             self.interrupt_audio_player = False
 
+    def on_vad_start(self):
+        """Callback function to be executed when the user starts speaking, this starts a new turn."""
+        AudioManager.play_sound(AUDIO_FILES.ACTIVATE)
+        self.first_audio_at = None
+        self.turn_recorder.begin_turn()
+        self.turn_recorder.mark("vad_start")
+
+    def on_recording_stop(self):
+        """Callback function to be executed when the user stops speaking."""
+        AudioManager.play_sound(AUDIO_FILES.DEACTIVATE)
+        self.recording_stopped_at = time.perf_counter()
+        self.turn_recorder.mark("recording_end")
+
+    def on_play_start(self):
+        """Callback function to be executed when the audio player starts playing audio."""
+        self.first_audio_at = time.perf_counter()
+        self.turn_recorder.add_span("tts_synthesis", self.tts_fed_at, self.first_audio_at)
+        self.turn_recorder.mark("first_audio")
+
     def on_play_stop(self):
         """Callback function to be executed when the audio player finishes playing audio."""
+        # the turn ends when the answer is heard, the playback is recorded as its own stage
+        if self.first_audio_at is not None:
+            self.turn_recorder.add_span("playback", self.first_audio_at)
+        self.turn_recorder.end_turn(self.first_audio_at)
         if self.is_active:
             self.listen_to_user()
 
@@ -189,6 +243,7 @@ class VoiceAssistant:
             while not self.paused:
                 text = self.recorder.text().strip()
                 if text and not self.paused:
+                    self.turn_recorder.add_span("transcription", self.recording_stopped_at)
                     self.async_loop.create_task(self.process_response(text))
                     break
                 # if is_listening is set to false by an outside function, the function shouldn't process any requests
@@ -202,16 +257,42 @@ class VoiceAssistant:
     async def process_response(self, text):
         """Processes the user's text input and generates a response using the LLM. Then it plays the response audio by sending it to the configured TTS Engine."""
         logging.info(f'User: {text}')
+        if stream_response:
+            await self.stream_audio(text)
+            return
         response: str | None = await self.llm.get_response(text)
         if response is None:
             return
         logging.info(f"Assistant: {response}")
-        self.play_audio(clean_text(extract_final_answer(response)))
+        with self.turn_recorder.span("text_cleanup"):
+            text = clean_text(extract_final_answer(response))
+        self.play_audio(text)
+
+    async def stream_audio(self, text):
+        """Streams the response of the LLM to the configured TTS Engine one sentence at a time, so the audio starts after the first sentence is generated."""
+        sentences = queue.Queue()
+        spoken = []
+        try:
+            async for sentence in stream_sentences(self.llm.stream_response(text)):
+                sentences.put(sentence)
+                if not spoken: # start playing as soon as the first sentence is ready, the player waits for the rest
+                    self.turn_recorder.mark("first_sentence")
+                    self.tts_fed_at = time.perf_counter()
+                    self.audio_player.feed(iter(sentences.get, None))
+                    self.audio_player.play_async(muted=False, output_wavfile="assets/output1.wav")
+                spoken.append(sentence)
+        finally:
+            sentences.put(None) # end of the response, also if the stream failed so the player does not wait forever
+        if not spoken:
+            self.play_audio("")
+            return
+        logging.info(f"Assistant: {' '.join(spoken)}")
 
     def play_audio(self, text):
         """Plays the given text as audio using the configured TTS Engine."""
         if not text:
             text = " "
+        self.tts_fed_at = time.perf_counter()
         self.audio_player.feed(text)
         self.audio_player.play_async(muted=False, output_wavfile="assets/output1.wav")
 
@@ -237,9 +318,17 @@ class VoiceAssistant:
             if self.recorder.is_recording:
                 self.recorder.stop()
             self.thread_pool.shutdown(wait=True)
+            if self.llm.conversation_store:
+                self.llm.conversation_store.close()
+            if self.llm.response_cache:
+                self.llm.response_cache.close()
+            await data_manager.DataManager.aclose_http()
+            self.turn_recorder.dump(os.path.join(CACHE_DIRECTORY, LatencyConfig.DUMP_FILE))
             self.is_active = True
 
 
 if __name__ == '__main__':
-    assistant = VoiceAssistant()
+    assistant = VoiceAssistant(boot_profiler)
+    boot_time = boot_profiler.finish(os.path.join(CACHE_DIRECTORY, BootConfig.TIMELINE_FILE))
+    logging.info(f"Booted in {boot_time:.1f}s:\n{boot_profiler.summary()}")
     asyncio.run(assistant.run())
@@ -147,6 +147,15 @@ planning_prompt= """### **Available Functions:**
 
 planning_template = PromptTemplate(planning_prompt)
 
+direct_prompt = """You are a voice assistant that must **never use abbreviations**; for example, say "meters" instead of "m", "kilometers" instead of "km", and "degrees Celsius" instead of "C".
+Answer the prompt directly, use the available functions if they are needed. Keep it short and sweet.
+
+### **Prompt:**
+{query_str}
+"""
+
+direct_template = PromptTemplate(direct_prompt) # used instead of planning when the planning router skips planning
+
 execute_plan_prompt = """
 You are a voice assistant that must **never use abbreviations**; for example, say "meters" instead of "m", "kilometers" instead of "km", and "degrees Celsius" instead of "C".
 
@@ -1,49 +1,31 @@
 # you can disable/enable features in the config.py file
-# or add new features by adding import statements
-# e.g. from . import feature_file
+# or add new features by adding them to FEATURE_MODULES
+# e.g. "feature_file": FEATURES.FEATURE_FLAG
 from config import FEATURES
 from logger import app_logger as logging
+from helpers.tool_loader import ToolLoader, IMPORT_TIMES
+
+FEATURE_MODULES = {
+    "gmail": FEATURES.GMAIL,
+    "window_tools": FEATURES.WINDOW_TOOLS,
+    "browser": FEATURES.BROWSER,
+    "weather": FEATURES.WEATHER,
+    "google_search": FEATURES.GOOGLE,
+    "wikipedia": FEATURES.WIKIPEDIA,
+    "short_comm": FEATURES.SHORT_COMMS,
+    "python": FEATURES.PYTHON,
+    "system_stats": FEATURES.SYSTEM_STATS,
+    "instagram": FEATURES.INSTAGRAM,
+    "url_shortner": FEATURES.URL_SHORTENER,
+    "llm_workflow": FEATURES.LLM_WORKFLOW,
+    "pastebin": FEATURES.PASTEBIN,
+    "gpt_researcher": FEATURES.GPT_RESEARCHER,
+}
+
 logging.info("Loading features...")
-if FEATURES.GMAIL:
-    logging.info("Loading gmail module...")
-    from . import gmail
-if FEATURES.WINDOW_TOOLS:
-    logging.info("Loading window tools module...")
-    from . import window_tools
-if FEATURES.BROWSER:
-    logging.info("Loading browser module...")
-    from . import browser
-if FEATURES.WEATHER:
-    logging.info("Loading weather module...")
-    from . import weather
-if FEATURES.GOOGLE:
-    logging.info("Loading google module...")
-    from . import google_search
-if FEATURES.WIKIPEDIA:
-    logging.info("Loading wikipedia module...")
-    from . import wikipedia
-if FEATURES.SHORT_COMMS:
-    logging.info("Loading short comms module...")
-    from . import short_comm
-if FEATURES.PYTHON:
-    logging.info("Loading python module...")
-    from . import python
-if FEATURES.SYSTEM_STATS:
-    logging.info("Loading system stats module...")
-    from . import system_stats
-if FEATURES.INSTAGRAM:
-    logging.info("Loading instagram module...")
-    from . import instagram
-if FEATURES.URL_SHORTENER:
-    logging.info("Loading url shortener module...")
-    from . import url_shortner
-if FEATURES.LLM_WORKFLOW:
-    logging.info("Loading llm workflow module...")
-    from . import llm_workflow
-if FEATURES.PASTEBIN:
-    logging.info("Loading pastebin module...")
-    from . import pastebin
-if FEATURES.GPT_RESEARCHER:
-    logging.info("Loading gpt researcher module...")
-    from . import gpt_researcher
-logging.info("Features loaded successfully!")
\ No newline at end of file
+tool_loader = ToolLoader(__name__, [name for name, enabled in FEATURE_MODULES.items() if enabled])
+tool_loader.load()
+if IMPORT_TIMES:
+    logging.info("Module import times: " + ", ".join(
+        f"{module.split('.')[-1]} {seconds * 1000:.0f}ms" for module, seconds in IMPORT_TIMES.items()))
+logging.info("Features loaded successfully!")
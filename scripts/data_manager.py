@@ -2,6 +2,9 @@ import json
 import os
 from pathlib import Path
 
+from config import CACHE_DIRECTORY, ChunkStoreConfig, HttpConfig, ToolExecutionConfig
+from helpers.http_client import HttpClient
+
 from typing import TYPE_CHECKING
 
 
@@ -10,6 +13,12 @@ if TYPE_CHECKING:
     from main import VoiceAssistant
     from llama_index.core.callbacks import TokenCountingHandler
     from asyncio import AbstractEventLoop
+    from helpers.cache import LRUCache
+    from helpers.profiler import TurnRecorder
+    from helpers.conversation_store import ConversationStore
+    from helpers.response_cache import SemanticResponseCache
+    from helpers.chunk_store import ChunkEmbeddingStore
+    from llama_index.core.base.embeddings.base import BaseEmbedding
 
 class DataManager:
     # Define the file paths inside the DataManager
@@ -20,6 +29,13 @@ class DataManager:
     llm = None
     va = None
     token_counter = None
+    retrieval_cache: "LRUCache | None" = None # tool retrieval results per query, see LlamaIndexHandler.retrieve_nodes
+    turn_recorder: "TurnRecorder | None" = None # latency breakdown of the last turns, see main.VoiceAssistant
+    conversation_store: "ConversationStore | None" = None # past conversations, see LLMResponseGenerator
+    response_cache: "SemanticResponseCache | None" = None # answers of recent queries, see LLMResponseGenerator
+    embed_model: "BaseEmbedding | None" = None # embedding model of the assistant, see LLMResponseGenerator
+    _http: HttpClient | None = None
+    _chunk_store: "ChunkEmbeddingStore | None" = None
     data_cache = {}
     @classmethod
     def save_data_cache(cls, file_name: str=""):
@@ -51,6 +67,38 @@ class DataManager:
                 raise FileNotFoundError(f"File '{file_name}' not found.")
         return cls.data_cache[file_name]
 
+    @classmethod
+    @property
+    def http(cls) -> HttpClient:
+        """Shared http client of the tools, keeps the connections alive between calls."""
+        if cls._http is None:
+            cls._http = HttpClient(
+                timeout=ToolExecutionConfig.HTTP_TIMEOUT,
+                retries=HttpConfig.RETRIES,
+                backoff=HttpConfig.BACKOFF,
+                max_per_host=HttpConfig.MAX_PER_HOST,
+                pool_hosts=HttpConfig.POOL_HOSTS,
+                revalidate_size=HttpConfig.REVALIDATE_SIZE,
+            )
+        return cls._http
+
+    @classmethod
+    async def aclose_http(cls):
+        """Closes the shared http client if the tools used it."""
+        if cls._http is not None:
+            await cls._http.aclose()
+            cls._http = None
+
+    @classmethod
+    @property
+    def chunk_store(cls) -> "ChunkEmbeddingStore | None":
+        """Embeddings of the fetched page chunks, opened on first use, None if ChunkStoreConfig is disabled."""
+        if cls._chunk_store is None and ChunkStoreConfig.ENABLED:
+            from helpers.chunk_store import ChunkEmbeddingStore
+            cls._chunk_store = ChunkEmbeddingStore(os.path.join(CACHE_DIRECTORY, ChunkStoreConfig.DIRECTORY),
+                                                   max_chunks=ChunkStoreConfig.MAX_CHUNKS)
+        return cls._chunk_store
+
     @classmethod
     @property
     def user(cls):
@@ -1,5 +1,6 @@
 from .data_manager import DataManager as dm
 from tool_registry import register_tool
+from helpers.tool_context import cancel_requested
 import os
 import requests
 import json
@@ -165,13 +166,14 @@ def load_data(
     """
     from urllib.parse import urlparse
 
-    import requests
     from bs4 import BeautifulSoup
 
     documents = []
     for url in urls:
+        if cancel_requested(): # the tool call timed out or the assistant was interrupted
+            break
         try:
-            page = requests.get(url)
+            page = dm.http.get(url)
         except Exception:
             raise ValueError(f"One of the inputs is not a valid url: {url}")
 
@@ -2,21 +2,43 @@
 This can be useful for sending emails, reading emails, and managing emails.
 This can mark emails as read, important, starred, spam, and more."""
 
-from simplegmail import Gmail, label
+from simplegmail import Gmail
 from simplegmail.message import Message
 import os
+import threading
 from datetime import datetime
 from tool_registry import register_tool
+from config import GmailConfig
+from helpers.gmail_client import GmailClient, credentials_token
+from .data_manager import DataManager as dm
 # Initialize Gmail client at module level
 gmail = Gmail("C:\\Users\\shahi\\Downloads\\Windows AI Assistant\\scripts_data\\client_secret.json", "C:\\Users\\shahi\\Downloads\\Windows AI Assistant\\scripts_data\\gmail_token.json")
+
+
+token_lock = threading.Lock() # the batch workers ask for the token concurrently, it is refreshed once
+
+
+def access_token() -> str:
+    """The OAuth token of the simplegmail client, refreshed when it expired."""
+    with token_lock:
+        return credentials_token(gmail.creds)
+
+
+# listings and label changes go through the batch api, simplegmail fetches every message in full one by one
+mail = GmailClient(dm.http, access_token, GmailConfig.API_URL, batch_size=GmailConfig.BATCH_SIZE,
+                   workers=GmailConfig.WORKERS, metadata_headers=GmailConfig.METADATA_HEADERS)
+
+
+def as_ids(message_id: str | list[str]) -> list[str]:
+    return [message_id] if isinstance(message_id, str) else list(message_id)
+
 @register_tool()
 def get_unread_emails(number_of_results: int = 10) -> list[dict]:
     """
     Retrieve a list of unread email summaries from the inbox.
     The result is limited to the specified number of emails.
     """
-    gmail.maxResults = number_of_results
-    return [snip(email) for email in gmail.get_unread_inbox()]
+    return mail.summaries(mail.list_ids(label_ids=["INBOX", "UNREAD"], max_results=number_of_results))
 
 @register_tool()
 def get_all_emails(include_spam_and_trash: bool = True, number_of_results: int = 10) -> list[dict]:
@@ -24,8 +46,7 @@ def get_all_emails(include_spam_and_trash: bool = True, number_of_results: int =
     Retrieve summaries of all emails, optionally including spam and trash.
     The number of emails returned is limited by the provided parameter.
     """
-    gmail.maxResults = number_of_results
-    return [snip(email) for email in gmail.get_messages(include_spam_trash=include_spam_and_trash)]
+    return mail.summaries(mail.list_ids(max_results=number_of_results, include_spam_trash=include_spam_and_trash))
 
 @register_tool()
 def send_email(to: list[str], subject: str, body: str,
@@ -59,8 +80,7 @@ def search_emails(query: str, max_results: int = 10) -> list[dict]:
     Search for emails matching the given Gmail query syntax.
     Returns a limited number of email summaries based on max_results.
     """
-    gmail.maxResults = max_results
-    return [snip(email) for email in gmail.get_messages(query=query)]
+    return mail.summaries(mail.list_ids(query=query, max_results=max_results))
 
 @register_tool()
 def get_starred_emails(max_results: int = 10) -> list[dict]:
@@ -68,8 +88,7 @@ def get_starred_emails(max_results: int = 10) -> list[dict]:
     Retrieve summaries of starred emails from the account.
     The number of returned emails is limited by max_results.
     """
-    gmail.maxResults = max_results
-    return [snip(email) for email in gmail.get_starred_messages()]
+    return mail.summaries(mail.list_ids(label_ids=["STARRED"], max_results=max_results))
 
 @register_tool()
 def get_important_emails(max_results: int = 10) -> list[dict]:
@@ -77,8 +96,7 @@ def get_important_emails(max_results: int = 10) -> list[dict]:
     Retrieve summaries of important emails.
     Limits the number of results to the provided max_results value.
     """
-    gmail.maxResults = max_results
-    return [snip(email) for email in gmail.get_important_messages()]
+    return mail.summaries(mail.list_ids(label_ids=["IMPORTANT"], max_results=max_results))
 
 @register_tool()
 def get_sent_emails(max_results: int = 10) -> list[dict]:
@@ -86,8 +104,7 @@ def get_sent_emails(max_results: int = 10) -> list[dict]:
     Retrieve summaries of sent emails from the account.
     The number of emails returned is controlled by the max_results parameter.
     """
-    gmail.maxResults = max_results
-    return [snip(email) for email in gmail.get_sent_messages()]
+    return mail.summaries(mail.list_ids(label_ids=["SENT"], max_results=max_results))
 
 @register_tool()
 def get_draft_emails(max_results: int = 10) -> list[dict]:
@@ -95,8 +112,7 @@ def get_draft_emails(max_results: int = 10) -> list[dict]:
     Retrieve summaries of draft emails.
     Results are limited by the specified max_results parameter.
     """
-    gmail.maxResults = max_results
-    return [snip(email) for email in gmail.get_drafts()]
+    return mail.summaries(mail.draft_message_ids(max_results))
 
 @register_tool()
 def get_spam_emails(max_results: int = 10) -> list[dict]:
@@ -104,8 +120,7 @@ def get_spam_emails(max_results: int = 10) -> list[dict]:
     Retrieve summaries of spam emails from the account.
     Limits the number of returned emails using max_results.
     """
-    gmail.maxResults = max_results
-    return [snip(email) for email in gmail.get_spam_messages()]
+    return mail.summaries(mail.list_ids(label_ids=["SPAM"], max_results=max_results, include_spam_trash=True))
 
 @register_tool()
 def get_trash_emails(max_results: int = 10) -> list[dict]:
@@ -113,8 +128,7 @@ def get_trash_emails(max_results: int = 10) -> list[dict]:
     Retrieve summaries of emails in the trash folder.
     The number of emails returned is limited by the max_results parameter.
     """
-    gmail.maxResults = max_results
-    return [snip(email) for email in gmail.get_trash_messages()]
+    return mail.summaries(mail.list_ids(label_ids=["TRASH"], max_results=max_results, include_spam_trash=True))
 
 @register_tool()
 def get_labels() -> list[str]:
@@ -122,8 +136,7 @@ def get_labels() -> list[str]:
     Retrieve all label names from the Gmail account.
     Returns a list of strings representing each label.
     """
-    labels: list[str] = [label_.name for label_ in gmail.list_labels()]
-    return labels
+    return list(mail.label_names(refresh=True).values())
 
 @register_tool()
 def download_attachments(message_id: str, download_dir: str = "downloaded_email_attachements") -> list[str]:
@@ -155,76 +168,76 @@ def download_attachments(message_id: str, download_dir: str = "downloaded_email_
 #     return [snip(email) for email in gmail.get_messages(query=date_query)]
 
 @register_tool()
-def mark_as_read(message_id: str) -> None:
+def mark_as_read(message_id: str | list[str]) -> None:
     """
-    Mark the specified email as read.
+    Mark the specified email or list of emails as read.
     Removes the 'UNREAD' label from the email.
     """
-    get_message_by_id(message_id).remove_label('UNREAD')
+    mail.modify(as_ids(message_id), remove=["UNREAD"])
 
 @register_tool()
-def mark_as_important(message_id: str) -> None:
+def mark_as_important(message_id: str | list[str]) -> None:
     """
-    Mark the specified email as important.
+    Mark the specified email or list of emails as important.
     Adds the 'IMPORTANT' label to the email.
     """
-    get_message_by_id(message_id).add_label('IMPORTANT')
+    mail.modify(as_ids(message_id), add=["IMPORTANT"])
 
 @register_tool()
-def mark_as_not_important(message_id: str) -> None:
+def mark_as_not_important(message_id: str | list[str]) -> None:
     """
-    Remove the important status from the specified email.
+    Remove the important status from the specified email or list of emails.
     This is achieved by removing the 'IMPORTANT' label.
     """
-    get_message_by_id(message_id).remove_label('IMPORTANT')
+    mail.modify(as_ids(message_id), remove=["IMPORTANT"])
 
 @register_tool()
-def mark_as_unread(message_id: str) -> None:
+def mark_as_unread(message_id: str | list[str]) -> None:
     """
-    Mark the specified email as unread.
+    Mark the specified email or list of emails as unread.
     Achieved by adding the 'UNREAD' label to the email.
     """
-    get_message_by_id(message_id).add_label('UNREAD')
+    mail.modify(as_ids(message_id), add=["UNREAD"])
 
 @register_tool()
-def archive_email(message_id: str) -> None:
+def archive_email(message_id: str | list[str]) -> None:
     """
-    Archive the specified email by removing it from the inbox.
+    Archive the specified email or list of emails by removing it from the inbox.
     This is done by removing the 'INBOX' label.
     """
-    get_message_by_id(message_id).remove_label('INBOX')
+    mail.modify(as_ids(message_id), remove=["INBOX"])
 
 @register_tool()
-def move_to_trash(message_id: str) -> None:
+def move_to_trash(message_id: str | list[str]) -> None:
     """
-    Move the specified email to the trash folder.
+    Move the specified email or list of emails to the trash folder.
     Accomplished by adding the 'TRASH' label.
     """
-    get_message_by_id(message_id).add_label('TRASH')
+    mail.modify(as_ids(message_id), add=["TRASH"])
 
 @register_tool()
-def mark_as_spam(message_id: str) -> None:
+def mark_as_spam(message_id: str | list[str]) -> None:
     """
-    Mark the specified email as spam.
+    Mark the specified email or list of emails as spam.
     Adds the 'SPAM' label to indicate unsolicited content.
     """
-    get_message_by_id(message_id).add_label('SPAM')
+    mail.modify(as_ids(message_id), add=["SPAM"])
 
 @register_tool()
-def star_email(message_id: str) -> None:
+def star_email(message_id: str | list[str]) -> None:
     """
-    Star the specified email to mark it as important.
+    Star the specified email or list of emails to mark it as important.
     Achieved by adding the 'STARRED' label.
     """
-    get_message_by_id(message_id).add_label('STARRED')
+    mail.modify(as_ids(message_id), add=["STARRED"])
 
 @register_tool()
-def unstar_email(message_id: str) -> None:
+def unstar_email(message_id: str | list[str]) -> None:
     """
-    Remove the star from the specified email.
+    Remove the star from the specified email or list of emails.
     This is done by removing the 'STARRED' label.
     """
-    get_message_by_id(message_id).remove_label('STARRED')
+    mail.modify(as_ids(message_id), remove=["STARRED"])
 
 @register_tool()
 def get_email_count(label_name: str = 'INBOX') -> int:
@@ -232,9 +245,7 @@ def get_email_count(label_name: str = 'INBOX') -> int:
     Retrieve the number of emails with the specified label.
     Defaults to counting emails in the inbox.
     """
-    lab = label.Label(label_name, label_name)
-    messages = gmail.get_messages(labels=[lab])
-    return len(messages)
+    return mail.message_count(mail.label_id(label_name))
 
 @register_tool()
 def get_message_by_id(msg_id: str, user_id: str = 'me', attachments: str = 'reference'):
@@ -273,26 +284,3 @@ def message_to_json(message: Message) -> dict | str:
 
     except AttributeError as e:
         return f"Error: {e} - Ensure you are passing a valid Message object."
-    
-
-def snip(message: Message) -> dict:
-    """Summarize a Gmail Message object to a JSON-friendly format."""
-    label_names = []
-    if message.label_ids is not None:  # Check if label_ids exist
-        for label_id in message.label_ids:  # you probably meant message.label_ids
-            try:  # assuming label_id is Label class object
-                label_names.append(label_id.name)
-            except AttributeError:  # label_id is just string
-                label_names.append(label_id)
-    return {
-        'id': message.id,
-        'recipient': message.recipient,
-        'sender': message.sender,
-        'subject': message.subject,
-        'date': message.date,
-        'snippet': message.snippet,
-        'labels': label_names,
-        'attachments': [attachment.filename
-            for attachment in message.attachments
-        ]
-    }
\ No newline at end of file
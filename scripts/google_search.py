@@ -1,21 +1,38 @@
+import contextvars
+import importlib.util
 import json
+from concurrent.futures import ThreadPoolExecutor
+from typing import Iterable, Iterator
+from urllib.parse import urlparse
 
+import numpy as np
+from bs4 import BeautifulSoup
 from llama_index.tools.google import GoogleSearchToolSpec
 from pydantic import Field
 from .data_manager import DataManager as dm
 from logger import app_logger as logging
 from tool_registry import register_tool
+from config import WebFetchConfig
+from helpers.cache import LRUCache
+from helpers.html_text import stream_paragraphs
+from helpers.hybrid_ranker import hybrid_rank
+from helpers.tool_context import cancel_requested
+from helpers.tool_retriever import normalize
 from llama_index.readers.web import BeautifulSoupWebReader
 from llama_index.core.schema import TextNode
 from llama_index.core.node_parser import TextSplitter
 from llama_index.core.node_parser import SentenceSplitter
-from llama_index.core import VectorStoreIndex
 import re
 
 google_spec = GoogleSearchToolSpec(dm.google_search["api_key"], dm.google_search["search_engine_id"], 3)
+web_reader = BeautifulSoupWebReader() # only its extractors for known hosts are used
+HTML_PARSER = "lxml" if importlib.util.find_spec("lxml") else "html.parser"
+FETCH_POOL = ThreadPoolExecutor(max_workers=WebFetchConfig.WORKERS, thread_name_prefix="fetch")
+# (url, minimum characters) -> chunk texts of the page
+page_chunks = LRUCache(max_size=WebFetchConfig.PAGE_CACHE_SIZE, ttl=WebFetchConfig.PAGE_TTL)
 
 
-@register_tool()
+@register_tool(cache=3600, case_insensitive=["query"])
 def google_search(query: str) -> list[dict] | str:
     """Searches Google for a query and returns the top 3 links by default, call fetch link result function for the actual content of the links.
     This is useful to use with the get_url_markdown function to get the most relevant chunk of text from the search results, it's recommended."""
@@ -35,58 +52,115 @@ def google_search(query: str) -> list[dict] | str:
 
 
 
-def load_data(
+def _page_bytes(page) -> Iterator[bytes]:
+    """The body of a streamed response, at most WebFetchConfig.MAX_BYTES of it."""
+    size = 0
+    for chunk in page.iter_content(64 * 1024):
+        yield chunk
+        size += len(chunk)
+        if size >= WebFetchConfig.MAX_BYTES or cancel_requested():
+            return
+
+
+def page_paragraphs(
     soup_reader,
-    urls: list[str],
+    url: str,
     custom_hostname = None,
     include_url_in_text = True,
-) -> list[str]:
-    """Load data from the urls.
+) -> Iterator[str]:
+    """Yields the text of the page paragraph by paragraph while it downloads, and stops downloading once
+    WebFetchConfig.MAX_CHARACTERS of text were read. Hosts with an extractor of the soup reader are parsed whole
+    (up to WebFetchConfig.MAX_BYTES), their extractors need the full soup.
 
     Args:
-        urls (List[str]): List of URLs to scrape.
+        url (str): URL to scrape.
         custom_hostname (Optional[str]): Force a certain hostname in the case
             a website is displayed under custom URLs (e.g. Substack blogs)
         include_url_in_text (Optional[bool]): Include the reference url in the text of the document
-
-    Returns:
-        List[Document]: List of documents.
-
     """
-    from urllib.parse import urlparse
-
-    import requests
-    from bs4 import BeautifulSoup
-
-    documents = []
-    for url in urls:
-        try:
-            page = requests.get(url)
-        except Exception:
-            raise ValueError(f"One of the inputs is not a valid url: {url}")
+    try:
+        page = dm.http.get(url, stream=True)
+    except Exception:
+        raise ValueError(f"One of the inputs is not a valid url: {url}")
 
+    with page:
         hostname = custom_hostname or urlparse(url).hostname or ""
-
-        soup = BeautifulSoup(page.content, "html.parser")
-
-        extra_info = {"URL": url}
         if hostname in soup_reader._website_extractor:
-            data, metadata = soup_reader._website_extractor[hostname](
+            # a page cut at the byte cap is still parsed, both parsers close the open tags
+            soup = BeautifulSoup(b"".join(_page_bytes(page)), HTML_PARSER)
+            data, _ = soup_reader._website_extractor[hostname](
                 soup=soup, url=url, include_url_in_text=include_url_in_text
             )
-            extra_info.update(metadata)
+            yield data
+            return
+        yield from stream_paragraphs(_page_bytes(page), page.headers.get("Content-Type"),
+                                     WebFetchConfig.MAX_CHARACTERS)
 
-        else:
-            data = soup.getText()
 
-            documents.append(data)
+def load_page(soup_reader, url: str, custom_hostname = None, include_url_in_text = True) -> str:
+    """The text of the page, its paragraphs separated like the ParagraphSplitter expects."""
+    return "\n\n\n".join(page_paragraphs(soup_reader, url, custom_hostname, include_url_in_text))
 
-    return documents
+
+def _map_pages(function, urls: list[str]) -> list:
+    """Runs function(url) for every url on FETCH_POOL, returns the results of the pages that loaded in url order.
+    Raises the error of the first page if none of them loaded."""
+    futures = [FETCH_POOL.submit(contextvars.copy_context().run, function, url) for url in urls]
+    results, errors = [], []
+    for url, future in zip(urls, futures):
+        try:
+            results.append(future.result())
+        except Exception as e:
+            logging.warning(f"Could not load {url}: {e}")
+            errors.append(e)
+    if errors and not results:
+        raise errors[0]
+    return results
+
+
+def load_data(soup_reader, urls: list[str], custom_hostname = None, include_url_in_text = True) -> list[str]:
+    """Loads the text of the urls concurrently, pages that fail to load are skipped."""
+    return _map_pages(lambda url: load_page(soup_reader, url, custom_hostname, include_url_in_text), urls)
+
+
+def load_chunks(soup_reader, urls: list[str], minimum_characters: int = 20) -> list[TextNode]:
+    """Loads and chunks the pages concurrently, every worker chunks the paragraphs of its page while they download.
+    Paragraphs of up to minimum_characters are dropped. The chunks of a page read in the last WebFetchConfig.PAGE_TTL
+    seconds are reused."""
+    def chunks(url: str) -> list[TextNode]:
+        key = (url, minimum_characters)
+        texts = page_chunks.get(key)
+        if texts is None:
+            texts = [node.text for node in two_step_chunking(page_paragraphs(soup_reader, url), minimum_characters)]
+            page_chunks.put(key, texts)
+        return [TextNode(text=text) for text in texts]
+    pages = _map_pages(chunks, urls)
+    return [node for nodes in pages for node in nodes]
+
+
+def rank_chunks(nodes: list[TextNode], query: str, top_k: int = WebFetchConfig.TOP_K) -> list[str]:
+    """Returns the top_k chunks of all the pages for the query. BM25 picks WebFetchConfig.CANDIDATES chunks, only
+    those are embedded (in one batch) and reranked, chunks already in DataManager.chunk_store are not embedded again."""
+    if not nodes:
+        return []
+    embed_model = dm.embed_model
+    if embed_model is None:
+        raise RuntimeError("No embedding model, DataManager.embed_model is set by LLMResponseGenerator")
+
+    def embed_texts(texts: list[str]) -> np.ndarray:
+        if dm.chunk_store is not None:
+            return dm.chunk_store.embeddings(texts, embed_model)
+        return normalize(np.asarray(embed_model.get_text_embedding_batch(texts), dtype=np.float32))
+
+    texts = [node.text for node in nodes]
+    ranked = hybrid_rank(texts, query, embed_texts, embed_model.get_query_embedding, top_k,
+                         candidates=WebFetchConfig.CANDIDATES, lexical_weight=WebFetchConfig.LEXICAL_WEIGHT)
+    return [texts[i] for i, _ in ranked]
 
 class ParagraphSplitter(TextSplitter):
     minimum_characters: int = Field(20, ge=1)
-    def __init__(self):
-        super().__init__()
+    def __init__(self, minimum_characters: int = 20):
+        super().__init__(minimum_characters=minimum_characters)
 
     def split_text(self, text: str) -> list[str]:
         if not text:
@@ -98,26 +172,43 @@ class ParagraphSplitter(TextSplitter):
         return chunks
 
 
-# set up the two-step chunking
-first_splitter = ParagraphSplitter()
+# set up the two-step chunking, the paragraph splitter is made per call for its minimum_characters
 second_splitter = SentenceSplitter()
 
 
-# Function to apply two-step chunking
-def two_step_chunking(texts: list[str]):
-    # First chunking
-    initial_split = first_splitter.split_texts(texts)
+# characters of paragraphs split into sentence chunks at once, about four chunks at four characters per token
+CHUNK_WINDOW = 4 * 4 * second_splitter.chunk_size
+
 
-    # Second chunking
+# Function to apply two-step chunking
+def two_step_chunking(texts: Iterable[str], minimum_characters: int = 20):
+    """Splits the texts into paragraphs and the paragraphs into sentence chunks. texts can be a generator, it is
+    consumed lazily; short paragraphs are merged into the chunks of their neighbours like in one long text.
+    Paragraphs of up to minimum_characters are dropped."""
+    first_splitter = ParagraphSplitter(minimum_characters)
     final_nodes = []
-    for text in initial_split:
-        # Apply default chunking to this document
-        chunks = second_splitter.split_text(text)
+    window, size = [], 0
+
+    def split_window():
+        # Second chunking
+        chunks = second_splitter.split_text("\n\n\n".join(window))
         final_nodes.extend([TextNode(text=chunk) for chunk in chunks])
+        window.clear()
+
+    for text in texts:
+        # First chunking
+        for paragraph in first_splitter.split_text(text):
+            window.append(paragraph)
+            size += len(paragraph)
+            if size >= CHUNK_WINDOW:
+                split_window()
+                size = 0
+    if window:
+        split_window()
     return final_nodes
 
 @register_tool()
-def fetch_link_content(url: str, query: str, minimum_characters: int = 20) -> list[str] | str:
+def fetch_link_content(url: str | list[str], query: str, minimum_characters: int = 20) -> list[str] | str:
     """Try to use this only once per requestSends a get request to a list of urls or link, then formats the html response and returns the most relevant chunk based on the query.
     This can be used to scrape data from websites and to get more detailed search results by passing list of links with a query to the function.
 
@@ -126,13 +217,11 @@ def fetch_link_content(url: str, query: str, minimum_characters: int = 20) -> li
         would return the most relevant chunk of text from the w3schools python introduction page.
     """
     try:
-        logging.info(f"Getting content from: {url}\nquery: {query}")
-        first_splitter.minimum_characters = minimum_characters
-        loader = BeautifulSoupWebReader()
-        markdown_list = load_data(soup_reader=loader, urls=[url])
-        nodes = two_step_chunking(markdown_list)
-        results = VectorStoreIndex(nodes=nodes).as_retriever().retrieve(query)
-        logging.info(f"Received {[result.node.text for result in results]}")
-        return [result.node.text for result in results]
+        urls = [url] if isinstance(url, str) else list(url)
+        logging.info(f"Getting content from: {urls}\nquery: {query}")
+        nodes = load_chunks(soup_reader=web_reader, urls=urls, minimum_characters=minimum_characters)
+        results = rank_chunks(nodes, query)
+        logging.info(f"Received {results}")
+        return results
     except Exception as e:
         return "Error while fetching url: " + str(e)
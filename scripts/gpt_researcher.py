@@ -7,7 +7,7 @@ from tool_registry import register_tool
 from gpt_researcher import GPTResearcher
 
 
-@register_tool()
+@register_tool(isolated=True) # the researcher does blocking work inside its coroutines, keep it off the workflow loop
 async def conduct_research(query: Annotated[str, "The query to conduct research on"]) -> str:
     """
     This function conducts research on the given query and returns the report.
@@ -1,10 +1,12 @@
 """This module adds functions that allow the llm to manage the workflow of the llm.
 For example, this module provides functions that retrieve the amount of tokens spent, reset the token counter, and reset the chat messages."""
+import os
+from datetime import datetime
 from typing import Annotated
 
-from tool_registry import register_tool
+from tool_registry import register_tool, TOOL_CACHE
 from .data_manager import DataManager
-from config import Top_K_Retriever
+from config import Top_K_Retriever, CACHE_DIRECTORY, LatencyConfig
 @register_tool()
 def get_tokens_spent():
     """Returns the amount of tokens spent in the current session or since the last token reset.
@@ -12,11 +14,86 @@ def get_tokens_spent():
     return (
         f"Token Usage Report in this session or since the last token reset:\n"
         f"• {DataManager.token_counter.total_embedding_token_count:,} tokens used for embeddings\n"
-        f"• {DataManager.token_counter.prompt_llm_token_count:,} tokens used in prompts\n"
+        f"• {DataManager.token_counter.prompt_llm_token_count:,} tokens used in prompts, "
+        f"{DataManager.token_counter.cached_prompt_token_count:,} of them from the prompt cache\n"
         f"• {DataManager.token_counter.completion_llm_token_count:,} tokens used in completions\n"
         f"• {DataManager.token_counter.total_llm_token_count:,} total tokens used prompts and completion"
     )
 
+@register_tool()
+def get_latency_report():
+    """Returns how long each stage of a conversation turn takes (speech recognition, tool retrieval, llm, tools, speech synthesis) over the last turns, and the tokens used per turn.
+    """
+    recorder = DataManager.turn_recorder
+    if recorder is None or not recorder.turns:
+        return "No conversation turns have been recorded yet."
+    recorder.dump(os.path.join(CACHE_DIRECTORY, LatencyConfig.DUMP_FILE))
+    stages = "\n".join(
+        f"• {name}: p50 {stats['p50'] * 1000:,.0f} ms, p95 {stats['p95'] * 1000:,.0f} ms"
+        for name, stats in recorder.stage_stats().items()
+    )
+    tokens = "\n".join(
+        f"• {name}: p50 {stats['p50']:,} tokens, p95 {stats['p95']:,} tokens"
+        for name, stats in recorder.token_stats().items()
+    )
+    return f"Latency Report over the last {len(recorder.turns)} turns:\n{stages}\nTokens per turn:\n{tokens}"
+
+@register_tool()
+def get_response_cache_stats():
+    """Returns how many spoken queries were answered from the response cache instead of the llm.
+    """
+    if DataManager.response_cache is None:
+        return "The response cache is disabled."
+    stats = DataManager.response_cache.stats()
+    return (
+        f"Response Cache Report:\n"
+        f"• {stats['hits']:,} queries answered from the cache ({stats['hit_rate']:.0%} hit rate)\n"
+        f"• {stats['misses']:,} queries answered by the llm, {stats['expired']:,} cached answers had expired\n"
+        f"• {stats['skipped']:,} answers not cached because of the tools they used\n"
+        f"• {stats['size']:,} of {stats['max_size']:,} answers cached"
+    )
+
+@register_tool()
+def get_tool_execution_stats():
+    """Returns how long the tools waited before running (queue depth and wait time per tool) and how long they ran.
+    """
+    stats = DataManager.llm.agent_flow.tool_executor.stats()
+    if not stats["tools"]:
+        return "No tools have been called yet."
+    tools = "\n".join(
+        f"• {name}: {tool['calls']:,} calls, waited {tool['mean_wait'] * 1000:,.0f} ms on average "
+        f"({tool['max_wait'] * 1000:,.0f} ms max), ran {tool['mean_run'] * 1000:,.0f} ms on average, "
+        f"{tool['errors']} errors, {tool['timeouts']} timeouts, {tool['cancelled']} cancelled"
+        for name, tool in stats["tools"].items()
+    )
+    return (f"Tool Execution Report ({stats['queue_depth']} calls queued now, "
+            f"at most {stats['max_queue_depth']} at once):\n{tools}\n"
+            f"{stats['cancelled_calls']} calls stopped by a timeout or cancellation, "
+            f"{stats['abandoned_threads']} blocking tools kept running after it "
+            f"({stats['freed_threads']} of them finished since), "
+            f"{stats['killed_processes']} of {stats['processes']} sandbox processes killed.")
+
+@register_tool()
+def get_tool_cache_stats():
+    """Returns how often the cached tools (weather, wikipedia, google search) were answered from the cache and how
+    often their http requests were revalidated instead of downloaded again.
+    """
+    stats = TOOL_CACHE.stats()
+    tools = "\n".join(
+        f"• {name}: {tool['hits']:,} memory hits, {tool['disk_hits']:,} disk hits, {tool['misses']:,} misses"
+        for name, tool in stats["tools"].items()
+    ) or "• No cached tools have been called yet."
+    http = DataManager.http.stats()
+    report = (f"Tool Cache Report ({stats['memory']['size']} of {stats['memory']['max_size']} results in memory):\n"
+              f"{tools}\n{http['not_modified']:,} of {http['conditional']:,} conditional http requests were answered "
+              f"with 304 Not Modified.")
+    chunks = DataManager.chunk_store.stats() if DataManager.chunk_store is not None else None
+    if chunks:
+        report += (f"\nPage chunk embeddings: {chunks['chunks']:,} of {chunks['max_chunks']:,} stored "
+                   f"({chunks['bytes_on_disk'] / 1024 / 1024:,.1f} MB on disk), {chunks['hit_rate']:.0%} hit rate "
+                   f"({chunks['hits']:,} hits, {chunks['misses']:,} embedded).")
+    return report
+
 @register_tool()
 def reset_token_counter():
     """Resets the token counter.
@@ -31,6 +108,21 @@ def reset_chat_messages():
     DataManager.llm.reset_messages()
     return "Chat messages have been reset."
 
+@register_tool()
+def search_past_conversations(query: Annotated[str, "Words to search for in the past messages."],
+                              limit: Annotated[int, "The maximum number of messages to return."] = 10):
+    """Searches the messages of the past conversations with the user, including the conversations before a restart or a chat reset. Use it when the user refers to something that was said before.
+    """
+    if DataManager.conversation_store is None:
+        return "Conversations are not saved."
+    messages = DataManager.conversation_store.search(query, limit=limit)
+    if not messages:
+        return f"No past messages match '{query}'."
+    return "\n".join(
+        f"• [{datetime.fromtimestamp(message['created']):%Y-%m-%d %H:%M}] {message['role']}: {message['content']}"
+        for message in messages
+    )
+
 @register_tool()
 def set_max_message_history(max_message_history: Annotated[int, "The maximum number of user chat messages to store."]):
     """Sets the maximum number of user chat messages to store in the llm or voice assistant conversation.
@@ -1,31 +1,32 @@
-"""This module contains functions for working with Python code and math. like executing code in a thread."""
+"""This module contains functions for working with Python code and math. like executing code in a separate process."""
 
-import threading
+import json
 from typing import Annotated
 
 
 from tool_registry import register_tool
+from config import SandboxConfig
+from helpers.sandbox import WorkerPool
+
+SANDBOX = WorkerPool(
+    size=SandboxConfig.WORKERS,
+    modules=SandboxConfig.MODULES,
+    memory_limit_mb=SandboxConfig.MEMORY_LIMIT_MB,
+    cpu_limit=SandboxConfig.CPU_LIMIT,
+    max_output=SandboxConfig.MAX_OUTPUT,
+) # the workers are started by the first execute_code call, not when the tools are loaded
 
 
 @register_tool()
 def execute_code(code: Annotated[str, "The python code to execute."], timeout: Annotated[float, "The maximum time to allow for code execution in seconds"] = 7) -> str:
-    """Execute Python code in a thread and return the output. Can be used for math or other code execution."""
-    # not very safe, the thread could run indefinitely and consume a lot of resources.
-    def target(output):
-        try:
-            exec(code, {}, output)
-        except Exception as e:
-            output['error'] = str(e)
-
-    output = {}
-    thread = threading.Thread(target=target, args=(output,))
-    thread.start()
-    thread.join(timeout)
-
-    if thread.is_alive():
+    """Execute Python code in a separate process and return its printed output and the variables it defined as json.
+    Can be used for math or other code execution. The math, statistics and numpy (as np) modules are already imported."""
+    # the worker is killed and replaced after the timeout or when the assistant is interrupted
+    try:
+        return json.dumps(SANDBOX.run(code, timeout=timeout))
+    except TimeoutError:
         return "Error: Code execution timed out"
-
-    if 'error' in output:
-        return f"Error: {output['error']}"
-
-    return str(output)
+    except InterruptedError:
+        return "Error: Code execution was cancelled"
+    except RuntimeError as e:
+        return f"Error: {e}"
@@ -1,6 +1,5 @@
 from tool_registry import register_tool
 from .data_manager import DataManager as dm
-import requests
 
 @register_tool()
 def shorten_url(long_url: str, alias: str = "") -> str:
@@ -28,7 +27,7 @@ def shorten_url(long_url: str, alias: str = "") -> str:
         if alias:
             payload["alias"] = alias
             
-        response = requests.post(
+        response = dm.http.post(
             'https://api.tinyurl.com/create',
             headers=headers,
             json=payload
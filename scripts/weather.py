@@ -1,6 +1,6 @@
-from tool_registry import register_tool
+from config import WeatherConfig
+from tool_registry import cache_result, register_tool
 from .data_manager import DataManager as dm
-import requests
 import datetime
 
 @register_tool()
@@ -14,13 +14,13 @@ def get_user_location() -> str:
         return f"City: {city}, State: {state}, Country: {country}"
     except Exception as e:
         return "Error while getting user location: " + str(e)
-@register_tool()
+@register_tool(cache=30 * 24 * 3600, case_insensitive=["city", "country"])
 def get_place_id(city: str, country: str = "") -> str:
     """Gets the place id for a specific city in a specific country. If no country is provided, it will use the user country. if the city is not in the country, it will return most likely referred city."""
     try:
         parameters = {'key': dm.meteosource['api_key'], 'text': city}
-        url = "https://www.meteosource.com/api/v1/free/find_places"
-        data = requests.get(url, parameters).json() # this will return a list of places
+        url = f"{WeatherConfig.API_URL}/find_places"
+        data = dm.http.get(url, parameters).json() # this will return a list of places
         if not country:
             country = dm.user["location"]["country"]
         for place in data:
@@ -29,7 +29,7 @@ def get_place_id(city: str, country: str = "") -> str:
         return data[0]["place_id"]
     except Exception as e:
         return "Error while getting place ID: " + str(e)
-@register_tool()
+@register_tool(cache=600)
 def get_weather(place_id: str = "") -> str:
     """Gets the current weather for a specific place id. If no place id is provided, it will use the user's location."""
     try:
@@ -39,13 +39,34 @@ def get_weather(place_id: str = "") -> str:
                 place_id = get_place_id(dm.user['location']['city'])
                 set_user_place_id(place_id)
         parameters = {'key': dm.meteosource['api_key'], 'place_id': place_id, 'sections': 'current'}
-        url = "https://www.meteosource.com/api/v1/free/point"
-        data = requests.get(url, parameters).json()
+        url = f"{WeatherConfig.API_URL}/point"
+        data = dm.http.get(url, parameters).json()
         current = data["current"]
         return current
     except Exception as e:
         return "Error while getting weather: " + str(e)
 
+@cache_result(3600)
+def daily_forecast(place_id: str) -> list[dict]:
+    """The daily forecast of the place from the api, without the parts of the day and the precipitation. The days are
+    dates, cached as they are since labels like "Tomorrow" change at midnight."""
+    parameters = {
+        'key': dm.meteosource['api_key'],
+        'place_id': place_id,
+        'sections': 'daily'
+    }
+    response = dm.http.get(f"{WeatherConfig.API_URL}/point", params=parameters)
+    if response.status_code != 200:
+        raise Exception(f"Bad response from Meteosource API: {response.status_code}, {response.text}")
+    daily_data = response.json().get('daily', {}).get('data', [])
+    for day in daily_data:
+        day.pop('morning', None)
+        day.pop('afternoon', None)
+        day.pop('evening', None)
+        if 'all_day' in day:
+            day['all_day'].pop('precipitation', None)
+    return daily_data
+
 @register_tool()
 def get_weekly_forecast(place_id: str = "") -> list[dict]:
     """
@@ -66,32 +87,22 @@ def get_weekly_forecast(place_id: str = "") -> list[dict]:
             if not place_id:
                 place_id = get_place_id(dm.user['location']['city'])
                 set_user_place_id(place_id)
-        parameters = {
-            'key': dm.meteosource['api_key'],
-            'place_id': place_id,
-            'sections': 'daily'
-        }
-        response = requests.get('https://www.meteosource.com/api/v1/free/point', params=parameters)
-        if response.status_code == 200:
-            daily_data = response.json().get('daily', {}).get('data', [])
-            today = datetime.datetime.today().date()
-            for index, day in enumerate(daily_data):
-                forecast_date = datetime.datetime.strptime(day['day'], "%Y-%m-%d").date()
-                delta = (forecast_date - today).days
-                if delta == 0:
-                    day['day'] = "Today"
-                elif delta == 1:
-                    day['day'] = "Tomorrow"
-                else:
-                    day['day'] = f"In {delta} days"
-                day.pop('morning', None)
-                day.pop('afternoon', None)
-                day.pop('evening', None)
-                if 'all_day' in day:
-                    day['all_day'].pop('precipitation', None)
-            return daily_data
-        else:
-            raise Exception(f"Bad response from Meteosource API: {response.status_code}, {response.text}")
+        # the labels are relative to today, so they are made for every call from the cached dates
+        today = datetime.datetime.today().date()
+        forecast = []
+        for day in daily_forecast(place_id):
+            forecast_date = datetime.datetime.strptime(day['day'], "%Y-%m-%d").date()
+            delta = (forecast_date - today).days
+            if delta < 0: # fetched before midnight
+                continue
+            if delta == 0:
+                label = "Today"
+            elif delta == 1:
+                label = "Tomorrow"
+            else:
+                label = f"In {delta} days"
+            forecast.append({**day, 'day': label}) # the cached days are not changed
+        return forecast
     except Exception as e:
         return "Error while fetching weekly forecast data: " + str(e)
 
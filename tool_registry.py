@@ -1,21 +1,225 @@
 import asyncio
+import contextvars
 import inspect
 import os
+import sys
 import threading
+import time
 from asyncio import AbstractEventLoop
-from typing import Callable, Type, Any, Optional
+from concurrent.futures import ThreadPoolExecutor, Future
+from dataclasses import dataclass
+from functools import partial
+from typing import Callable, Type, Any, Iterable, Optional
 from pydantic import BaseModel
-from llama_index.core.tools import ToolMetadata, FunctionTool
+from llama_index.core.tools import ToolMetadata, FunctionTool, ToolOutput
 
-TOOL_REGISTRY = []
-tools_loop: AbstractEventLoop = None
-thread = None
+from config import ToolExecutionConfig, ToolCacheConfig, CACHE_DIRECTORY
+from helpers import sandbox
+from helpers.tool_cache import ToolResultCache
+from helpers.tool_context import ToolCall, CURRENT_TOOL_CALL
+from logger import app_logger as logging
 
-def run_async_loop():
-    global tools_loop
-    tools_loop = asyncio.new_event_loop()
-    asyncio.set_event_loop(tools_loop)
-    tools_loop.run_forever()
+@dataclass
+class CachedToolMetadata(ToolMetadata):
+    """ToolMetadata that builds the json schema sent to the llm only once instead of on every llm call."""
+    @classmethod
+    def from_metadata(cls, metadata: ToolMetadata) -> "CachedToolMetadata":
+        return cls(
+            description=metadata.description,
+            name=metadata.name,
+            fn_schema=metadata.fn_schema,
+            return_direct=metadata.return_direct,
+        )
+
+    @classmethod
+    def from_description(cls, description: dict) -> "CachedToolMetadata":
+        """Builds the metadata from a description made by ToolRegistry.describe, without the function."""
+        metadata = cls(description=description["description"], name=description["name"],
+                       return_direct=description["return_direct"])
+        metadata._parameters = description["parameters"]
+        return metadata
+
+    def get_parameters_dict(self) -> dict:
+        if "_parameters" not in self.__dict__:
+            self._parameters = super().get_parameters_dict()
+        return self._parameters
+
+    def to_openai_tool(self, skip_length_check: bool = False) -> dict[str, Any]:
+        if "_openai_tools" not in self.__dict__:
+            self._openai_tools = {}
+        if skip_length_check not in self._openai_tools:
+            self._openai_tools[skip_length_check] = super().to_openai_tool(skip_length_check=skip_length_check)
+        return self._openai_tools[skip_length_check]
+
+
+class ToolRegistry:
+    """All the registered tools, indexed by name and by the file that registered them.
+
+    The indexes are updated when a tool is registered, so looking tools up while answering does not scan or copy
+    the registry. Tools registered with file_name="static" are always passed to the llm.
+    """
+    STATIC = "static"
+
+    def __init__(self):
+        self.tools: list[FunctionTool] = [] # in registration order
+        self.by_name: dict[str, FunctionTool] = {}
+        self.by_file: dict[str, list[FunctionTool]] = {}
+        self.async_tools: set[str] = set() # names of the tools that can be awaited without blocking a thread
+        self.lazy_tools: set[str] = set() # names of the tools whose module is not imported yet
+        self._file_of: dict[str, str] = {} # tool name -> file name
+        self._module_of: dict[str, str] = {} # tool name -> module that registered it
+        self._file_selections: dict[frozenset[str], list[FunctionTool]] = {}
+        self._lock = threading.Lock() # modules can be imported from several threads
+
+    def add(self, file_name: str, tool: FunctionTool, is_async: bool = False, module: str | None = None):
+        """Adds a tool, a lazy tool with the same name is replaced in place."""
+        name = tool.metadata.get_name()
+        with self._lock:
+            previous = self.by_name.get(name)
+            if previous is not None and name in self.lazy_tools:
+                self.tools[self.tools.index(previous)] = tool
+                file_tools = self.by_file[self._file_of[name]]
+                file_tools[file_tools.index(previous)] = tool
+                self.lazy_tools.discard(name)
+            else:
+                self.tools.append(tool)
+                self.by_file.setdefault(file_name, []).append(tool)
+            self.by_name[name] = tool
+            self._file_of[name] = file_name
+            self._module_of[name] = module
+            if is_async:
+                self.async_tools.add(name)
+            self._file_selections.clear()
+
+    def add_lazy(self, module: str, description: dict, load_module: Callable[[str], Any]):
+        """Adds a placeholder for a tool of a module that is not imported yet, described by describe().
+        The placeholder calls load_module(module) on its first call and then calls the real tool."""
+        name = description["name"]
+
+        def loaded() -> FunctionTool:
+            real_tool = self.by_name.get(name)
+            if real_tool is None or name in self.lazy_tools: # calling the placeholder again would recurse
+                raise RuntimeError(f"Importing {module} did not register the tool {name}, "
+                                   f"the tool manifest is outdated")
+            return real_tool
+
+        def fn(*args, **kwargs):
+            load_module(module)
+            return loaded().fn(*args, **kwargs)
+
+        async def async_fn(*args, **kwargs):
+            if name in self.lazy_tools:
+                await asyncio.to_thread(load_module, module)
+            return await loaded().async_fn(*args, **kwargs)
+
+        tool = FunctionTool.from_defaults(
+            fn=fn,
+            async_fn=async_fn,
+            tool_metadata=CachedToolMetadata.from_description(description)
+        )
+        self.lazy_tools.add(name)
+        self.add(description["file_name"], tool, is_async=description["is_async"], module=module)
+
+    def describe(self, module: str) -> list[dict]:
+        """Describes the tools registered by a module, so they can be added lazily without importing it."""
+        return [
+            {
+                "name": name,
+                "description": tool.metadata.description,
+                "parameters": tool.metadata.get_parameters_dict(),
+                "return_direct": tool.metadata.return_direct,
+                "file_name": self._file_of[name],
+                "is_async": name in self.async_tools,
+            }
+            for name, tool in self.by_name.items() if self._module_of[name] == module
+        ]
+
+    def get(self, name: str) -> FunctionTool | None:
+        return self.by_name.get(name)
+
+    @property
+    def static(self) -> list[FunctionTool]:
+        return self.by_file.get(self.STATIC, [])
+
+    def from_files(self, files: Iterable[str]) -> list[FunctionTool]:
+        """Returns the tools of the given files and the static tools, in registration order.
+        The list is cached per set of files and must not be modified."""
+        files = frozenset(files)
+        selection = self._file_selections.get(files)
+        if selection is None:
+            selected = files | {self.STATIC}
+            selection = [tool for tool in self.tools if self._file_of[tool.metadata.get_name()] in selected]
+            self._file_selections[files] = selection
+        return selection
+
+    def __iter__(self):
+        return iter(self.tools)
+
+    def __len__(self):
+        return len(self.tools)
+
+
+TOOL_REGISTRY = ToolRegistry()
+
+
+class LoopPool:
+    """Event loops running on their own threads, for async tools that must not run on the workflow loop.
+
+    Async tools registered with isolated=True run here (they block their loop or keep loop bound state), and async
+    tools called from synchronous code run here as well. A coroutine goes to the loop with the fewest running
+    coroutines, so one long tool doesn't hold up the others. The loops are started on first use.
+    """
+    def __init__(self, size: int = ToolExecutionConfig.ISOLATED_LOOPS):
+        self.size = size
+        self.loops: list[AbstractEventLoop] = []
+        self.running: list[int] = [] # coroutines running on every loop
+        self._lock = threading.Lock()
+
+    def _start(self):
+        for i in range(self.size):
+            loop = asyncio.new_event_loop()
+            threading.Thread(target=loop.run_forever, name=f"tool_loop_{i}", daemon=True).start()
+            self.loops.append(loop)
+            self.running.append(0)
+
+    def submit(self, coroutine) -> Future:
+        with self._lock:
+            if not self.loops:
+                self._start()
+            index = min(range(self.size), key=self.running.__getitem__)
+            self.running[index] += 1
+        future = asyncio.run_coroutine_threadsafe(coroutine, self.loops[index])
+        future.add_done_callback(lambda _: self._done(index))
+        return future
+
+    def _done(self, index: int):
+        with self._lock:
+            self.running[index] -= 1
+
+    def run(self, coroutine) -> Any:
+        """Runs the coroutine on the pool and blocks until it is done, for synchronous callers."""
+        return self.submit(coroutine).result()
+
+    async def arun(self, coroutine) -> Any:
+        """Runs the coroutine on the pool without blocking the calling loop."""
+        return await asyncio.wrap_future(self.submit(coroutine))
+
+
+TOOL_LOOP_POOL = LoopPool()
+TOOL_CACHE = ToolResultCache(
+    os.path.join(CACHE_DIRECTORY, ToolCacheConfig.FILE) if ToolCacheConfig.PERSIST else None,
+    max_size=ToolCacheConfig.MAX_SIZE,
+)
+
+
+def cache_result(ttl: float, name: Optional[str] = None, case_insensitive: Iterable[str] = ()):
+    """A decorator caching the results of a helper of the tools in TOOL_CACHE for ttl seconds, like
+    register_tool(cache=ttl) does for tools. Useful when only part of a tool's result can be reused."""
+    def decorator(func: Callable[..., Any]) -> Callable[..., Any]:
+        if not ToolCacheConfig.ENABLED:
+            return func
+        return TOOL_CACHE.wrap(func, name or func.__name__, ttl, case_insensitive)
+    return decorator
 
 
 def register_tool(
@@ -25,14 +229,20 @@ def register_tool(
         return_direct: bool = False,
         fn_schema: Optional[Type[BaseModel]] = None,
         tool_metadata: Optional[ToolMetadata] = None,
-        file_name: Optional[str] = None
+        file_name: Optional[str] = None,
+        isolated: bool = False,
+        cache: Optional[float] = None,
+        case_insensitive: Iterable[str] = ()
 ):
     """
     A decorator to register a function as a tool with optional metadata.
+    Async tools are awaited on the workflow loop, unless isolated is set, then they run on TOOL_LOOP_POOL.
+    Read only tools can set cache to a ttl in seconds, their results are kept in TOOL_CACHE by normalized arguments
+    and the decorated function is the cached one, so calls from other tools are cached too. Arguments named in
+    case_insensitive (search queries, city names) share a result whatever their case, the others must match exactly.
     """
     if not file_name:
-        frame = inspect.stack()[1]
-        file_name = os.path.basename(frame.filename)
+        file_name = os.path.basename(sys._getframe(1).f_code.co_filename) # inspect.stack() is slow at import time
 
     def decorator(func: Callable[..., Any]) -> Callable[..., Any]:
         func = function or func
@@ -42,29 +252,179 @@ def register_tool(
             if first_param == 'cls' or first_param == 'self':
                 return func
 
+        original = func
+        if cache and ToolCacheConfig.ENABLED:
+            func = TOOL_CACHE.wrap(func, name or func.__name__, cache, case_insensitive)
         is_async = inspect.iscoroutinefunction(func)
         if is_async:
-            global thread
-            if not thread:
-                thread = threading.Thread(target=run_async_loop)
-                thread.start()
-
-            nonlocal tool_metadata
-            tool_metadata = tool_metadata or FunctionTool.from_defaults(func, name, description, return_direct, fn_schema).metadata
-            def async_wrapper(*args, **kwargs):
-                return asyncio.run_coroutine_threadsafe(func(*args, **kwargs), tools_loop).result()
-        TOOL_REGISTRY.append({
-            file_name: FunctionTool.from_defaults(
-                fn=func if not is_async else async_wrapper, #if not is_async else None,
-                #async_fn=func if is_async else None,
-                name=name,
-                description=description,
-                return_direct=return_direct,
-                fn_schema=fn_schema,
-                tool_metadata=tool_metadata
-            )
-        })
+            def sync_wrapper(*args, **kwargs): # the tool is called from synchronous code
+                return TOOL_LOOP_POOL.run(func(*args, **kwargs))
+            async def isolated_wrapper(*args, **kwargs):
+                return await TOOL_LOOP_POOL.arun(func(*args, **kwargs))
+        # build the metadata from the original function so async tools keep their signature and docstring
+        metadata = tool_metadata or FunctionTool.from_defaults(
+            fn=original, name=name, description=description, return_direct=return_direct, fn_schema=fn_schema
+        ).metadata
+        tool = FunctionTool.from_defaults(
+            fn=func if not is_async else sync_wrapper,
+            async_fn=(isolated_wrapper if isolated else func) if is_async else None,
+            tool_metadata=CachedToolMetadata.from_metadata(metadata)
+        )
+        TOOL_REGISTRY.add(file_name, tool, is_async=is_async, module=original.__module__)
 
         return func
 
     return decorator
+
+
+class ToolExecutor:
+    """Runs the tool calls of one llm response concurrently.
+
+    Async tools are awaited on the calling loop (or on TOOL_LOOP_POOL if they are isolated), blocking tools run on a
+    bounded thread pool. At most max_concurrency tools run at the same time and every call has a deadline, its
+    timeout from ToolExecutionConfig. When a call times out or the workflow is cancelled (cancel_run cancels the
+    step awaiting the tools), async tools are cancelled and blocking tools are asked to stop through their ToolCall,
+    see helpers.tool_context. Blocking tools that keep running are counted as abandoned threads until they return.
+    The executor also counts the calls waiting for a slot or a thread (queue depth) and keeps the wait and run
+    times per tool, see stats.
+    """
+    def __init__(self, max_concurrency: int = ToolExecutionConfig.MAX_CONCURRENCY,
+                 max_workers: int = ToolExecutionConfig.MAX_WORKERS, turn_recorder=None):
+        self.semaphore = asyncio.Semaphore(max_concurrency)
+        self.thread_pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="tool")
+        self.turn_recorder = turn_recorder # records a "tool:<name>" span per call
+        self.queue_depth = 0 # calls waiting for a concurrency slot or a thread
+        self.max_queue_depth = 0
+        self.cancelled_calls = 0 # calls stopped by a timeout or a cancellation
+        self.abandoned_threads = 0 # threads still running a stopped call
+        self.freed_threads = 0 # abandoned threads that returned since
+        self.tool_stats: dict[str, dict] = {}
+
+    @staticmethod
+    def get_timeout(tool_name: str) -> float:
+        return ToolExecutionConfig.TIMEOUTS.get(tool_name, ToolExecutionConfig.DEFAULT_TIMEOUT)
+
+    def _enqueue(self):
+        self.queue_depth += 1
+        self.max_queue_depth = max(self.max_queue_depth, self.queue_depth)
+
+    async def call(self, tool: FunctionTool, kwargs: dict) -> ToolOutput:
+        """Calls a single tool, raises TimeoutError if it takes longer than its timeout."""
+        tool_name = tool.metadata.get_name()
+        timeout = self.get_timeout(tool_name)
+        stats = self.tool_stats.setdefault(tool_name, {"calls": 0, "errors": 0, "timeouts": 0, "cancelled": 0,
+                                                        "wait": 0.0, "max_wait": 0.0, "run": 0.0})
+        requested = time.perf_counter()
+        started = None # when the tool starts running, set from the thread for blocking tools
+        queued = True
+        thread_running = False
+        abandoned = False
+        tool_call = None
+        token = None
+        loop = asyncio.get_running_loop()
+
+        def dequeue(): # dequeue and thread_finished only run on the loop
+            nonlocal queued
+            if queued:
+                queued = False
+                self.queue_depth -= 1
+
+        def thread_finished():
+            nonlocal thread_running, abandoned
+            thread_running = False
+            if abandoned:
+                abandoned = False
+                self.abandoned_threads -= 1
+                self.freed_threads += 1
+
+        def notify(callback):
+            try:
+                loop.call_soon_threadsafe(callback)
+            except RuntimeError: # the loop is closed
+                pass
+
+        def run_blocking():
+            nonlocal started, thread_running
+            started = time.perf_counter()
+            thread_running = True
+            notify(dequeue) # the call left the thread pool queue
+            try:
+                return tool(**kwargs)
+            finally:
+                notify(thread_finished)
+
+        self._enqueue()
+        finished = False
+        try:
+            async with self.semaphore:
+                tool_call = ToolCall(tool_name, timeout)
+                token = CURRENT_TOOL_CALL.set(tool_call) # copied to the task or the thread of the tool
+                if tool_name in TOOL_REGISTRY.async_tools:
+                    dequeue()
+                    started = time.perf_counter()
+                    call = tool.acall(**kwargs)
+                else:
+                    call = loop.run_in_executor(self.thread_pool, contextvars.copy_context().run, run_blocking)
+                try:
+                    result = await asyncio.wait_for(call, timeout)
+                    finished = True
+                    return result
+                except asyncio.TimeoutError:
+                    stats["timeouts"] += 1
+                    raise TimeoutError(f"Tool {tool_name} timed out after {timeout} seconds")
+                except asyncio.CancelledError:
+                    stats["cancelled"] += 1
+                    raise
+                except Exception:
+                    finished = True # the tool raised, nothing is left running
+                    stats["errors"] += 1
+                    raise
+        finally:
+            dequeue() # the call timed out or was cancelled before it ran
+            if token is not None:
+                CURRENT_TOOL_CALL.reset(token)
+            if not finished and tool_call is not None:
+                tool_call.cancelled.set() # ask a blocking tool to stop
+                self.cancelled_calls += 1
+                if thread_running:
+                    abandoned = True
+                    self.abandoned_threads += 1
+            end = time.perf_counter()
+            wait = (started or end) - requested
+            stats["calls"] += 1
+            stats["wait"] += wait
+            stats["max_wait"] = max(stats["max_wait"], wait)
+            stats["run"] += end - (started or end)
+            if wait > 1:
+                logging.info(f"Tool {tool_name} waited {wait:.1f}s for a free slot ({self.queue_depth} calls queued).")
+            if self.turn_recorder and started:
+                self.turn_recorder.add_span(f"tool:{tool_name}", started, end)
+
+    async def call_all(self, calls: list[tuple[FunctionTool, dict]]) -> list[ToolOutput | Exception]:
+        """Calls all the tools concurrently, the results (or raised exceptions) keep the order of calls."""
+        return await asyncio.gather(*(self.call(tool, kwargs) for tool, kwargs in calls), return_exceptions=True)
+
+    def stats(self) -> dict:
+        """Queue depth, the resources freed by stopping calls and the mean/max wait and mean run time in seconds of
+        every tool."""
+        return {
+            "queue_depth": self.queue_depth,
+            "max_queue_depth": self.max_queue_depth,
+            "cancelled_calls": self.cancelled_calls,
+            "abandoned_threads": self.abandoned_threads,
+            "freed_threads": self.freed_threads,
+            "processes": sandbox.STATS["processes"],
+            "killed_processes": sandbox.STATS["killed"],
+            "tools": {
+                name: {
+                    "calls": stats["calls"],
+                    "errors": stats["errors"],
+                    "timeouts": stats["timeouts"],
+                    "cancelled": stats["cancelled"],
+                    "mean_wait": stats["wait"] / stats["calls"] if stats["calls"] else 0.0,
+                    "max_wait": stats["max_wait"],
+                    "mean_run": stats["run"] / stats["calls"] if stats["calls"] else 0.0,
+                }
+                for name, stats in self.tool_stats.items()
+            },
+        }
@@ -0,0 +1,37 @@
+from llama_index.core.base.llms.types import ChatMessage, MessageRole
+from llama_index.core.tools import FunctionTool
+
+
+class PromptAssembler:
+    """Assembles the llm inputs so consecutive calls share the longest possible prefix.
+
+    Providers cache the prompt by prefix (tool schemas, then the messages), so everything static comes first and
+    never changes byte for byte: the system prompt is one message at the start of the history and the tools are
+    always sorted by name. Dynamic content (the retrieved tools, the query, the plan) is only appended after the
+    history. The sorted tools and their descriptions are cached per tool set.
+    """
+    def __init__(self, system_prompt: str = ""):
+        self.system_message = ChatMessage(role=MessageRole.SYSTEM, content=system_prompt) if system_prompt else None
+        self._tools_key: tuple[int, ...] = ()
+        self._tools: list[FunctionTool] = []
+        self._context_str = ""
+
+    def initial_history(self) -> list[ChatMessage]:
+        return [self.system_message] if self.system_message else []
+
+    def _update(self, tools: list[FunctionTool]):
+        key = tuple(sorted(map(id, tools)))
+        if key != self._tools_key:
+            self._tools_key = key
+            self._tools = sorted(tools, key=lambda tool: tool.metadata.get_name())
+            self._context_str = "\n\n".join(tool.metadata.description for tool in self._tools)
+
+    def tools(self, tools: list[FunctionTool]) -> list[FunctionTool]:
+        """The tools in a stable order, the same set always gives the same schemas."""
+        self._update(tools)
+        return self._tools
+
+    def tool_context(self, tools: list[FunctionTool]) -> str:
+        """The descriptions of the tools in the same stable order, used by the planning prompt."""
+        self._update(tools)
+        return self._context_str
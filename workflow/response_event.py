@@ -23,3 +23,7 @@ class FunctionOutputEvent(Event):
 class ToolResultEvent(Event):
     input: list[ChatMessage]
     query: str | None = None # query used to retrieve different tools
+
+
+class StreamEvent(Event):
+    delta: str # text generated by the llm since the previous stream event
@@ -1,19 +1,26 @@
 from typing import Any
 from llama_index.core.base.llms.types import ChatMessage, MessageRole
 from llama_index.core.llms.function_calling import FunctionCallingLLM
-from llama_index.core.memory import ChatMemoryBuffer
 from llama_index.core.tools import FunctionTool
-from llama_index.core.workflow import Workflow, StartEvent, StopEvent, step
+from llama_index.core.workflow import Workflow, StartEvent, StopEvent, Context, step
 from llama_index.llms.openai import OpenAI
 
 
 
-from tool_registry import TOOL_REGISTRY
-from .response_event import InputEvent, ToolCallEvent, ThinkingEvent
+from tool_registry import TOOL_REGISTRY, ToolExecutor, ToolRegistry
+from helpers.chat_memory import RollingChatMemory
+from helpers.planning_router import PLAN
+from helpers.profiler import TurnRecorder
+from .response_event import InputEvent, ToolCallEvent, ThinkingEvent, StreamEvent
+from .prompt_assembly import PromptAssembler
 from logger import app_logger as logging
-from config import Top_K_Retriever, thinking_mode
+from config import Top_K_Retriever, thinking_mode, stream_response, MEMORY_TOKEN_LIMIT, PromptCacheConfig
 
-from prompts import planning_template, execute_plan_prompt, system_planning
+from prompts import planning_template, execute_plan_prompt, direct_template
+
+# the history is trimmed by user messages: a planned turn adds two (the planning prompt and execute_plan_prompt),
+# a direct turn one, so n turns are at most n * USER_MESSAGES_PER_TURN user messages
+USER_MESSAGES_PER_TURN = 2 if thinking_mode else 1
 
 class FunctionCallingAgent(Workflow):
     def __init__(
@@ -25,86 +32,158 @@ class FunctionCallingAgent(Workflow):
         index_handler = None,
         tools,
         callback_manager = None,
+        turn_recorder: TurnRecorder | None = None,
+        tokenizer = None,
+        conversation_store = None,
+        planning_router = None,
         **kwargs: Any,
     ) -> None:
         super().__init__(*args, **kwargs)
         self.llm = llm or OpenAI()
         assert self.llm.metadata.is_function_calling_model
 
-        self.sys_message = ChatMessage(role=MessageRole.SYSTEM, content=system_prompt)
+        self.prompt_assembler = PromptAssembler(system_prompt) # keeps the start of every llm input identical
         if callback_manager:
             self.llm.callback_manager = callback_manager # set the callback manager for llm
-        self.memory = ChatMemoryBuffer.from_defaults(llm=llm, chat_history=[self.sys_message] if self.sys_message.content else None)
+        self.n_message_history = n_message_history * USER_MESSAGES_PER_TURN
+        chat_history = self.prompt_assembler.initial_history()
+        if conversation_store:
+            # resume the last conversation, the store keeps one user message per turn (the text of the user)
+            chat_history += conversation_store.load_tail(n_message_history)
+        token_limit = MEMORY_TOKEN_LIMIT or int(self.llm.metadata.context_window * 0.75)
+        self.memory = RollingChatMemory(chat_history=chat_history, token_limit=token_limit if tokenizer else None,
+                                        tokenizer=tokenizer, store=conversation_store)
         self.sources = []
-        self.n_message_history = n_message_history * (thinking_mode * 2 + 1)
+        self.tool_calls: list[str] = [] # names of all the tools the llm called in the turn, including failed calls
+        self.tool_errors = 0 # tool calls of the turn that failed or named an unknown tool
 
 
         self.index_handler = index_handler # used to retrieve relevant nodes
         self.current_tools: list[FunctionTool] = [] # the list of tools passed to the LLM
-        self.tools: list[dict] = tools # the list of all available tools, those are filtered (query retrieval)
+        self.tools: ToolRegistry = tools # all available tools, those are filtered (query retrieval)
+        self.turn_recorder = turn_recorder or TurnRecorder() # latency of the retrieval, llm and tool stages
+        self.tool_executor = ToolExecutor(turn_recorder=self.turn_recorder) # runs the tool calls of a response concurrently
+        self.planning_router = planning_router # decides if thinking mode plans the turn, None always plans
     def reset(self):
-        self.memory = ChatMemoryBuffer.from_defaults(llm=self.llm, chat_history=[self.sys_message] if self.sys_message.content else None)
+        self.memory.reset(chat_history=self.prompt_assembler.initial_history())
         self.sources = []
+        self.tool_calls = []
+        self.tool_errors = 0
         self.current_tools = []
+    def trim_history(self):
+        """Drops the oldest turns, only once the history is HISTORY_SLACK turns over the limit so the cached
+        prompt prefix stays the same for several turns."""
+        self.memory.trim(n=self.n_message_history, slack=PromptCacheConfig.HISTORY_SLACK * USER_MESSAGES_PER_TURN)
+
+    def remember(self, user_input: str, response: str):
+        """Adds a turn that was answered without running the workflow (response cache) to the chat history."""
+        self.trim_history()
+        self.memory.put(ChatMessage(role="user", content=user_input))
+        self.memory.put(ChatMessage(role="assistant", content=response))
+
+    def recent_messages(self, n: int = 4) -> list[tuple[str, str]]:
+        """(role, content) of the last n user and assistant messages with text, what a follow-up can refer to."""
+        messages = [(message.role.value, message.content) for message in self.memory.get()
+                    if message.role in (MessageRole.USER, MessageRole.ASSISTANT) and message.content]
+        return messages[-n:]
+
     @step
     async def prepare_chat_history(self, ev: StartEvent) -> InputEvent | StopEvent | ThinkingEvent:
         """Prepare chat history for the LLM."""
         # clear sources
         self.sources = []
-        last_x_messages = self.memory.get_last_messages(n=self.n_message_history)
-        self.memory = ChatMemoryBuffer.from_defaults(llm=self.llm, chat_history=last_x_messages)
+        self.tool_calls = []
+        self.tool_errors = 0
+        self.trim_history()
         # get user input
         user_input = ev.input
-        if thinking_mode:
-            plan_message = ChatMessage(role="user", content=system_planning)
-            self.memory.put(plan_message)
+        if thinking_mode and await self.should_plan(user_input, ev.get("embedding")):
+            # the planning instructions are the system prompt, see LLMResponseGenerator
             return ThinkingEvent(input=self.memory.get(), message=user_input)
-        user_msg = ChatMessage(role="user", content=user_input)
-        self.memory.put(user_msg)
+        if thinking_mode: # simple request, answer it without the planning call
+            user_msg = ChatMessage(role="user", content=direct_template.format(query_str=user_input))
+        else:
+            user_msg = ChatMessage(role="user", content=user_input)
+        self.memory.put(user_msg, saved_content=user_input) # the template is not saved
         # get chat history
         chat_history = self.memory.get()
         return InputEvent(input=chat_history, message=user_input)
     
+    async def should_plan(self, user_input: str, embedding=None) -> bool:
+        """embedding is the query embedding if the caller already computed it (response cache)."""
+        if self.planning_router is None:
+            return True
+        with self.turn_recorder.span("planning_router"):
+            return await self.planning_router.route(user_input, embedding) == PLAN
+
     @step
     async def handle_thinking(self, ev: ThinkingEvent) -> InputEvent:
         """Handle the thinking event."""
         query = ev.message
         if Top_K_Retriever == -1:
-            self.current_tools = [list(d.values())[0] for d in TOOL_REGISTRY]
+            self.current_tools = TOOL_REGISTRY.tools
         elif query:
             # retrieve relevant nodes
-            nodes = self.index_handler.retrieve_nodes(query)
-            self.current_tools = FunctionCallingAgent.get_tools_from_nodes(nodes=nodes) or []
+            with self.turn_recorder.span("tool_retrieval"):
+                nodes = self.index_handler.retrieve_nodes(query)
+                self.current_tools = FunctionCallingAgent.get_tools_from_nodes(nodes=nodes) or []
         chat_history = ev.input
-        # I want to set context_str to self.current_tools[x].metadata.description where all tools are joined by double \n
-        message = planning_template.format(context_str="\n\n".join([tool.metadata.description for tool in self.current_tools]), query_str=query)
-        self.memory.put(ChatMessage(role="user", content=message))
+        message = planning_template.format(context_str=self.prompt_assembler.tool_context(self.current_tools), query_str=query)
+        self.memory.put(ChatMessage(role="user", content=message), saved_content=query) # without the tool descriptions
         chat_history.append(self.memory.get()[-1])
-        response = await self.llm.achat(
-            messages=chat_history
-        )
+        with self.turn_recorder.span("llm_planning"):
+            response = await self.llm.achat(
+                messages=chat_history
+            )
         logging.info("Thinking response: " + str(response.message) + "\n\n\n")
-        self.memory.put(response.message)
-        self.memory.put(ChatMessage(role="user", content=execute_plan_prompt))
+        # the plan and the instruction to execute it are only needed in this turn, they are not saved
+        self.memory.put(response.message, save=False)
+        self.memory.put(ChatMessage(role="user", content=execute_plan_prompt), save=False)
         return InputEvent(input=self.memory.get())
 
     @step
     async def handle_llm_input(
-        self, ev: InputEvent
+        self, ctx: Context, ev: InputEvent
     ) -> ToolCallEvent | StopEvent:
         """Handle input to the LLM and retreive the most relevant tools using RAG."""
         message = ev.message
         if Top_K_Retriever == -1:
-            self.current_tools = [list(d.values())[0] for d in TOOL_REGISTRY]
+            self.current_tools = TOOL_REGISTRY.tools
         elif message:
             # retrieve relevant nodes
-            nodes = self.index_handler.retrieve_nodes(message)
-            self.current_tools = FunctionCallingAgent.get_tools_from_nodes(nodes=nodes) or []
+            with self.turn_recorder.span("tool_retrieval"):
+                nodes = self.index_handler.retrieve_nodes(message)
+                self.current_tools = FunctionCallingAgent.get_tools_from_nodes(nodes=nodes) or []
             ### make the current tools be the tools where key is "static" from self.tools list of key value pairs
         chat_history = ev.input
-        response = await self.llm.achat_with_tools(
-            tools=self.current_tools, chat_history=chat_history, allow_parallel_tool_calls=True, verbose=True
-        )
+        held_deltas = [] # text of a response that may still call tools
+        with self.turn_recorder.span("llm_call"):
+            if stream_response:
+                # forward the text deltas as they arrive so the caller can start speaking before the answer is complete.
+                # When tools can be called the text is held back until the response ended without tool calls, the
+                # text of a response calling tools ("let me check the weather") is not spoken.
+                tools = self.prompt_assembler.tools(self.current_tools)
+                response = None
+                response_stream = await self.llm.astream_chat_with_tools(
+                    tools=tools, chat_history=chat_history, allow_parallel_tool_calls=True, verbose=True
+                )
+                async for response in response_stream:
+                    if response.delta:
+                        self.turn_recorder.mark("first_token")
+                        if tools:
+                            held_deltas.append(response.delta)
+                        else:
+                            ctx.write_event_to_stream(StreamEvent(delta=response.delta))
+                if response is None: # the stream ended without a chunk, answer with an empty message
+                    logging.warning("The llm returned an empty stream.")
+                    return StopEvent(
+                        result={"response": "", "sources": [*self.sources], "tool_calls": [*self.tool_calls],
+                                "tool_errors": self.tool_errors, "code": "empty_response"}
+                    )
+            else:
+                response = await self.llm.achat_with_tools(
+                    tools=self.prompt_assembler.tools(self.current_tools), chat_history=chat_history, allow_parallel_tool_calls=True, verbose=True
+                )
         self.memory.put(response.message)
 
         tool_calls = self.llm.get_tool_calls_from_response(
@@ -112,8 +191,11 @@ class FunctionCallingAgent(Workflow):
         )
 
         if not tool_calls:
+            if held_deltas:
+                ctx.write_event_to_stream(StreamEvent(delta="".join(held_deltas)))
             return StopEvent(
-                result={"response": response.message.content, "sources": [*self.sources], "code": "no_tool_calls"}
+                result={"response": response.message.content, "sources": [*self.sources], "tool_calls": [*self.tool_calls],
+                        "tool_errors": self.tool_errors, "code": "no_tool_calls"}
             )
         else:
             return ToolCallEvent(tool_calls=tool_calls)
@@ -122,45 +204,42 @@ class FunctionCallingAgent(Workflow):
     async def handle_tool_calls(self, ev: ToolCallEvent) -> InputEvent:
         """Handle tool calls and get the output."""
         tool_calls = ev.tool_calls # get the tools that llm called
-        tools_by_name = {list(tool_dict.values())[0].metadata.get_name(): list(tool_dict.values())[0] for tool_dict in
-                         self.tools} # get all available tools
+        tools_by_name = self.tools.by_name # get all available tools
         tool_msgs = []
-        # call tools -- safely!
+        calls = [] # (tool, kwargs) of the tools that exist, called concurrently
         for tool_call in tool_calls:
             tool = tools_by_name.get(tool_call.tool_name)
+            if tool:
+                logging.info(f"Calling tool: {tool.metadata.get_name()} with kwargs: {tool_call.tool_kwargs}")
+                calls.append((tool, tool_call.tool_kwargs))
+        results = iter(await self.tool_executor.call_all(calls))
+
+        # create the tool messages in the same order as the tool calls
+        for tool_call in tool_calls:
             additional_kwargs = {
                 "tool_call_id": tool_call.tool_id,
-                "name": tool.metadata.get_name(),
+                "name": tool_call.tool_name,
             }
-            if not tool:
-                tool_msgs.append(
-                    ChatMessage(
-                        role="tool",
-                        content=f"Tool {tool_call.tool_name} does not exist",
-                        additional_kwargs=additional_kwargs,
-                    )
-                )
-                continue
-
-            try:
-                logging.info(f"Calling tool: {tool.metadata.get_name()} with kwargs: {tool_call.tool_kwargs}")
-                tool_output = tool(**tool_call.tool_kwargs)
-                self.sources.append(tool_output)
-                tool_msgs.append(
-                    ChatMessage(
-                        role="tool",
-                        content=tool_output.content,
-                        additional_kwargs=additional_kwargs,
-                    )
-                )
-            except Exception as e:
-                tool_msgs.append(
-                    ChatMessage(
-                        role="tool",
-                        content=f"Encountered error in tool call: {e}",
-                        additional_kwargs=additional_kwargs,
-                    )
+            self.tool_calls.append(tool_call.tool_name)
+            if tool_call.tool_name not in tools_by_name:
+                content = f"Tool {tool_call.tool_name} does not exist"
+                self.tool_errors += 1
+            else:
+                tool_output = next(results)
+                if isinstance(tool_output, BaseException):
+                    content = f"Encountered error in tool call: {tool_output}"
+                    self.tool_errors += 1
+                else:
+                    self.sources.append(tool_output)
+                    content = tool_output.content
+                    self.tool_errors += tool_output.is_error
+            tool_msgs.append(
+                ChatMessage(
+                    role="tool",
+                    content=content,
+                    additional_kwargs=additional_kwargs,
                 )
+            )
 
         for msg in tool_msgs:
             self.memory.put(msg)
@@ -173,8 +252,7 @@ class FunctionCallingAgent(Workflow):
         """Extract the tools from the most relevant nodes."""
         nodes.sort(key=lambda node: node.score, reverse=True) # reverse to make sure important nodes are prioritized
         files = {node.metadata.get("file_name") for node in nodes if node.metadata and "file_name" in node.metadata}
-        files.add("static") # add the "static" tools
-        return [item[file_name] for item in TOOL_REGISTRY for file_name in item if file_name in files]
+        return TOOL_REGISTRY.from_files(files)
 
 
 